@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Async Probe Engine
+基于 asyncio 标准库的 HTTP/1.1 探测引擎，供 LLM Connection Test Tool 的负载测试使用
+
+单个进程内用协程驱动大量并发连接: 每个连接只占用一个套接字和一个读缓冲区，响应体边读边丢弃，
+只统计字节数。支持 keep-alive 连接复用、Content-Length / chunked / 读到连接关闭三种响应体、
+HTTPS，以及流式响应的首字延迟 (首个响应体字节) 测量。
+"""
+
+import ssl
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+from typing import Optional, Dict, Callable, Iterable, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 每次从套接字读取的最大字节数
+READ_CHUNK = 64 * 1024
+
+# 响应头的最大长度
+HEADER_LIMIT = 64 * 1024
+
+# 按虚拟用户编号（开放负载为请求序号）返回 (请求体, 请求头)
+Identity = Callable[[int], Tuple[bytes, Dict[str, str]]]
+
+
+def raise_open_file_limit(wanted: int) -> int:
+    """将打开文件数软限制提高到 wanted（不超过硬限制），返回调整后的软限制"""
+    if resource is None:
+        return wanted
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+@dataclass
+class ProbeOutcome:
+    """单个请求的结果"""
+    status: Optional[int]         # HTTP状态码，请求失败时为 None
+    error: Optional[str]          # 失败原因: timeout / 异常说明
+    ttfb: float                   # 发出请求到收到响应头（秒）
+    ttft: Optional[float]         # 发出请求到收到第一个响应体字节（秒）
+    total: float                  # 整个请求耗时（秒）
+    size: int                     # 响应体字节数
+
+    @property
+    def key(self) -> str:
+        """状态码或错误类型，与同步负载测试的统计键一致"""
+        return str(self.status) if self.status is not None else (self.error or "error")
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+
+class AsyncConnectionPool:
+    """单个源站的连接池: 空闲连接复用，连接总数受 max_connections 限制"""
+
+    def __init__(self, url: str, max_connections: int = 1000, keep_alive: bool = True, verify: bool = True):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"不支持的协议: {parts.scheme}")
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl_context = None
+        if parts.scheme == "https":
+            self.ssl_context = ssl.create_default_context()
+            if not verify:
+                self.ssl_context.check_hostname = False
+                self.ssl_context.verify_mode = ssl.CERT_NONE
+        self.keep_alive = keep_alive
+        self.slots = asyncio.Semaphore(max_connections)
+        self.idle: deque = deque()
+        self.opened = 0
+
+    async def acquire(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, bool, float]:
+        """取得一个连接，返回 (reader, writer, 是否复用, 等待连接名额的秒数)"""
+        queued_at = time.perf_counter()
+        await self.slots.acquire()
+        queued = time.perf_counter() - queued_at
+        try:
+            while self.idle:
+                reader, writer = self.idle.pop()
+                if writer.is_closing() or reader.at_eof():
+                    writer.close()
+                    continue
+                return reader, writer, True, queued
+            reader, writer = await asyncio.open_connection(
+                self.host, self.port, ssl=self.ssl_context, limit=HEADER_LIMIT,
+                server_hostname=self.host if self.ssl_context else None
+            )
+            self.opened += 1
+            return reader, writer, False, queued
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, reusable: bool):
+        """归还连接: 可复用时放回空闲队列，否则关闭"""
+        if reusable and self.keep_alive and not writer.is_closing():
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+        self.slots.release()
+
+    def close(self):
+        while self.idle:
+            _, writer = self.idle.pop()
+            writer.close()
+
+
+class AsyncProbeEngine:
+    """针对单个端点的异步请求引擎
+
+    run_closed_loop 和 run_open_loop 为同步入口，在新的事件循环中运行并通过回调逐个交回结果；
+    回调在事件循环线程中调用，无需加锁。
+    """
+
+    def __init__(self, url: str, max_connections: int = 1000, keep_alive: bool = True,
+                 timeout: float = 30.0, stream: bool = False, verify: bool = True, limiter=None):
+        parts = urlsplit(url)
+        self.url = url
+        self.target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        default_port = 443 if parts.scheme == "https" else 80
+        self.host_header = parts.hostname if (parts.port or default_port) == default_port else parts.netloc
+        self.max_connections = max_connections
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.stream = stream
+        self.verify = verify
+        # 客户端限流 (RateLimiter)，按 chat 类别预约令牌；在途上限体现为连接池大小
+        self.limiter = limiter
+        self.pool: Optional[AsyncConnectionPool] = None
+        # 每个连接占用一个文件描述符，另外预留一些给日志、标准输入输出等
+        raise_open_file_limit(max_connections + 64)
+
+    def _encode_request(self, method: str, body: bytes, headers: Dict[str, str]) -> bytes:
+        lines = [f"{method} {self.target} HTTP/1.1", f"Host: {self.host_header}"]
+        lowered = {key.lower() for key in headers}
+        for key, value in headers.items():
+            lines.append(f"{key}: {value}")
+        if "accept" not in lowered:
+            lines.append("Accept: text/event-stream, application/json" if self.stream else "Accept: */*")
+        if "user-agent" not in lowered:
+            lines.append("User-Agent: llm-connection-test/async")
+        lines.append(f"Content-Length: {len(body)}")
+        lines.append(f"Connection: {'keep-alive' if self.keep_alive else 'close'}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+    async def _read_response(self, reader: asyncio.StreamReader, method: str,
+                             started: float) -> Tuple[int, float, Optional[float], int, bool]:
+        """读取一个响应，返回 (状态码, ttfb, ttft, 响应体字节数, 连接是否可复用)"""
+        head = await reader.readuntil(b"\r\n\r\n")
+        ttfb = time.perf_counter() - started
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        status = int(status_line.split(" ", 2)[1])
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        reusable = headers.get("connection", "").lower() != "close"
+
+        size = 0
+        ttft = None
+
+        async def drain(length: Optional[int]):
+            """读取并丢弃 length 字节（None 表示读到连接关闭）"""
+            nonlocal size, ttft
+            remaining = length
+            while remaining is None or remaining > 0:
+                data = await reader.read(READ_CHUNK if remaining is None else min(remaining, READ_CHUNK))
+                if not data:
+                    if remaining is None:
+                        return
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                size += len(data)
+                if remaining is not None:
+                    remaining -= len(data)
+
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            return status, ttfb, ttft, size, reusable
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                size_line = await reader.readuntil(b"\r\n")
+                chunk_size = int(size_line.split(b";")[0].strip(), 16)
+                if chunk_size == 0:
+                    # 跳过 trailer，直到空行
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                await drain(chunk_size)
+                await reader.readexactly(2)
+        elif "content-length" in headers:
+            await drain(int(headers["content-length"]))
+        else:
+            await drain(None)
+            reusable = False
+        return status, ttfb, ttft, size, reusable
+
+    async def request(self, body: bytes, headers: Dict[str, str], method: str = "POST") -> ProbeOutcome:
+        """发送一个请求。复用的空闲连接已被服务器关闭时，自动换新连接重试一次
+
+        等待限流令牌和连接名额的时间不计入返回的各项耗时，计入 limiter 的限流统计。
+        """
+        raw = self._encode_request(method, body, headers)
+        if self.limiter is not None:
+            delay = self.limiter.reserve("chat")
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            delay = 0.0
+        started = time.perf_counter()
+        for attempt in range(2):
+            reader = writer = None
+            reused = False
+            try:
+                reader, writer, reused, queued = await asyncio.wait_for(self.pool.acquire(), self.timeout)
+                if attempt == 0:
+                    started += queued
+                    delay += queued
+                    if self.limiter is not None:
+                        self.limiter.record("chat", delay)
+                writer.write(raw)
+                await writer.drain()
+                remaining = self.timeout - (time.perf_counter() - started)
+                status, ttfb, ttft, size, reusable = await asyncio.wait_for(
+                    self._read_response(reader, method, started), max(remaining, 0.001))
+                self.pool.release(reader, writer, reusable)
+                return ProbeOutcome(status, None, ttfb, ttft, time.perf_counter() - started, size)
+            except asyncio.TimeoutError:
+                error = "timeout"
+            except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError,
+                    ValueError, IndexError) as e:
+                error = f"{type(e).__name__}: {e}"
+            if writer is not None:
+                self.pool.release(reader, writer, False)
+            if not (reused and error != "timeout" and attempt == 0):
+                break
+        return ProbeOutcome(None, error, 0.0, None, time.perf_counter() - started, 0)
+
+    async def _closed_loop(self, body: bytes, headers: Dict[str, str], concurrency: int,
+                           duration: Optional[float], total_requests: Optional[int],
+                           on_result: Callable[[ProbeOutcome], None], identity: Optional[Identity]):
+        deadline = time.perf_counter() + duration if duration is not None else None
+        issued = 0
+
+        def claim() -> bool:
+            nonlocal issued
+            if total_requests is not None and issued >= total_requests:
+                return False
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            issued += 1
+            return True
+
+        async def virtual_user(index: int):
+            while claim():
+                on_result(await self.request(*(identity(index) if identity else (body, headers))))
+
+        await asyncio.gather(*(virtual_user(index) for index in range(concurrency)))
+
+    async def _open_loop(self, body: bytes, headers: Dict[str, str], offsets: Iterable[float],
+                         max_in_flight: int, on_result: Callable[[ProbeOutcome, float], None],
+                         on_drop: Callable[[], None], identity: Optional[Identity]):
+        run_start = time.perf_counter()
+        tasks = set()
+
+        async def fire(scheduled_at: float, index: int):
+            on_result(await self.request(*(identity(index) if identity else (body, headers))), scheduled_at)
+
+        for index, offset in enumerate(offsets):
+            delay = run_start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(tasks) >= max_in_flight:
+                on_drop()
+                continue
+            task = asyncio.create_task(fire(run_start + offset, index))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _run(self, coro):
+        self.pool = AsyncConnectionPool(self.url, self.max_connections, self.keep_alive, self.verify)
+        try:
+            await coro
+        finally:
+            self.pool.close()
+            self.pool = None
+
+    def run_closed_loop(self, body: bytes, headers: Dict[str, str], concurrency: int,
+                        duration: Optional[float], total_requests: Optional[int],
+                        on_result: Callable[[ProbeOutcome], None], identity: Optional[Identity] = None):
+        """闭环负载: concurrency 个协程各自循环发送，直到达到持续时间或请求总数
+
+        提供 identity 时每个请求由 identity(虚拟用户编号) 给出 (请求体, 请求头)，用于多账号负载。
+        """
+        asyncio.run(self._run(self._closed_loop(body, headers, concurrency, duration,
+                                                total_requests, on_result, identity)))
+
+    def run_open_loop(self, body: bytes, headers: Dict[str, str], offsets: Iterable[float],
+                      max_in_flight: int, on_result: Callable[[ProbeOutcome, float], None],
+                      on_drop: Callable[[], None], identity: Optional[Identity] = None):
+        """开放负载: 按 offsets（相对开始的秒数）发出请求，在途请求达到上限时丢弃
+
+        on_result 的第二个参数为计划发送时刻 (perf_counter)，用于从计划到达时间计算延迟；
+        identity 同 run_closed_loop，参数为请求序号。
+        """
+        asyncio.run(self._run(self._open_loop(body, headers, offsets, max_in_flight, on_result, on_drop,
+                                              identity)))
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Mock Strapi/LLM Server
+用于离线测试和基准测试 LLM Connection Test Tool 的模拟后端
+
+实现 /api、/api/auth/local、/api/users/me 和 /api/student-portraits/chat，支持 Direct 和 Wrapped
+两种请求格式、可配置的延迟分布、错误注入 (401/404/500/超时) 以及 SSE 流式响应。
+其他 /api/* GET 请求返回空的 Strapi 集合，便于配合接口探测目录使用。
+"""
+
+import hmac
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Callable, Tuple, Any
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 模拟回答的文本片段
+RESPONSE_TEXT = "根据你的学习画像分析，你在课程成绩、竞赛获奖和实践活动方面表现均衡，建议继续保持并加强专业方向的深入学习。"
+
+# 支持的错误注入类型
+ERROR_KINDS = ("401", "404", "500", "timeout")
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """解析延迟分布描述，返回采样函数（单位: 秒）
+    
+    支持: constant:S, uniform:MIN,MAX, normal:MEAN,STD, lognormal:MU,SIGMA, exp:MEAN
+    """
+    kind, _, params = spec.partition(':')
+    try:
+        values = [float(v) for v in params.split(',')] if params else []
+    except ValueError:
+        raise ValueError(f"无效的延迟分布参数: {spec}")
+    
+    if kind == "constant" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal" and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    if kind == "exp" and len(values) == 1:
+        return lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"无效的延迟分布: {spec}")
+
+
+def parse_error_rates(spec: str) -> Dict[str, float]:
+    """解析错误注入描述，例如 "500=0.05,timeout=0.01" """
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        kind, _, rate = item.partition('=')
+        if kind not in ERROR_KINDS:
+            raise ValueError(f"未知的错误类型: {kind} (可选: {', '.join(ERROR_KINDS)})")
+        rates[kind] = float(rate)
+    if sum(rates.values()) > 1:
+        raise ValueError("错误注入概率之和不能超过1")
+    return rates
+
+
+@dataclass
+class MockServerConfig:
+    """模拟后端配置"""
+    latency: str = "constant:0.05"           # 聊天接口首字节延迟分布
+    chunk_delay: str = "constant:0.02"       # 流式响应分块间隔分布
+    api_latency: str = "constant:0"          # 其他接口延迟分布
+    error_rates: Dict[str, float] = field(default_factory=dict)
+    accept: str = "both"                     # 接受的请求格式: direct / wrapped / both
+    stream: str = "auto"                     # auto: 按 Accept 头决定; always; never
+    stream_chunks: int = 20
+    response_chars: int = 400
+    timeout_delay: float = 35.0              # 注入超时时的挂起时间（秒）
+    token: Optional[str] = None              # 设置后要求 Bearer token 匹配
+    username: str = "student123"
+    seed: Optional[int] = None
+    cache: bool = False                      # 模拟回答缓存: 相同问题和学生ID的重复请求立即返回
+    password: Optional[str] = None           # /api/auth/local 要求的密码，None 表示任意密码
+    jwt_ttl: float = 3600.0                  # 登录签发的 JWT 有效期（秒）
+
+
+class MockBackend:
+    """模拟后端状态: 采样函数、随机数发生器和请求计数"""
+    
+    def __init__(self, config: MockServerConfig):
+        self.config = config
+        self.sample_latency = parse_latency(config.latency)
+        self.sample_chunk_delay = parse_latency(config.chunk_delay)
+        self.sample_api_latency = parse_latency(config.api_latency)
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.cache: Dict[Tuple[str, Any], str] = {}
+        # 登录签发的令牌: token -> (用户, 过期时间)
+        self.sessions: Dict[str, Tuple[Dict, float]] = {}
+        self.users: Dict[str, Dict] = {}
+    
+    def draw(self, sampler: Callable[[random.Random], float]) -> float:
+        with self.lock:
+            return sampler(self.rng)
+    
+    def draw_error(self) -> Optional[str]:
+        """按配置的概率抽取要注入的错误类型"""
+        with self.lock:
+            roll = self.rng.random()
+        for kind in ERROR_KINDS:
+            rate = self.config.error_rates.get(kind, 0.0)
+            if roll < rate:
+                return kind
+            roll -= rate
+        return None
+    
+    def count(self, key: str):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+    
+    def issue_token(self, identifier: str) -> Tuple[str, Dict]:
+        """为账号签发 HS256 JWT（载荷含 id/iat/exp），返回 (令牌, 用户)"""
+        with self.lock:
+            user = self.users.setdefault(identifier, {
+                "id": len(self.users) + 1,
+                "username": identifier.split('@')[0],
+                "email": identifier if '@' in identifier else f"{identifier}@example.com"
+            })
+        now = time.time()
+        
+        def encode(data: Dict) -> str:
+            return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).rstrip(b'=').decode('ascii')
+        
+        claims = {'id': user['id'], 'iat': int(now), 'exp': int(now + self.config.jwt_ttl)}
+        signing_input = f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode(claims)}"
+        signature = hmac.new(b"mock-secret", signing_input.encode('ascii'), hashlib.sha256).digest()
+        token = f"{signing_input}.{base64.urlsafe_b64encode(signature).rstrip(b'=').decode('ascii')}"
+        with self.lock:
+            self.sessions[token] = (user, now + self.config.jwt_ttl)
+        return token, user
+    
+    def session(self, token: str) -> Optional[Tuple[Dict, bool]]:
+        """查找签发过的令牌，返回 (用户, 是否有效)；未签发过返回 None"""
+        with self.lock:
+            entry = self.sessions.get(token)
+        if entry is None:
+            return None
+        return entry[0], entry[1] > time.time()
+    
+    def answer(self, question: str) -> str:
+        """生成指定长度的模拟回答"""
+        text = f"关于「{question[:50]}」: "
+        while len(text) < self.config.response_chars:
+            text += RESPONSE_TEXT
+        return text[:self.config.response_chars]
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """模拟 Strapi 路由"""
+    protocol_version = "HTTP/1.1"
+    backend: MockBackend = None
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send(self, status: int, body: Dict, extra_headers: Optional[Dict[str, str]] = None):
+        """一次性写出响应头和响应体，避免分段写入触发延迟确认"""
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        lines = [f"HTTP/1.1 {status} {self.responses.get(status, ('',))[0]}",
+                 "Content-Type: application/json; charset=utf-8",
+                 f"Content-Length: {len(payload)}"]
+        for key, value in (extra_headers or {}).items():
+            lines.append(f"{key}: {value}")
+        self.wfile.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + payload)
+        self.wfile.flush()
+    
+    def _error(self, status: int, message: str):
+        self._send(status, {"data": None, "error": {"status": status, "name": "MockError", "message": message}})
+    
+    def _authorized(self) -> bool:
+        """签发过的令牌需未过期；其他令牌按 config.token 校验（未设置时不要求认证）"""
+        authorization = self.headers.get('Authorization', '')
+        session = self.backend.session(authorization[len('Bearer '):]) if authorization.startswith('Bearer ') else None
+        if session is not None:
+            return session[1]
+        token = self.backend.config.token
+        return token is None or authorization == f'Bearer {token}'
+    
+    def _read_json(self) -> Any:
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if not raw:
+            return {}
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+    
+    def do_OPTIONS(self):
+        self.backend.count("OPTIONS")
+        if self.path.split('?')[0].startswith('/api/student-portraits/chat'):
+            self._send(200, {}, {"Allow": "POST, OPTIONS"})
+        else:
+            self._send(200, {})
+    
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        self.backend.count(f"GET {path}")
+        time.sleep(self.backend.draw(self.backend.sample_api_latency))
+        
+        if path in ('', '/api'):
+            self._send(200, {"status": "ok", "server": "mock-strapi"})
+        elif path == '/api/users/me':
+            authorization = self.headers.get('Authorization', '')
+            session = self.backend.session(authorization[len('Bearer '):])
+            if not self._authorized() or not authorization:
+                self._error(401, "Missing or invalid credentials")
+            elif session is not None:
+                self._send(200, session[0])
+            else:
+                self._send(200, {"id": 1, "username": self.backend.config.username, "email": "student@example.com"})
+        elif path.startswith('/ocr/'):
+            self._send(200, {"data": []})
+        elif path.startswith('/api/'):
+            self._send(200, {"data": [], "meta": {"pagination": {"page": 1, "pageSize": 25, "pageCount": 0, "total": 0}}})
+        else:
+            self._error(404, "Not Found")
+    
+    def do_POST(self):
+        path = self.path.split('?')[0].rstrip('/')
+        self.backend.count(f"POST {path}")
+        if path == '/api/auth/local':
+            self._login()
+            return
+        if path != '/api/student-portraits/chat':
+            self._error(404, "Not Found")
+            return
+        
+        body = self._read_json()
+        if body is None:
+            self._error(400, "Invalid JSON body")
+            return
+        if not isinstance(body, dict):
+            self._error(400, "Request body must be a JSON object")
+            return
+        
+        if not self._authorized():
+            self._error(401, "Missing or invalid credentials")
+            return
+        
+        accept = self.backend.config.accept
+        if isinstance(body.get('data'), dict) and accept in ('wrapped', 'both'):
+            request = body['data']
+        elif 'data' not in body and accept in ('direct', 'both'):
+            request = body
+        else:
+            self._error(400, f"Request body must use the {accept} format")
+            return
+        if not request.get('question'):
+            self._error(400, "question is required")
+            return
+        
+        error = self.backend.draw_error()
+        if error == "timeout":
+            time.sleep(self.backend.config.timeout_delay)
+            self._error(504, "Gateway Timeout")
+            return
+        if error is not None:
+            self._error(int(error), f"Injected {error} error")
+            return
+        
+        cache_key = (str(request['question']), request.get('student_id'))
+        with self.backend.lock:
+            answer = self.backend.cache.get(cache_key) if self.backend.config.cache else None
+        cache_headers = {"X-Cache": "HIT" if answer is not None else "MISS"} if self.backend.config.cache else None
+        if answer is None:
+            time.sleep(self.backend.draw(self.backend.sample_latency))
+            answer = self.backend.answer(str(request['question']))
+            if self.backend.config.cache:
+                with self.backend.lock:
+                    self.backend.cache[cache_key] = answer
+        
+        stream_mode = self.backend.config.stream
+        wants_stream = 'text/event-stream' in self.headers.get('Accept', '')
+        if stream_mode == 'always' or (stream_mode == 'auto' and wants_stream):
+            self._stream(answer)
+        else:
+            self._send(200, {
+                "response": answer,
+                "student_id": request.get('student_id'),
+                "timestamp": datetime.now().isoformat()
+            }, cache_headers)
+    
+    def _login(self):
+        """Strapi 本地登录: {identifier, password} -> {jwt, user}"""
+        body = self._read_json()
+        time.sleep(self.backend.draw(self.backend.sample_api_latency))
+        if not isinstance(body, dict) or not body.get('identifier') or not body.get('password'):
+            self._error(400, "identifier and password are required")
+            return
+        password = self.backend.config.password
+        if password is not None and body['password'] != password:
+            self._error(400, "Invalid identifier or password")
+            return
+        token, user = self.backend.issue_token(str(body['identifier']))
+        self._send(200, {"jwt": token, "user": user})
+    
+    def _stream(self, answer: str):
+        """以 SSE 分块发送回答"""
+        self.wfile.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/event-stream; charset=utf-8\r\n"
+                         b"Cache-Control: no-cache\r\n"
+                         b"Transfer-Encoding: chunked\r\n\r\n")
+        chunks = max(1, self.backend.config.stream_chunks)
+        size = max(1, -(-len(answer) // chunks))
+        pieces = [answer[i:i + size] for i in range(0, len(answer), size)] or [""]
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(self.backend.draw(self.backend.sample_chunk_delay))
+            self._write_chunk(f"data: {json.dumps({'content': piece}, ensure_ascii=False)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+    
+    def _write_chunk(self, text: str):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+
+class MockServer(ThreadingHTTPServer):
+    """模拟后端HTTP服务器（加大监听队列，避免高并发建连时被内核丢弃SYN）"""
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def create_mock_server(config: MockServerConfig, host: str = "127.0.0.1", port: int = 0) -> MockServer:
+    """创建模拟后端（port 为 0 时自动分配端口）"""
+    backend = MockBackend(config)
+    handler = type('BoundMockRequestHandler', (MockRequestHandler,), {'backend': backend})
+    server = MockServer((host, port), handler)
+    server.backend = backend
+    return server
+
+
+def start_mock_server(config: MockServerConfig, host: str = "127.0.0.1", port: int = 0) -> MockServer:
+    """在后台线程中启动模拟后端，返回服务器对象（server.server_address 为实际地址）"""
+    server = create_mock_server(config, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Mock Strapi/LLM Server - 用于离线测试的模拟后端',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 默认配置 (50ms 延迟, 同时接受两种格式)
+  python mock_llm_server.py --port 1337
+  
+  # 模拟慢后端: 对数正态延迟, 5% 500错误, 1% 超时, 只接受Direct格式
+  python mock_llm_server.py --port 1337 --latency lognormal:0.5,0.6 --errors 500=0.05,timeout=0.01 --accept direct
+  
+  # 固定随机种子, 总是返回流式响应
+  python mock_llm_server.py --port 1337 --seed 42 --stream always --chunk-delay uniform:0.01,0.05
+        """
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=1337, help='监听端口 (默认: 1337)')
+    parser.add_argument('--latency', default='constant:0.05',
+                        help='聊天接口延迟分布 (constant/uniform/normal/lognormal/exp, 默认: constant:0.05)')
+    parser.add_argument('--api-latency', default='constant:0', help='其他接口延迟分布 (默认: constant:0)')
+    parser.add_argument('--chunk-delay', default='constant:0.02', help='流式分块间隔分布 (默认: constant:0.02)')
+    parser.add_argument('--errors', default='', help='错误注入概率, 例如 401=0.01,500=0.05,timeout=0.01')
+    parser.add_argument('--accept', choices=['direct', 'wrapped', 'both'], default='both',
+                        help='接受的请求格式 (默认: both)')
+    parser.add_argument('--stream', choices=['auto', 'always', 'never'], default='auto',
+                        help='流式响应: auto 按 Accept 头决定 (默认: auto)')
+    parser.add_argument('--stream-chunks', type=int, default=20, help='流式响应分块数 (默认: 20)')
+    parser.add_argument('--response-chars', type=int, default=400, help='回答字符数 (默认: 400)')
+    parser.add_argument('--timeout-delay', type=float, default=35.0, help='注入超时时的挂起秒数 (默认: 35)')
+    parser.add_argument('--token', help='要求请求携带该 Bearer token')
+    parser.add_argument('--seed', type=int, help='随机种子，用于可复现的延迟和错误序列')
+    parser.add_argument('--cache', action='store_true', help='模拟回答缓存: 重复的问题立即返回并带 X-Cache 头')
+    parser.add_argument('--password', help='/api/auth/local 要求的密码 (默认: 接受任意密码)')
+    parser.add_argument('--jwt-ttl', type=float, default=3600.0, help='登录签发的 JWT 有效期秒数 (默认: 3600)')
+    
+    args = parser.parse_args()
+    try:
+        config = MockServerConfig(
+            latency=args.latency,
+            chunk_delay=args.chunk_delay,
+            api_latency=args.api_latency,
+            error_rates=parse_error_rates(args.errors),
+            accept=args.accept,
+            stream=args.stream,
+            stream_chunks=args.stream_chunks,
+            response_chars=args.response_chars,
+            timeout_delay=args.timeout_delay,
+            token=args.token,
+            seed=args.seed,
+            cache=args.cache,
+            password=args.password,
+            jwt_ttl=args.jwt_ttl
+        )
+        server = create_mock_server(config, args.host, args.port)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    host, port = server.server_address[:2]
+    print(f"模拟后端已启动: http://{host}:{port}")
+    print(f"  聊天接口: http://{host}:{port}/api/student-portraits/chat")
+    print(f"  延迟分布: {config.latency}, 错误注入: {config.error_rates or '无'}, 请求格式: {config.accept}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n已停止")
+        print(f"请求统计: {json.dumps(server.backend.counts, ensure_ascii=False)}")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,13 +4,36 @@ LLM Connection Test Tool
 用于测试和诊断大语言模型API连接问题的工具
 """
 
+import os
+import re
 import sys
+import csv
 import json
+import base64
 import time
 import argparse
+import math
+import random
+import sqlite3
+import contextlib
+import uuid
+import codecs
+import socket
+import hashlib
+import ssl
+import threading
+import html
+from array import array
+from collections import deque, Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import socketserver
+import multiprocessing
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
-from typing import Optional, Dict, List, Any
-from dataclasses import dataclass, field
+from typing import Optional, Dict, List, Any, Callable, Tuple, Iterable, Iterator
+from dataclasses import dataclass, field, asdict
 
 try:
     import requests
@@ -29,6 +52,77 @@ class Colors:
     BOLD = '\033[1m'
     END = '\033[0m'
 
+# 聊天端点支持的请求格式（按报告顺序）
+PAYLOAD_FORMATS = ("direct", "wrapped")
+
+# 诊断阶段标识（按报告顺序）
+STAGE_NAMES = ("connectivity", "endpoint", "auth", "direct", "wrapped", "validation")
+
+# 延迟直方图的桶上界（毫秒），最后一个桶收纳所有更慢的请求
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float('inf'))
+
+# 负载测试直方图的桶上界（毫秒）: 0.1ms 到约2分钟按 2% 等比递增，百分位数误差不超过 2%，
+# 多进程或多节点负载测试按桶求和即可精确合并
+LOAD_BUCKETS_MS = tuple(round(0.1 * 1.02 ** index, 4) for index in range(712)) + (float('inf'),)
+
+# 接口探测目录中 expect_shape 支持的类型
+SHAPE_TYPES = {
+    "list": list,
+    "dict": dict,
+    "str": str,
+    "number": (int, float),
+    "bool": bool,
+    "any": object
+}
+
+# 响应中可能包含AI回答的字段
+RESPONSE_FIELDS = ('response', 'message', 'answer', 'reply', 'data')
+
+# 缓存测试的默认问题语料
+CACHE_CORPUS = (
+    "请分析我的学习成果数据",
+    "我的课程成绩有哪些需要提高的地方？",
+    "根据我的竞赛获奖情况，推荐适合的发展方向",
+    "总结一下我的实践活动经历",
+    "我适合考研还是就业？",
+    "如何提升我的专业能力？"
+)
+
+# 轻量端点探测的请求体: 不是合法JSON，任何后端都会在解析阶段拒绝
+CHEAP_PROBE_BODY = b'{"question":'
+
+# 响应头中表示缓存命中的取值
+CACHE_HIT_VALUES = ("hit", "stale", "revalidated", "updating")
+
+# 规模测试生成问题时使用的文本
+SCALING_TEXT = {
+    "ascii": "Please analyze my learning outcomes and suggest how to improve. ",
+    "chinese": "请分析我的学习成果数据，结合课程成绩、竞赛获奖和实践经历给出改进建议。"
+}
+
+# 限流使用的端点类别: 聊天接口、其他 /api 接口、其他请求
+ENDPOINT_CLASSES = ("chat", "api", "other")
+
+# 单个请求的时间分解阶段及报告中的名称
+TIMING_PHASES = (("dns_ms", "DNS"), ("connect_ms", "连接"), ("tls_ms", "TLS"),
+                 ("ttfb_ms", "首字节"), ("download_ms", "下载"))
+
+# 为响应结构验证保留的最大字符数（响应体文本和每个回答字段），超出部分只计数不保存
+STREAM_BODY_LIMIT = 64 * 1024
+
+# 增量读取响应体时每次读取的字节数
+READ_CHUNK = 64 * 1024
+
+# 样本报告: 时间序列最多的点数（运行更长时按整数秒加宽时间桶）、错误率不低于该值的连续时间桶记为一次错误突发、
+# 延迟-并发曲线最多的并发分组数
+SERIES_MAX_POINTS = 600
+ERROR_BURST_RATE = 0.2
+CONCURRENCY_MAX_LEVELS = 40
+
+# JSON 骨架中每个对象最多保留的字段名数量，以及回答字段以外的字符串值保留的字符数
+SKELETON_MAX_KEYS = 256
+SKELETON_VALUE_CHARS = 256
+
 @dataclass
 class TestResult:
     """测试结果数据类"""
@@ -38,6 +132,7 @@ class TestResult:
     details: Optional[Dict] = None
     duration: Optional[float] = None
     timestamp: datetime = field(default_factory=datetime.now)
+    stage: Optional[str] = None  # 诊断阶段标识，见 STAGE_NAMES
     
     def __str__(self):
         status_icon = {
@@ -47,13 +142,2103 @@ class TestResult:
         }
         icon = status_icon.get(self.status, '?')
         return f"  {icon} {self.message}"
+    
+    def to_dict(self) -> Dict:
+        """转换为可JSON序列化的字典"""
+        return {
+            "test_name": self.test_name,
+            "status": self.status,
+            "message": self.message,
+            "details": self.details,
+            "duration": self.duration,
+            "timestamp": self.timestamp.isoformat(),
+            "stage": self.stage
+        }
+
+
+def summarize_results(results: Iterable[TestResult]) -> Dict[str, int]:
+    """统计各状态的结果数量（只遍历一次，results 可以是按需构建结果的迭代器）"""
+    counts = Counter(r.status for r in results)
+    return {
+        "total": sum(counts.values()),
+        "passed": counts["PASS"],
+        "failed": counts["FAIL"],
+        "warned": counts["WARN"]
+    }
+
+
+class ResultWriter:
+    """机器可读结果输出: json 每次运行输出一个文档，jsonl 每个结果一行并附带一行运行摘要
+    
+    path 为空时写入标准输出，否则追加写入文件。
+    """
+    
+    def __init__(self, output_format: str, path: Optional[str] = None):
+        if output_format not in ("json", "jsonl"):
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        self.output_format = output_format
+        self.path = path
+        self.stream = sys.stdout
+    
+    def write_run(self, results: Iterable[TestResult], summary: Dict):
+        """输出一次运行的全部结果和摘要；jsonl 逐行写出，不在内存中拼接全部结果"""
+        stream = open(self.path, "a", encoding="utf-8") if self.path else self.stream
+        try:
+            if self.output_format == "json":
+                document = {"summary": summary, "results": [r.to_dict() for r in results]}
+                stream.write(json.dumps(document, ensure_ascii=False, indent=None if self.path else 2,
+                                        default=str) + "\n")
+            else:
+                for r in results:
+                    stream.write(json.dumps({"type": "result", "run_id": summary["run_id"], **r.to_dict()},
+                                            ensure_ascii=False, default=str) + "\n")
+                stream.write(json.dumps({"type": "summary", **summary}, ensure_ascii=False, default=str) + "\n")
+            stream.flush()
+        finally:
+            if self.path:
+                stream.close()
+
+
+def format_timing(timing: Dict) -> str:
+    """格式化请求时间分解，未测量的阶段显示为 -"""
+    parts = []
+    for key, label in TIMING_PHASES:
+        value = timing.get(key)
+        parts.append(f"{label} {value:.1f}ms" if value is not None else f"{label} -")
+    return " | ".join(parts)
+
+
+def measure_handshake(url: str, timeout: float = 10.0, verify: bool = True) -> Dict[str, float]:
+    """在临时套接字上测量新建一条到 url 的连接的 DNS、TCP连接和 TLS 握手耗时（毫秒），测完即关闭
+    
+    不经过会话的连接池，也不经过代理；HTTP 的 TLS 为 0。
+    """
+    parts = urlsplit(url)
+    if not parts.hostname:
+        raise ValueError(f"无效的URL: {url}")
+    https = parts.scheme == "https"
+    port = parts.port or (443 if https else 80)
+    started = time.perf_counter()
+    family, kind, proto, _, address = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)[0]
+    resolved = time.perf_counter()
+    sock = socket.socket(family, kind, proto)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        connected = time.perf_counter()
+        if https:
+            context = ssl.create_default_context()
+            if not verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock, server_hostname=parts.hostname)
+        finished = time.perf_counter()
+    finally:
+        sock.close()
+    return {
+        "dns_ms": (resolved - started) * 1000,
+        "connect_ms": (connected - resolved) * 1000,
+        "tls_ms": (finished - connected) * 1000
+    }
+
+
+class KeptText(str):
+    """截断保存的文本: 内容为前若干个字符，length 为完整字符数，digest 为完整文本去掉首尾空白后的 SHA-256"""
+    length: int = 0
+    digest: str = ""
+    
+    @property
+    def truncated(self) -> bool:
+        return self.length > len(self)
+
+
+class _TextSink:
+    """增量接收文本: 只保留前 limit 个字符，同时累计完整字符数和去掉首尾空白后的摘要"""
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.parts: List[str] = []
+        self.kept = 0
+        self.length = 0
+        self.sha = hashlib.sha256()
+        self.started = False
+        # 尚未确定是否位于末尾的空白，遇到后续非空白字符时才计入摘要
+        self.pending = ""
+    
+    def add(self, text: str):
+        if not text:
+            return
+        self.length += len(text)
+        if self.kept < self.limit:
+            self.parts.append(text[:self.limit - self.kept])
+            self.kept += len(self.parts[-1])
+        if not self.started:
+            text = text.lstrip()
+            if not text:
+                return
+            self.started = True
+        stripped = text.rstrip()
+        if stripped:
+            self.sha.update((self.pending + stripped).encode('utf-8', 'surrogatepass'))
+            self.pending = text[len(stripped):]
+        else:
+            self.pending += text
+    
+    def result(self) -> KeptText:
+        text = KeptText("".join(self.parts))
+        text.length = self.length
+        text.digest = self.sha.hexdigest()
+        return text
+
+
+class JsonSkeleton:
+    """增量 JSON 解析: 只保留顶层对象（及其中 data 对象）的字段，其余层级只解析结构不保存
+    
+    字符串内容按块用正则跳过或解码，不逐字符处理。保留的字符串为 KeptText（完整长度和摘要，
+    RESPONSE_FIELDS 中的字段保留前 limit 个字符，其他字段保留前 SKELETON_VALUE_CHARS 个），
+    数组记为空列表，更深的对象记为 None。内存占用与响应大小无关。
+    """
+    
+    _WHITESPACE = re.compile(r'[ \t\r\n]*')
+    _PLAIN = re.compile(r'[^"\\]*')
+    _ESCAPES = re.compile(r'(?:\\(?:u[0-9a-fA-F]{4}|["\\/bfnrt]))+')
+    _LITERAL = re.compile(r'[-+0-9.eEa-z]*')
+    
+    def __init__(self, limit: int = STREAM_BODY_LIMIT):
+        self.limit = limit
+        # 容器栈: [类型 obj/arr, 保留的字典或None, 当前字段名, 期待的下一个记号 key/colon/value/comma, 是否为空]
+        self.stack: List[List[Any]] = []
+        self.root: Any = None
+        self.complete = False
+        self.valid = True
+        self.mode: Optional[str] = None
+        self.sink: Optional[_TextSink] = None
+        self.key_parts: Optional[List[str]] = None
+        self.pending = ""
+        self.literal = ""
+    
+    def _retained(self) -> Optional[Dict]:
+        """当前值所在的保留字典（顶层对象或顶层 data 对象），否则 None"""
+        if self.stack and self.stack[-1][0] == "obj":
+            return self.stack[-1][1]
+        return None
+    
+    def _store(self, value: Any):
+        """记录一个值（容器在开始时记录）"""
+        if not self.stack:
+            self.root = value
+            self.complete = True
+            return
+        frame = self.stack[-1]
+        if frame[1] is not None and frame[2] in frame[1]:
+            frame[1][frame[2]] = value
+    
+    def _value_done(self):
+        if self.stack:
+            self.stack[-1][3] = "comma"
+            self.stack[-1][4] = False
+    
+    def _begin_value(self, char: str):
+        frame = self.stack[-1] if self.stack else None
+        retained = self._retained()
+        key = frame[2] if frame is not None else None
+        if char == '"':
+            self.mode = "string"
+            if frame is None or (retained is not None and key in RESPONSE_FIELDS):
+                self.sink = _TextSink(self.limit)
+            elif retained is not None:
+                self.sink = _TextSink(SKELETON_VALUE_CHARS)
+            else:
+                self.sink = None
+        elif char == '{':
+            # 只展开顶层对象和顶层对象中的 data 对象
+            expand = frame is None or (len(self.stack) == 1 and retained is not None and key == 'data')
+            value = {} if expand else None
+            if value is not None and frame is not None:
+                self._store(value)
+            self.stack.append(["obj", value, None, "key", True])
+        elif char == '[':
+            if retained is not None:
+                self._store([])
+            self.stack.append(["arr", None, None, "value", True])
+        else:
+            self.mode = "literal"
+            self.literal = ""
+    
+    def _end_container(self, char: str):
+        if not self.stack or self.stack[-1][0] != ("obj" if char == '}' else "arr"):
+            self.valid = False
+            return
+        frame = self.stack.pop()
+        if not self.stack:
+            self.root = frame[1] if frame[0] == "obj" else []
+            self.complete = True
+        self._value_done()
+    
+    def _end_string(self):
+        frame = self.stack[-1] if self.stack else None
+        if self.key_parts is not None:
+            key = "".join(self.key_parts)
+            self.key_parts = None
+            frame[2] = key
+            frame[3] = "colon"
+            if frame[1] is not None and len(frame[1]) < SKELETON_MAX_KEYS:
+                frame[1].setdefault(key, None)
+        else:
+            self._store(self.sink.result() if self.sink is not None else None)
+            self._value_done()
+        self.sink = None
+        self.mode = None
+    
+    def _add_text(self, text: str):
+        if self.key_parts is not None:
+            if sum(len(part) for part in self.key_parts) < 256:
+                self.key_parts.append(text)
+        elif self.sink is not None:
+            self.sink.add(text)
+    
+    def _scan_string(self, text: str, i: int) -> int:
+        n = len(text)
+        while i < n:
+            match = self._PLAIN.match(text, i)
+            if match.end() > i:
+                self._add_text(match.group())
+                i = match.end()
+            if i >= n:
+                break
+            if text[i] == '"':
+                self._end_string()
+                return i + 1
+            match = self._ESCAPES.match(text, i)
+            if match is None:
+                # 转义序列被块边界截断，留到下一块
+                if n - i < 6:
+                    self.pending = text[i:]
+                    return n
+                self.valid = False
+                return n
+            run = match.group()
+            rest = text[match.end():]
+            # 代理对的高位与低位可能分在两个块中
+            if len(rest) < 6 and '\\u'.startswith(rest[:2]) and re.search(r'\\u[dD][89abAB][0-9a-fA-F]{2}$', run):
+                self.pending = run[-6:] + rest
+                run = run[:-6]
+                i = n
+            else:
+                i = match.end()
+            if run:
+                self._add_text(json.loads(f'"{run}"'))
+        return n
+    
+    def feed(self, text: str):
+        """处理一段已解码的文本"""
+        if self.pending:
+            text = self.pending + text
+            self.pending = ""
+        i = 0
+        n = len(text)
+        while i < n and self.valid:
+            if self.mode == "string":
+                i = self._scan_string(text, i)
+                continue
+            if self.mode == "literal":
+                match = self._LITERAL.match(text, i)
+                self.literal += match.group()[:64]
+                i = match.end()
+                if i < n:
+                    self._end_literal()
+                continue
+            i = self._WHITESPACE.match(text, i).end()
+            if i >= n:
+                break
+            char = text[i]
+            frame = self.stack[-1] if self.stack else None
+            if self.complete:
+                self.valid = False
+            elif char == '"' and frame is not None and frame[3] == "key":
+                self.mode = "string"
+                self.key_parts = []
+                frame[4] = False
+                i += 1
+            elif char in '"{[-0123456789tfn' and (frame is None or frame[3] == "value"):
+                self._begin_value(char)
+                i += 0 if self.mode == "literal" else 1
+            elif char in '}]' and frame is not None and (frame[3] == "comma" or (frame[4] and frame[3] != "colon")):
+                # 只能在值之后或空容器中结束，拒绝 {"a":}、[1,] 这类不完整的JSON
+                self._end_container(char)
+                i += 1
+            elif char == ':' and frame is not None and frame[3] == "colon":
+                frame[3] = "value"
+                i += 1
+            elif char == ',' and frame is not None and frame[3] == "comma":
+                frame[3] = "key" if frame[0] == "obj" else "value"
+                i += 1
+            else:
+                self.valid = False
+    
+    def _end_literal(self):
+        try:
+            value = json.loads(self.literal)
+        except ValueError:
+            self.valid = False
+            return
+        self.mode = None
+        self._store(value)
+        self._value_done()
+    
+    def close(self):
+        """输入结束: 处理顶层的数字等未结束的字面量"""
+        if self.mode == "literal" and self.valid:
+            self._end_literal()
+    
+    def result(self) -> Any:
+        """解析完成时返回骨架，否则抛出 ValueError"""
+        if not (self.valid and self.complete and self.mode is None and not self.stack):
+            raise ValueError("响应体不是完整的JSON")
+        return self.root
+
+
+class BoundedBody:
+    """增量读取的响应体: 保留前 limit 个字符的文本和 JSON 骨架，内存占用与响应大小无关
+    
+    limit 为 0 时只统计字节数，不解码。
+    """
+    
+    def __init__(self, encoding: Optional[str] = None, limit: int = STREAM_BODY_LIMIT):
+        self.bytes = 0
+        self.limit = limit
+        self.decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace') if limit else None
+        self.text_sink = _TextSink(limit)
+        self.json = JsonSkeleton(limit)
+    
+    @classmethod
+    def read(cls, response: requests.Response, limit: int = STREAM_BODY_LIMIT) -> 'BoundedBody':
+        """读取 stream=True 发送的请求的完整响应体，读完后连接回到连接池"""
+        body = cls(response.encoding, limit)
+        for raw in response.iter_content(chunk_size=READ_CHUNK):
+            body.feed(raw)
+        body.close()
+        return body
+    
+    def feed(self, raw: bytes):
+        self.bytes += len(raw)
+        if self.decoder is not None:
+            self._feed_text(self.decoder.decode(raw))
+    
+    def _feed_text(self, text: str):
+        self.text_sink.add(text)
+        if self.json.valid:
+            self.json.feed(text)
+    
+    def close(self):
+        if self.decoder is not None:
+            self._feed_text(self.decoder.decode(b'', final=True))
+            self.json.close()
+    
+    @property
+    def text(self) -> KeptText:
+        """响应体文本（截断）"""
+        return self.text_sink.result()
+    
+    def value(self) -> Any:
+        """JSON 骨架；不是 JSON 时返回截断的文本（KeptText）"""
+        try:
+            return self.json.result()
+        except ValueError:
+            return self.text
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数（线性插值），values 为空时返回 0"""
+    if not values:
+        return 0.0
+    return sorted_percentile(sorted(values), pct)
+
+
+def sorted_percentile(ordered: List[float], pct: float) -> float:
+    """已排序序列的百分位数（线性插值），为空时返回 0"""
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+class LatencyHistogram:
+    """固定桶延迟直方图: 内存占用与样本数量无关，可合并"""
+    
+    def __init__(self, buckets_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * len(buckets_ms)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def record(self, seconds: float):
+        """记录一个样本（秒）"""
+        self.counts[bisect.bisect_left(self.buckets_ms, seconds * 1000)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+    
+    def merge(self, other: 'LatencyHistogram'):
+        """合并另一个相同分桶的直方图"""
+        if other.buckets_ms != self.buckets_ms:
+            raise ValueError("直方图分桶不一致，无法合并")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+    
+    def percentile(self, pct: float) -> float:
+        """估算百分位数（秒），取样本所在桶的上界，最后一个桶取观测最大值"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(self.count * pct / 100)))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                bound = self.buckets_ms[index] / 1000
+                return min(bound, self.max)
+        return self.max
+    
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+    
+    def summary(self) -> Dict[str, float]:
+        """与 latency_summary 相同格式的分位数摘要（毫秒）"""
+        return {
+            "p50": self.percentile(50) * 1000,
+            "p90": self.percentile(90) * 1000,
+            "p99": self.percentile(99) * 1000,
+            "max": self.max * 1000
+        }
+    
+    def to_dict(self) -> Dict:
+        """序列化为可JSON/跨进程传递的字典，只保存非零桶"""
+        return {
+            "buckets_ms": [bound if bound != float('inf') else None for bound in self.buckets_ms],
+            "counts": {str(index): count for index, count in enumerate(self.counts) if count},
+            "count": self.count,
+            "total": self.total,
+            "max": self.max
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LatencyHistogram':
+        histogram = cls(tuple(bound if bound is not None else float('inf') for bound in data["buckets_ms"]))
+        for index, count in data["counts"].items():
+            histogram.counts[int(index)] = count
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class RollingHistogram:
+    """滚动窗口直方图: 保留最近 window 个周期，每个周期一个 LatencyHistogram"""
+    
+    def __init__(self, window: int = 60):
+        self.intervals = deque([LatencyHistogram()], maxlen=window)
+    
+    def record(self, seconds: float):
+        self.intervals[-1].record(seconds)
+    
+    def rotate(self):
+        """开始新的周期，超出窗口的最旧周期被丢弃"""
+        self.intervals.append(LatencyHistogram())
+    
+    def snapshot(self) -> LatencyHistogram:
+        """合并窗口内所有周期"""
+        merged = LatencyHistogram()
+        for histogram in self.intervals:
+            merged.merge(histogram)
+        return merged
+
+
+class SampleLog:
+    """逐请求样本的列式存储: 每列一个 array，每个样本 28 字节，用于运行结束后的统计和导出
+    
+    finished 为完成时刻（相对 started_at 的秒数），latency/ttft 为秒（没有首字节时为 nan），
+    status 为状态码或错误类型在 keys 中的编号，stage 为 STAGE_NAMES 中的编号（负载请求为 -1）。
+    """
+    
+    COLUMNS = (("finished", "d"), ("latency", "d"), ("ttft", "d"), ("status", "H"), ("ok", "B"), ("stage", "b"))
+    
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = time.time() if started_at is None else started_at
+        self.keys: List[str] = []
+        self._key_index: Dict[str, int] = {}
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode))
+    
+    def __len__(self) -> int:
+        return len(self.latency)
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).itemsize for name, _ in self.COLUMNS) * len(self)
+    
+    def _key(self, key: str) -> int:
+        index = self._key_index.get(key)
+        if index is None:
+            index = self._key_index[key] = len(self.keys)
+            self.keys.append(key)
+        return index
+    
+    def record(self, key: str, ok: bool, seconds: float, ttft: Optional[float] = None,
+               stage: int = -1, finished: Optional[float] = None):
+        """记录一个样本，finished 为完成时的 Unix 时间戳（默认为当前时间）"""
+        self.finished.append((time.time() if finished is None else finished) - self.started_at)
+        self.latency.append(seconds)
+        self.ttft.append(math.nan if ttft is None else ttft)
+        self.status.append(self._key(key))
+        self.ok.append(1 if ok else 0)
+        self.stage.append(stage)
+    
+    def extend(self, other: 'SampleLog'):
+        """追加另一份样本，按两者的 started_at 对齐时间轴"""
+        shift = other.started_at - self.started_at
+        mapping = [self._key(key) for key in other.keys]
+        self.finished.extend(value + shift for value in other.finished)
+        self.status.extend(mapping[index] for index in other.status)
+        for name in ("latency", "ttft", "ok", "stage"):
+            getattr(self, name).extend(getattr(other, name))
+    
+    def to_dict(self) -> Dict:
+        """序列化为可JSON传输的字典，各列为小端字节序的 base64"""
+        columns = {}
+        for name, _ in self.COLUMNS:
+            column = getattr(self, name)
+            if sys.byteorder != "little":
+                column = array(column.typecode, column)
+                column.byteswap()
+            columns[name] = base64.b64encode(column.tobytes()).decode('ascii')
+        return {"started_at": self.started_at, "keys": self.keys, "columns": columns}
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SampleLog':
+        log = cls(data["started_at"])
+        for key in data["keys"]:
+            log._key(key)
+        for name, _ in cls.COLUMNS:
+            column = getattr(log, name)
+            column.frombytes(base64.b64decode(data["columns"][name]))
+            if sys.byteorder != "little":
+                column.byteswap()
+        return log
+
+
+def in_flight_levels(log: SampleLog) -> List[int]:
+    """每个样本开始时的在途请求数（包括自身），由所有样本的开始和完成时刻推算"""
+    starts = [end - seconds for end, seconds in zip(log.finished, log.latency)]
+    ordered_starts = sorted(starts)
+    ordered_ends = sorted(log.finished)
+    return [bisect.bisect_right(ordered_starts, start) - bisect.bisect_right(ordered_ends, start)
+            for start in starts]
+
+
+def _sample_stats(ordered: List[float]) -> Dict[str, float]:
+    """已排序延迟（秒）的分位数摘要（毫秒）"""
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+        "p50": sorted_percentile(ordered, 50) * 1000,
+        "p90": sorted_percentile(ordered, 90) * 1000,
+        "p99": sorted_percentile(ordered, 99) * 1000,
+        "p999": sorted_percentile(ordered, 99.9) * 1000,
+        "max": ordered[-1] * 1000 if ordered else 0.0
+    }
+
+
+def analyze_samples(log: SampleLog, levels: Optional[List[int]] = None, max_bursts: int = 10) -> Dict:
+    """按列统计样本: 分阶段延迟分位数、按时间桶的吞吐量和延迟、错误突发、延迟-并发曲线
+    
+    每项统计只对各列做一次排序或一次遍历，百万样本在数秒内完成。levels 为 in_flight_levels 的结果，
+    导出CSV时已经算过可以直接传入。
+    """
+    count = len(log)
+    if not count:
+        return {"samples": 0}
+    if levels is None:
+        levels = in_flight_levels(log)
+    latency = log.latency
+    origin = min(end - seconds for end, seconds in zip(log.finished, latency))
+    span = max(log.finished) - origin
+    width = max(1, math.ceil(span / SERIES_MAX_POINTS))
+    buckets = int(span // width) + 1
+    positions = [int((end - origin) // width) for end in log.finished]
+    
+    totals = [0] * buckets
+    errors = [0] * buckets
+    per_bucket: List[List[float]] = [[] for _ in range(buckets)]
+    for position, seconds, ok in zip(positions, latency, log.ok):
+        totals[position] += 1
+        per_bucket[position].append(seconds)
+        if not ok:
+            errors[position] += 1
+    series = []
+    for position in range(buckets):
+        ordered = sorted(per_bucket[position])
+        series.append({
+            "t": position * width,
+            "rps": totals[position] / width,
+            "error_rps": errors[position] / width,
+            "p50_ms": sorted_percentile(ordered, 50) * 1000 if ordered else None,
+            "p99_ms": sorted_percentile(ordered, 99) * 1000 if ordered else None
+        })
+    per_bucket = None
+    
+    # 错误突发: 错误率不低于 ERROR_BURST_RATE 的连续时间桶
+    runs = []
+    for position in range(buckets):
+        if errors[position] and errors[position] >= ERROR_BURST_RATE * totals[position]:
+            if runs and runs[-1][1] == position - 1:
+                runs[-1][1] = position
+            else:
+                runs.append([position, position])
+    runs.sort(key=lambda run: sum(errors[run[0]:run[1] + 1]), reverse=True)
+    runs = runs[:max_bursts]
+    bursts = [{
+        "start_s": first * width,
+        "end_s": (last + 1) * width,
+        "requests": sum(totals[first:last + 1]),
+        "errors": sum(errors[first:last + 1])
+    } for first, last in runs]
+    owner = [-1] * buckets
+    for index, (first, last) in enumerate(runs):
+        owner[first:last + 1] = [index] * (last - first + 1)
+    burst_keys = [Counter() for _ in bursts]
+    for position, ok, status in zip(positions, log.ok, log.status):
+        if not ok and owner[position] >= 0:
+            burst_keys[owner[position]][log.keys[status]] += 1
+    for burst, keys in zip(bursts, burst_keys):
+        burst["error_rate"] = burst["errors"] / burst["requests"]
+        burst["status_codes"] = dict(keys.most_common(3))
+    
+    stages = []
+    stage_ids = sorted(set(log.stage))
+    for stage in stage_ids:
+        if len(stage_ids) == 1:
+            values, oks = latency, log.ok
+        else:
+            values = [seconds for seconds, sample_stage in zip(latency, log.stage) if sample_stage == stage]
+            oks = [ok for ok, sample_stage in zip(log.ok, log.stage) if sample_stage == stage]
+        stats = _sample_stats(sorted(values))
+        stats["stage"] = STAGE_NAMES[stage] if stage >= 0 else "chat"
+        stats["errors"] = len(oks) - sum(oks)
+        stages.append(stats)
+    
+    # 延迟-并发曲线: 按开始时的在途请求数分组，分组过多时合并相邻的并发数
+    step = max(1, math.ceil(max(levels) / CONCURRENCY_MAX_LEVELS))
+    groups: Dict[int, List[float]] = {}
+    for level, seconds in zip(levels, latency):
+        groups.setdefault((level - 1) // step, []).append(seconds)
+    concurrency = []
+    for group in sorted(groups):
+        stats = _sample_stats(sorted(groups[group]))
+        stats["in_flight"] = (group + 1) * step
+        stats["label"] = str(stats["in_flight"]) if step == 1 else f"{group * step + 1}-{(group + 1) * step}"
+        concurrency.append(stats)
+    
+    ttft = sorted(value for value in log.ttft if value == value)
+    failures = count - sum(log.ok)
+    return {
+        "samples": count,
+        "errors": failures,
+        "error_rate": failures / count,
+        "span_s": span,
+        "bucket_s": width,
+        "throughput_rps": count / span if span > 0 else 0.0,
+        "stages": stages,
+        "status_codes": {log.keys[key]: total for key, total in sorted(Counter(log.status).items())},
+        "ttft_ms": _sample_stats(ttft) if ttft else None,
+        "series": series,
+        "bursts": bursts,
+        "concurrency": concurrency
+    }
+
+
+def write_samples_csv(log: SampleLog, path: str, levels: Optional[List[int]] = None):
+    """导出逐请求样本CSV，时间为相对第一个请求开始时刻的秒数"""
+    if levels is None:
+        levels = in_flight_levels(log)
+    origin = min((end - seconds for end, seconds in zip(log.finished, log.latency)), default=0.0)
+    keys = log.keys
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["start_s", "latency_ms", "ttft_ms", "status", "ok", "stage", "in_flight"])
+        writer.writerows(
+            (round(end - seconds - origin, 6), round(seconds * 1000, 3),
+             round(ttft * 1000, 3) if ttft == ttft else "", keys[status], ok,
+             STAGE_NAMES[stage] if stage >= 0 else "chat", level)
+            for end, seconds, ttft, status, ok, stage, level
+            in zip(log.finished, log.latency, log.ttft, log.status, log.ok, log.stage, levels))
+
+
+def _svg_chart(xs: List[float], series: List[Tuple[str, str, List[Optional[float]]]],
+               x_label: str, y_label: str, width: int = 880, height: int = 260) -> str:
+    """内联 SVG 折线图，series 为 [(名称, 颜色, 与 xs 对齐的取值或None)]"""
+    values = [value for _, _, ys in series for value in ys if value is not None]
+    if not xs or not values:
+        return '<p class="empty">无数据</p>'
+    left, right, top, bottom = 64, 16, 24, 40
+    x_min, x_max = min(xs), max(xs)
+    x_max = x_max if x_max > x_min else x_min + 1
+    y_max = max(values) or 1.0
+    
+    def sx(x: float) -> float:
+        return left + (x - x_min) / (x_max - x_min) * (width - left - right)
+    
+    def sy(y: float) -> float:
+        return height - bottom - y / y_max * (height - top - bottom)
+    
+    parts = [f'<svg viewBox="0 0 {width} {height}" width="{width}" height="{height}" '
+             f'xmlns="http://www.w3.org/2000/svg">']
+    for tick in range(5):
+        y = y_max * tick / 4
+        parts.append(f'<line x1="{left}" x2="{width - right}" y1="{sy(y):.1f}" y2="{sy(y):.1f}" class="grid"/>'
+                     f'<text x="{left - 6}" y="{sy(y) + 4:.1f}" text-anchor="end">{y:.4g}</text>')
+    for tick in range(6):
+        x = x_min + (x_max - x_min) * tick / 5
+        parts.append(f'<text x="{sx(x):.1f}" y="{height - bottom + 16}" text-anchor="middle">{x:.4g}</text>')
+    for name, color, ys in series:
+        points = " ".join(f"{sx(x):.1f},{sy(y):.1f}" for x, y in zip(xs, ys) if y is not None)
+        parts.append(f'<polyline fill="none" stroke="{color}" stroke-width="1.5" points="{points}"/>')
+    for index, (name, color, _) in enumerate(series):
+        x = left + 10 + index * 120
+        parts.append(f'<rect x="{x}" y="6" width="12" height="3" fill="{color}"/>'
+                     f'<text x="{x + 16}" y="12">{html.escape(name)}</text>')
+    parts.append(f'<text x="{(left + width - right) / 2}" y="{height - 6}" text-anchor="middle">'
+                 f'{html.escape(x_label)}</text>'
+                 f'<text x="14" y="{(top + height - bottom) / 2}" text-anchor="middle" '
+                 f'transform="rotate(-90 14 {(top + height - bottom) / 2})">{html.escape(y_label)}</text></svg>')
+    return "".join(parts)
+
+
+def _html_table(headers: List[str], rows: List[List[Any]]) -> str:
+    """HTML 表格，浮点数保留一位小数"""
+    head = "".join(f"<th>{html.escape(str(header))}</th>" for header in headers)
+    body = "".join("<tr>" + "".join(
+        f"<td>{value:.1f}</td>" if isinstance(value, float) else f"<td>{html.escape(str(value))}</td>"
+        for value in row) + "</tr>" for row in rows)
+    return f"<table><tr>{head}</tr>{body}</table>"
+
+
+def render_html_report(analysis: Dict, title: str, meta: Dict[str, str]) -> str:
+    """由 analyze_samples 的结果生成独立的 HTML 报告（内联样式和 SVG 图表，不依赖外部资源）"""
+    sections = [f"<h1>{html.escape(title)}</h1>",
+                _html_table(["项目", "值"], [[key, value] for key, value in meta.items()])]
+    if not analysis.get("samples"):
+        sections.append('<p class="empty">没有记录到样本</p>')
+    else:
+        sections.append("<h2>概要</h2>" + _html_table(
+            ["样本数", "错误数", "错误率(%)", "时长(s)", "吞吐量(req/s)"],
+            [[analysis["samples"], analysis["errors"], analysis["error_rate"] * 100,
+              analysis["span_s"], analysis["throughput_rps"]]]))
+        sections.append("<h2>延迟分位数 (ms)</h2>" + _html_table(
+            ["阶段", "样本数", "错误数", "平均", "p50", "p90", "p99", "p99.9", "max"],
+            [[stage["stage"], stage["count"], stage["errors"], stage["mean"], stage["p50"], stage["p90"],
+              stage["p99"], stage["p999"], stage["max"]] for stage in analysis["stages"]]))
+        if analysis["ttft_ms"]:
+            ttft = analysis["ttft_ms"]
+            sections.append("<h2>首字延迟 (ms)</h2>" + _html_table(
+                ["样本数", "p50", "p90", "p99", "max"],
+                [[ttft["count"], ttft["p50"], ttft["p90"], ttft["p99"], ttft["max"]]]))
+        sections.append("<h2>状态码</h2>" + _html_table(
+            ["状态码", "次数"], [[key, total] for key, total in analysis["status_codes"].items()]))
+        
+        series = analysis["series"]
+        xs = [point["t"] for point in series]
+        x_label = f"时间 (s，每 {analysis['bucket_s']}s 一个点)"
+        sections.append("<h2>吞吐量</h2>" + _svg_chart(
+            xs, [("完成 req/s", "#2b7bb9", [point["rps"] for point in series]),
+                 ("错误 req/s", "#d62728", [point["error_rps"] for point in series])], x_label, "req/s"))
+        sections.append("<h2>延迟随时间变化</h2>" + _svg_chart(
+            xs, [("p50", "#2b7bb9", [point["p50_ms"] for point in series]),
+                 ("p99", "#ff7f0e", [point["p99_ms"] for point in series])], x_label, "ms"))
+        curve = analysis["concurrency"]
+        sections.append("<h2>延迟-并发曲线</h2>" + _svg_chart(
+            [point["in_flight"] for point in curve],
+            [("p50", "#2b7bb9", [point["p50"] for point in curve]),
+             ("p99", "#ff7f0e", [point["p99"] for point in curve])], "开始时的在途请求数", "ms"))
+        sections.append(_html_table(
+            ["在途请求数", "样本数", "p50", "p90", "p99", "max"],
+            [[point["label"], point["count"], point["p50"], point["p90"], point["p99"], point["max"]]
+             for point in curve]))
+        sections.append(f"<h2>错误突发</h2><p>错误率不低于 {ERROR_BURST_RATE * 100:.0f}% 的连续时间段，按错误数排序</p>")
+        if analysis["bursts"]:
+            sections.append(_html_table(
+                ["开始(s)", "结束(s)", "请求数", "错误数", "错误率(%)", "主要错误"],
+                [[burst["start_s"], burst["end_s"], burst["requests"], burst["errors"], burst["error_rate"] * 100,
+                  ", ".join(f"{key}×{total}" for key, total in burst["status_codes"].items())]
+                 for burst in analysis["bursts"]]))
+        else:
+            sections.append('<p class="empty">无</p>')
+    style = ("body{font-family:sans-serif;margin:24px;color:#222}table{border-collapse:collapse;margin:8px 0}"
+             "th,td{border:1px solid #ccc;padding:4px 10px;text-align:right}th{background:#f3f3f3}"
+             "svg text{font-size:11px;fill:#555}svg .grid{stroke:#eee}.empty{color:#888}")
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+            f'<style>{style}</style></head><body>{"".join(sections)}</body></html>\n')
+
+
+class MetricsRegistry:
+    """监控结果指标缓存，以 OpenMetrics 文本格式导出
+    
+    只在监控循环写入结果时重新生成文本，抓取请求直接返回缓存，不会触发新的探测。
+    """
+    
+    CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+    
+    def __init__(self, prefix: str = "llm_probe"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.results = {name: {"pass": 0, "fail": 0, "warn": 0} for name in STAGE_NAMES}
+        self.histograms = {name: LatencyHistogram() for name in STAGE_NAMES}
+        self.last_success: Dict[str, float] = {}
+        self._rendered = self._render().encode('utf-8')
+    
+    def observe(self, stage: str, result: TestResult):
+        """记录一个阶段结果"""
+        with self._lock:
+            status = result.status.lower()
+            self.results[stage][status] = self.results[stage].get(status, 0) + 1
+            if result.duration is not None:
+                self.histograms[stage].record(result.duration)
+            if result.status == "PASS":
+                self.last_success[stage] = result.timestamp.timestamp()
+            self._rendered = self._render().encode('utf-8')
+    
+    def render(self) -> bytes:
+        """返回缓存的 OpenMetrics 文本"""
+        with self._lock:
+            return self._rendered
+    
+    def _render(self) -> str:
+        p = self.prefix
+        lines = [
+            f"# TYPE {p}_results counter",
+            f"# HELP {p}_results Probe results by stage and status.",
+        ]
+        for stage in STAGE_NAMES:
+            for status, count in self.results[stage].items():
+                lines.append(f'{p}_results_total{{stage="{stage}",status="{status}"}} {count}')
+        
+        lines.append(f"# TYPE {p}_latency_seconds histogram")
+        lines.append(f"# HELP {p}_latency_seconds Probe latency by stage.")
+        lines.append(f"# UNIT {p}_latency_seconds seconds")
+        for stage in STAGE_NAMES:
+            histogram = self.histograms[stage]
+            cumulative = 0
+            for bound, count in zip(histogram.buckets_ms, histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else repr(bound / 1000)
+                lines.append(f'{p}_latency_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{p}_latency_seconds_count{{stage="{stage}"}} {histogram.count}')
+            lines.append(f'{p}_latency_seconds_sum{{stage="{stage}"}} {histogram.total}')
+        
+        lines.append(f"# TYPE {p}_last_success_timestamp_seconds gauge")
+        lines.append(f"# HELP {p}_last_success_timestamp_seconds Unix time of the last passing probe.")
+        lines.append(f"# UNIT {p}_last_success_timestamp_seconds seconds")
+        for stage in STAGE_NAMES:
+            if stage in self.last_success:
+                lines.append(f'{p}_last_success_timestamp_seconds{{stage="{stage}"}} {self.last_success[stage]}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """/metrics 请求处理器"""
+    registry: MetricsRegistry = None
+    
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render()
+        self.send_response(200)
+        self.send_header('Content-Type', MetricsRegistry.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(registry: MetricsRegistry, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """在后台线程中启动指标HTTP服务"""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def split_load(concurrency: int, total_requests: Optional[int], parts: int) -> List[Tuple[int, Optional[int]]]:
+    """将虚拟用户数和请求总数尽量平均地分成 parts 份，返回 [(虚拟用户数, 请求数或None)]"""
+    shares = [concurrency // parts + (1 if index < concurrency % parts else 0) for index in range(parts)]
+    if total_requests is None:
+        return [(share, None) for share in shares]
+    request_shares = [total_requests * share // concurrency for share in shares]
+    for index in range(total_requests - sum(request_shares)):
+        request_shares[index] += 1
+    return list(zip(shares, request_shares))
+
+
+def split_limit(limit: int, weights: List[float]) -> List[int]:
+    """将整数上限按权重拆分: 每份至少为1，其余按最大余数法分配，各份之和恰好等于 limit"""
+    if limit < len(weights):
+        raise ValueError(f"在途请求上限 {limit} 小于分片数 {len(weights)}，无法拆分")
+    total = sum(weights)
+    spare = limit - len(weights)
+    exact = [spare * weight / total if total else spare / len(weights) for weight in weights]
+    parts = [1 + int(value) for value in exact]
+    by_remainder = sorted(range(len(weights)), key=lambda index: exact[index] - int(exact[index]), reverse=True)
+    for index in by_remainder[:limit - sum(parts)]:
+        parts[index] += 1
+    return parts
+
+
+def merge_load_shards(shards: List[Dict], labels: Optional[List[str]] = None) -> Dict:
+    """合并负载分片的统计，结果仍是分片格式（可继续合并），并附带各分片的明细"""
+    histogram = LatencyHistogram(LOAD_BUCKETS_MS)
+    first_bytes = LatencyHistogram(LOAD_BUCKETS_MS)
+    status_codes: Dict[str, int] = {}
+    for shard in shards:
+        histogram.merge(LatencyHistogram.from_dict(shard["histogram"]))
+        first_bytes.merge(LatencyHistogram.from_dict(shard["ttft_histogram"]))
+        for key, count in shard["status_codes"].items():
+            status_codes[key] = status_codes.get(key, 0) + count
+    throttle: Dict[str, Dict[str, float]] = {}
+    for shard in shards:
+        for key, stats in shard.get("throttle", {}).items():
+            merged = throttle.setdefault(key, {"requests": 0, "throttled": 0, "throttled_s": 0.0, "max_wait_s": 0.0})
+            for name in ("requests", "throttled", "throttled_s"):
+                merged[name] += stats[name]
+            merged["max_wait_s"] = max(merged["max_wait_s"], stats["max_wait_s"])
+    retry = [shard["retry"] for shard in shards if shard.get("retry")]
+    hedge = [snapshot for shard in shards for snapshot in shard.get("hedge_snapshots", [])]
+    samples = None
+    sample_shards = [shard["samples"] for shard in shards if shard.get("samples")]
+    if sample_shards:
+        samples = SampleLog(min(data["started_at"] for data in sample_shards))
+        for data in sample_shards:
+            samples.extend(SampleLog.from_dict(data))
+    per_shard = []
+    for index, shard in enumerate(shards):
+        wall_time = shard["wall_time_s"]
+        per_shard.append({
+            "label": labels[index] if labels else f"#{index}",
+            "concurrency": shard["concurrency"],
+            "requests": shard["requests"],
+            "throughput_rps": shard["requests"] / wall_time if wall_time else 0.0
+        })
+    return {
+        "concurrency": sum(shard["concurrency"] for shard in shards),
+        "requests": histogram.count,
+        "errors": sum(shard["errors"] for shard in shards),
+        "wall_time_s": max(shard["wall_time_s"] for shard in shards),
+        "status_codes": status_codes,
+        "histogram": histogram.to_dict(),
+        "ttft_histogram": first_bytes.to_dict(),
+        "throttle": throttle,
+        "retry": merge_retry_stats(retry) if retry else None,
+        "hedge_snapshots": hedge,
+        "samples": samples.to_dict() if samples is not None else None,
+        "per_worker": per_shard
+    }
+
+
+def send_message(stream, message: Dict):
+    """分布式负载协议: 每条消息为一行 JSON"""
+    stream.write(json.dumps(message, ensure_ascii=False).encode('utf-8') + b"\n")
+    stream.flush()
+
+
+def recv_message(stream) -> Dict:
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("连接已关闭")
+    return json.loads(line)
+
+
+class _LoadAgentServer(socketserver.TCPServer):
+    """负载代理的 TCP 服务，允许重启后立即复用端口"""
+    allow_reuse_address = True
+
+
+class _LoadAgentHandler(socketserver.StreamRequestHandler):
+    """负载代理: 响应协调器的时钟同步 (ping) 和负载任务 (run)，每条消息都需携带代理密钥"""
+    workers: int = 1
+    key: Optional[str] = None
+    
+    def handle(self):
+        while True:
+            try:
+                message = recv_message(self.rfile)
+            except (ConnectionError, ValueError):
+                return
+            if self.key is not None and message.get("key") != self.key:
+                send_message(self.wfile, {"type": "error", "message": "代理密钥不匹配"})
+                return
+            if message.get("type") == "ping":
+                send_message(self.wfile, {"type": "pong", "time": time.time()})
+            elif message.get("type") == "run":
+                send_message(self.wfile, self._run(message))
+            else:
+                send_message(self.wfile, {"type": "error", "message": f"未知消息类型: {message.get('type')}"})
+    
+    def _run(self, job: Dict) -> Dict:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 收到任务: {job['concurrency']} 虚拟用户, "
+              f"目标 {job['config']['backend_url']}")
+        tester = LLMConnectionTester.from_shard_config(job["config"], pool_size=job["concurrency"])
+        try:
+            if self.workers > 1 and job["concurrency"] >= self.workers:
+                shard = tester._run_load_workers(job["question"], job["concurrency"], job["duration"],
+                                                 job["total_requests"], job["format"], self.workers,
+                                                 job["start_at"])
+            else:
+                shard = tester.run_load_shard(job["question"], job["concurrency"], job["duration"],
+                                              job["total_requests"], job["format"], job["start_at"])
+        except Exception as e:
+            return {"type": "error", "message": str(e)}
+        finally:
+            tester.close()
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 任务完成: {shard['requests']} 个请求")
+        return {"type": "result", "shard": shard}
+
+
+def start_load_agent(host: str, port: int, workers: int = 1, key: Optional[str] = None) -> socketserver.TCPServer:
+    """创建负载代理服务（由调用方运行 serve_forever），任务逐个执行"""
+    handler = type('LoadAgentHandler', (_LoadAgentHandler,), {'workers': workers, 'key': key})
+    return _LoadAgentServer((host, port), handler)
+
+
+def format_bytes(size: float) -> str:
+    """格式化字节数"""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+
+
+def load_probe_catalog(path: str) -> List[Dict]:
+    """读取接口探测目录 (JSON)，合并 defaults 并校验每个探测项"""
+    with open(path, encoding='utf-8') as f:
+        catalog = json.load(f)
+    defaults = {"method": "GET", "expect_status": [200], "timeout": 10, "auth": False}
+    defaults.update(catalog.get("defaults", {}))
+    
+    probes = []
+    for index, entry in enumerate(catalog.get("probes", [])):
+        probe = {**defaults, **entry}
+        if not probe.get("path", "").startswith("/"):
+            raise ValueError(f"探测项 #{index} 的 path 必须以 / 开头: {probe.get('path')}")
+        probe.setdefault("name", probe["path"])
+        probe["method"] = probe["method"].upper()
+        if isinstance(probe["expect_status"], int):
+            probe["expect_status"] = [probe["expect_status"]]
+        for key, type_name in probe.get("expect_shape", {}).items():
+            if type_name not in SHAPE_TYPES:
+                raise ValueError(f"探测项 {probe['name']} 的字段 {key} 类型未知: {type_name}")
+        probes.append(probe)
+    if not probes:
+        raise ValueError(f"探测目录为空: {path}")
+    return probes
+
+
+def check_shape(data: Any, expect_shape: Dict[str, str]) -> List[str]:
+    """按 expect_shape 检查响应结构，键支持 a.b 形式的嵌套路径，返回不符合项"""
+    errors = []
+    for key, type_name in expect_shape.items():
+        value = data
+        for part in key.split('.'):
+            if not isinstance(value, dict) or part not in value:
+                errors.append(f"缺少字段 {key}")
+                break
+            value = value[part]
+        else:
+            if not isinstance(value, SHAPE_TYPES[type_name]) or (type_name == "number" and isinstance(value, bool)):
+                errors.append(f"字段 {key} 应为 {type_name}，实际为 {type(value).__name__}")
+    return errors
+
+
+class ResultStore:
+    """历史结果存储 (SQLite)，按 后端URL + 端点 + 阶段 + 请求格式 + 时间 建立索引"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS probe_results (
+            id INTEGER PRIMARY KEY,
+            run_id TEXT NOT NULL,
+            ts REAL NOT NULL,
+            backend_url TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            format TEXT NOT NULL DEFAULT '',
+            status TEXT NOT NULL,
+            duration_ms REAL,
+            status_code INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_probe_results_key_ts
+            ON probe_results (backend_url, endpoint, stage, format, ts);
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+    
+    def record(self, results: List[TestResult], run_id: str, backend_url: str, endpoint: str):
+        """追加一次运行中带阶段标识的结果"""
+        rows = []
+        for result in results:
+            if result.stage not in STAGE_NAMES:
+                continue
+            details = result.details or {}
+            rows.append((
+                run_id,
+                result.timestamp.timestamp(),
+                backend_url,
+                endpoint,
+                result.stage,
+                details.get("format", "") if result.stage in PAYLOAD_FORMATS else "",
+                result.status,
+                result.duration * 1000 if result.duration is not None else None,
+                details.get("status_code")
+            ))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO probe_results (run_id, ts, backend_url, endpoint, stage, format, "
+                "status, duration_ms, status_code) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+    
+    def keys(self, backend_url: str, endpoint: str) -> List[Tuple[str, str]]:
+        """列出已存储的 (阶段, 请求格式) 组合"""
+        cursor = self.conn.execute(
+            "SELECT DISTINCT stage, format FROM probe_results WHERE backend_url = ? AND endpoint = ?",
+            (backend_url, endpoint)
+        )
+        return sorted(cursor.fetchall(), key=lambda key: (STAGE_NAMES.index(key[0])
+                                                          if key[0] in STAGE_NAMES else len(STAGE_NAMES), key[1]))
+    
+    def fetch(self, backend_url: str, endpoint: str, stage: str, format_type: str,
+              since: float, until: float) -> Tuple[List[float], int, int]:
+        """查询时间窗口内的样本，返回 (延迟毫秒列表, 失败数, 总数)"""
+        cursor = self.conn.execute(
+            "SELECT duration_ms, status FROM probe_results "
+            "WHERE backend_url = ? AND endpoint = ? AND stage = ? AND format = ? AND ts >= ? AND ts < ?",
+            (backend_url, endpoint, stage, format_type, since, until)
+        )
+        latencies: List[float] = []
+        failures = 0
+        total = 0
+        for duration_ms, status in cursor:
+            total += 1
+            if status == "FAIL":
+                failures += 1
+            elif duration_ms is not None:
+                latencies.append(duration_ms)
+        return latencies, failures, total
+    
+    def close(self):
+        self.conn.close()
+
+
+def mann_whitney_p(baseline: List[float], recent: List[float]) -> float:
+    """Mann-Whitney U 检验（正态近似、含并列校正），单侧检验 recent 是否整体大于 baseline"""
+    n1, n2 = len(baseline), len(recent)
+    if n1 == 0 or n2 == 0:
+        return 1.0
+    combined = sorted([(value, 0) for value in baseline] + [(value, 1) for value in recent])
+    rank_sum_recent = 0.0
+    tie_term = 0.0
+    index = 0
+    while index < len(combined):
+        end = index
+        while end + 1 < len(combined) and combined[end + 1][0] == combined[index][0]:
+            end += 1
+        average_rank = (index + end) / 2 + 1
+        tied = end - index + 1
+        tie_term += tied ** 3 - tied
+        rank_sum_recent += average_rank * sum(1 for k in range(index, end + 1) if combined[k][1] == 1)
+        index = end + 1
+    u_recent = rank_sum_recent - n2 * (n2 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))) if n > 1 else 0.0
+    if variance <= 0:
+        return 1.0
+    z = (u_recent - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def two_proportion_p(base_failures: int, base_total: int, recent_failures: int, recent_total: int) -> float:
+    """双比例 z 检验，单侧检验近期错误率是否高于基线"""
+    if base_total == 0 or recent_total == 0:
+        return 1.0
+    pooled = (base_failures + recent_failures) / (base_total + recent_total)
+    variance = pooled * (1 - pooled) * (1 / base_total + 1 / recent_total)
+    if variance <= 0:
+        return 1.0
+    z = (recent_failures / recent_total - base_failures / base_total) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """延迟分位数摘要（毫秒）"""
+    return {
+        "p50": percentile(latencies, 50) * 1000,
+        "p90": percentile(latencies, 90) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "max": max(latencies) * 1000 if latencies else 0.0
+    }
+
+
+def load_question_corpus(path: str) -> List[str]:
+    """读取问题语料: 每行一个问题，忽略空行和 # 开头的注释"""
+    with open(path, encoding='utf-8') as f:
+        questions = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    if not questions:
+        raise ValueError(f"语料文件中没有问题: {path}")
+    return questions
+
+
+def cache_schedule(corpus: List[str], rounds: int, seed: Optional[int] = None) -> List[int]:
+    """生成缓存测试的请求顺序: 每个问题出现 rounds 次，整体打乱但每个问题的首次出现保持语料顺序"""
+    rng = random.Random(seed)
+    order = list(range(len(corpus))) * rounds
+    rng.shuffle(order)
+    # 按首次出现的先后重新编号，使问题首次出现的顺序与语料一致
+    relabel: Dict[int, int] = {}
+    for index in order:
+        relabel.setdefault(index, len(relabel))
+    return [relabel[index] for index in order]
+
+
+def parse_log_timestamp(value: Any) -> Optional[float]:
+    """解析请求日志中的时间戳: Unix 秒数或 ISO 8601 字符串"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def iter_replay_log(path: str, default_student_id: str, default_format: str = "direct"):
+    """逐行读取请求日志 (JSONL)，产出带行号、稳定请求键和相对时间偏移的请求
+    
+    不会一次性载入文件。无法解析的行产出 {"line": n, "invalid": 原因}，由调用方计数。
+    """
+    first_ts = None
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"line": line_no, "invalid": f"JSON解析失败: {e}"}
+                continue
+            if not isinstance(record, dict) or not record.get("question"):
+                yield {"line": line_no, "invalid": "缺少 question 字段"}
+                continue
+            format_type = record.get("format", default_format)
+            if format_type not in PAYLOAD_FORMATS:
+                yield {"line": line_no, "invalid": f"未知的请求格式: {format_type}"}
+                continue
+            student_id = str(record.get("student_id", default_student_id))
+            ts = parse_log_timestamp(record.get("timestamp"))
+            if ts is not None and first_ts is None:
+                first_ts = ts
+            digest = hashlib.sha1(f"{record['question']}\0{student_id}\0{format_type}".encode('utf-8')).hexdigest()
+            yield {
+                "line": line_no,
+                "key": f"{line_no}:{digest[:12]}",
+                "question": str(record["question"]),
+                "student_id": student_id,
+                "format": format_type,
+                "offset": max(0.0, ts - first_ts) if ts is not None else None
+            }
+
+
+def _baseline_records(f) -> Iterator[Dict]:
+    """逐行读取结果文件中的单个结果: JSONL 每行一个结果，写入文件的 json 输出每行一个运行文档"""
+    parsed = False
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            if not parsed:
+                # 输出到终端的 json 文档是缩进格式，跨越多行，只能整体解析
+                f.seek(0)
+                yield from json.load(f).get("results", [])
+                return
+            raise ValueError(f"第 {number} 行不是合法的JSON")
+        parsed = True
+        if isinstance(record, dict) and isinstance(record.get("results"), list):
+            yield from record["results"]
+        elif isinstance(record, dict):
+            yield record
+
+
+def load_replay_baseline(path: str) -> Dict[str, Dict]:
+    """逐行读取之前回放运行的 JSON 或 JSONL 输出，返回 请求键 -> 单请求结果"""
+    baseline = {}
+    with open(path, encoding='utf-8') as f:
+        for record in _baseline_records(f):
+            details = record.get("details") or {}
+            if record.get("stage") == "replay-request" and details.get("key"):
+                baseline[details["key"]] = details
+    if not baseline:
+        raise ValueError(f"文件中没有回放结果: {path}")
+    return baseline
+
+
+class ReplayResults:
+    """回放的逐请求结果: 数值字段按列保存在 array 中（每个请求约55字节），TestResult 在索引或遍历时才构建
+    
+    请求键由行号和问题摘要重建；学生ID和错误信息去重后按编号保存。status_code 为 -1 表示没有收到响应
+    （此时 error 指向错误信息），response_bytes 为 -1 表示未读取响应体，lag_ms 为 nan 表示不按时间戳回放。
+    """
+    
+    __slots__ = ("line", "digest", "student", "format", "status_code", "response_bytes", "duration",
+                 "lag_ms", "finished", "error", "strings", "_string_index")
+    
+    def __init__(self):
+        self.line = array('I')
+        self.digest = array('Q')
+        self.student = array('I')
+        self.format = array('B')
+        self.status_code = array('h')
+        self.response_bytes = array('q')
+        self.duration = array('d')
+        self.lag_ms = array('d')
+        self.finished = array('d')
+        self.error = array('i')
+        self.strings: List[str] = []
+        self._string_index: Dict[str, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self.line)
+    
+    def __getitem__(self, index: int) -> TestResult:
+        details = self.details(index)
+        outcome = f"状态码 {details['status_code']}" if "status_code" in details else details["error"]
+        return TestResult(
+            test_name=f"回放 #{self.line[index]}",
+            status="PASS" if self.status_code[index] == 200 else "FAIL",
+            message=f"{outcome}, {details['latency_ms']:.0f}ms",
+            duration=self.duration[index],
+            details=details,
+            timestamp=datetime.fromtimestamp(self.finished[index]),
+            stage="replay-request"
+        )
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+    
+    def _intern(self, text: str) -> int:
+        index = self._string_index.get(text)
+        if index is None:
+            index = self._string_index[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+    
+    def append(self, entry: Dict, duration: float, lag_ms: Optional[float] = None,
+               status_code: Optional[int] = None, response_bytes: Optional[int] = None,
+               error: Optional[str] = None) -> int:
+        """记录一个回放请求（entry 来自 iter_replay_log），返回其编号；多线程调用时由调用方加锁"""
+        self.line.append(entry["line"])
+        self.digest.append(int(entry["key"].split(':', 1)[1], 16))
+        self.student.append(self._intern(entry["student_id"]))
+        self.format.append(PAYLOAD_FORMATS.index(entry["format"]))
+        self.status_code.append(-1 if status_code is None else status_code)
+        self.response_bytes.append(-1 if response_bytes is None else response_bytes)
+        self.duration.append(duration)
+        self.lag_ms.append(math.nan if lag_ms is None else lag_ms)
+        self.finished.append(time.time())
+        self.error.append(-1 if error is None else self._intern(error))
+        return len(self.line) - 1
+    
+    def sort(self):
+        """按日志行号排序"""
+        order = sorted(range(len(self)), key=self.line.__getitem__)
+        for name in ("line", "digest", "student", "format", "status_code", "response_bytes", "duration",
+                     "lag_ms", "finished", "error"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, (column[index] for index in order)))
+    
+    def key(self, index: int) -> str:
+        """请求键，与 iter_replay_log 产出的 key 相同"""
+        return f"{self.line[index]}:{self.digest[index]:012x}"
+    
+    def outcome_key(self, index: int) -> str:
+        """状态码，没有响应时为错误信息"""
+        code = self.status_code[index]
+        return str(code) if code >= 0 else self.strings[self.error[index]]
+    
+    def details(self, index: int) -> Dict:
+        """与逐请求 TestResult.details 相同的字典（回放基线文件读取的就是这些字段）"""
+        details = {
+            "key": self.key(index),
+            "line": self.line[index],
+            "student_id": self.strings[self.student[index]],
+            "format": PAYLOAD_FORMATS[self.format[index]]
+        }
+        lag = self.lag_ms[index]
+        if lag == lag:
+            details["lag_ms"] = lag
+        if self.status_code[index] >= 0:
+            details["status_code"] = self.status_code[index]
+        if self.response_bytes[index] >= 0:
+            details["response_bytes"] = self.response_bytes[index]
+        if self.error[index] >= 0:
+            details["error"] = self.strings[self.error[index]]
+        details["latency_ms"] = self.duration[index] * 1000
+        return details
+
+
+def make_question(length: int, charset: str = "chinese") -> str:
+    """生成指定字符数的测试问题"""
+    text = SCALING_TEXT[charset]
+    return (text * (length // len(text) + 1))[:length]
+
+
+def loglog_slope(points: List[Tuple[float, float]]) -> Optional[float]:
+    """对数坐标下的最小二乘斜率（规模指数），约为1时线性增长，明显大于1时超线性"""
+    points = [(math.log(x), math.log(y)) for x, y in points if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    denominator = sum((x - mean_x) ** 2 for x, _ in points)
+    if denominator == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / denominator
+
+
+def arrival_offsets(rate: float, duration: float, arrival: str = "constant",
+                    ramp_to: Optional[float] = None, seed: Optional[int] = None):
+    """生成开放模型的请求到达时间（相对开始时间的秒数）
+    
+    constant: 固定间隔; poisson: 指数分布间隔; ramp: 速率从 rate 线性变化到 ramp_to
+    """
+    rng = random.Random(seed)
+    offset = 0.0
+    while True:
+        current = rate
+        if arrival == "ramp" and ramp_to is not None and duration > 0:
+            current = rate + (ramp_to - rate) * offset / duration
+        if current <= 0:
+            return
+        if arrival == "poisson":
+            offset += rng.expovariate(current)
+        else:
+            offset += 1 / current
+        if offset >= duration:
+            return
+        yield offset
+
+
+def parse_limit_spec(spec: str, with_burst: bool = False) -> Dict[str, Any]:
+    """解析限流规格 "chat=2/5,*=20": 键为端点类别 (chat/api/other) 或 *（所有请求），
+    值为速率 req/s（with_burst 时可带 /突发容量）或在途请求数"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        key, _, value = item.partition('=')
+        key = key.strip()
+        if key not in ENDPOINT_CLASSES + ('*',) or not value:
+            raise ValueError(f"无效的限流项: {item} (类别: {', '.join(ENDPOINT_CLASSES)}, *)")
+        if with_burst:
+            rate, _, burst = value.partition('/')
+            limits[key] = (float(rate), float(burst) if burst else None)
+            if limits[key][0] <= 0:
+                raise ValueError(f"限流速率必须大于0: {item}")
+        else:
+            limits[key] = int(value)
+            if limits[key] < 1:
+                raise ValueError(f"在途请求上限至少为1: {item}")
+    return limits
+
+
+class TokenBucket:
+    """令牌桶: 允许令牌为负（预约），每个调用者得到各自的发送时刻，先到先得"""
+    
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    def reserve(self) -> float:
+        """取一个令牌，返回需要等待的秒数（调用方持有锁）"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter:
+    """客户端限流: 按端点类别的令牌桶和在途请求上限，* 同时作用于所有请求
+    
+    等待令牌或在途名额时阻塞调用方（背压），不会在内部排队；累计各类别被限流的时间。
+    单个请求的等待由 ThrottledAdapter 附在响应（或异常）上，见 throttle_wait。
+    """
+    
+    def __init__(self, chat_endpoint: str, rates: Optional[Dict[str, Tuple[float, Optional[float]]]] = None,
+                 concurrency: Optional[Dict[str, int]] = None):
+        self.chat_endpoint = chat_endpoint
+        self.chat_path = chat_endpoint.split('://', 1)[-1].split('/', 1)[-1]
+        self.rates = rates or {}
+        self.concurrency = concurrency or {}
+        self.buckets = {key: TokenBucket(rate, burst) for key, (rate, burst) in self.rates.items()}
+        self.slots = {key: threading.BoundedSemaphore(limit) for key, limit in self.concurrency.items()}
+        self.lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, float]] = {}
+    
+    def classify(self, url: str) -> str:
+        path = url.split('://', 1)[-1].split('/', 1)[-1].split('?')[0]
+        if path.rstrip('/') == self.chat_path.rstrip('/'):
+            return "chat"
+        return "api" if path.startswith("api/") or path == "api" else "other"
+    
+    def reserve(self, key: str) -> float:
+        """从类别桶和全局桶各取一个令牌，返回需要等待的秒数"""
+        with self.lock:
+            return max([bucket.reserve() for name, bucket in self.buckets.items() if name in (key, '*')] or [0.0])
+    
+    def record(self, key: str, waited: float):
+        with self.lock:
+            stats = self.stats.setdefault(key, {"requests": 0, "throttled": 0, "throttled_s": 0.0, "max_wait_s": 0.0})
+            stats["requests"] += 1
+            if waited > 0.0005:
+                stats["throttled"] += 1
+                stats["throttled_s"] += waited
+                stats["max_wait_s"] = max(stats["max_wait_s"], waited)
+    
+    def acquire(self, url: str) -> Tuple[str, float]:
+        """阻塞直到获得令牌和在途名额，返回 (端点类别, 等待秒数)"""
+        key = self.classify(url)
+        started = time.perf_counter()
+        delay = self.reserve(key)
+        if delay > 0:
+            time.sleep(delay)
+        # 固定顺序获取在途名额，避免死锁
+        for name in (key, '*'):
+            if name in self.slots:
+                self.slots[name].acquire()
+        waited = time.perf_counter() - started
+        self.record(key, waited)
+        return key, waited
+    
+    def release(self, key: str):
+        for name in ('*', key):
+            if name in self.slots:
+                self.slots[name].release()
+    
+    def max_in_flight(self, key: str) -> Optional[int]:
+        limits = [limit for name, limit in self.concurrency.items() if name in (key, '*')]
+        return min(limits) if limits else None
+    
+    def split_concurrency(self, weights: List[float]) -> List[Dict[str, int]]:
+        """按权重把各在途上限拆成 len(weights) 份，每个类别各份之和恰好等于原上限"""
+        parts = {key: split_limit(limit, weights) for key, limit in self.concurrency.items()}
+        return [{key: values[index] for key, values in parts.items()} for index in range(len(weights))]
+    
+    def to_spec(self, share: float = 1.0, concurrency: Optional[Dict[str, int]] = None) -> Dict:
+        """导出配置，share 为该份额占总预算的比例（多进程/多代理时按份额分配速率），
+        concurrency 为该份额的在途上限（由 split_concurrency 拆分），默认为完整上限"""
+        return {
+            "chat_endpoint": self.chat_endpoint,
+            "rates": {key: (rate * share, burst * share if burst is not None else None)
+                      for key, (rate, burst) in self.rates.items()},
+            "concurrency": dict(self.concurrency if concurrency is None else concurrency)
+        }
+    
+    @classmethod
+    def from_spec(cls, spec: Dict) -> 'RateLimiter':
+        return cls(spec["chat_endpoint"], {key: tuple(value) for key, value in spec["rates"].items()},
+                   spec["concurrency"])
+    
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {key: dict(stats) for key, stats in self.stats.items()}
+
+
+class ThrottledAdapter(requests.adapters.HTTPAdapter):
+    """在发送前经过 RateLimiter 的 HTTPAdapter，会话中的所有请求都受限流约束
+    
+    在途名额在收到响应头后释放；流式响应体的读取不占用名额。
+    """
+    
+    def __init__(self, limiter: RateLimiter, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+    
+    def send(self, request, **kwargs):
+        key, waited = self.limiter.acquire(request.url)
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as e:
+            e.throttle_wait = waited
+            raise
+        finally:
+            self.limiter.release(key)
+        response.throttle_wait = waited
+        return response
+
+
+def throttle_wait(outcome: Any) -> float:
+    """请求在客户端限流中等待的秒数: outcome 为响应（包括重定向经过的响应）或请求抛出的异常"""
+    history = getattr(outcome, 'history', None) or []
+    return sum(getattr(item, 'throttle_wait', 0.0) for item in [*history, outcome])
+
+
+RETRY_STATUS = (429, 502, 503, 504)
+
+
+class RetryPolicy:
+    """重试策略: 超时、连接错误和 429/502/503/504 按指数退避加全抖动 (full jitter) 重试
+    
+    第 n 次重试前等待 [0, min(max_backoff, backoff * 2^n)] 内的随机时间；
+    服务端给出 Retry-After 时至少等待该时间（不超过 max_backoff）。
+    """
+    
+    def __init__(self, retries: int = 0, backoff: float = 0.5, max_backoff: float = 8.0,
+                 seed: Optional[int] = None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "recovered": 0, "exhausted": 0,
+                      "backoff_s": 0.0, "reasons": {}}
+    
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """第 attempt 次失败后的等待秒数（attempt 从0开始）"""
+        delay = self.random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        try:
+            delay = max(delay, min(self.max_backoff, float(retry_after)))
+        except (TypeError, ValueError):
+            pass
+        return delay
+    
+    def record_retry(self, reason: str, delay: float):
+        with self.lock:
+            self.stats["retries"] += 1
+            self.stats["backoff_s"] += delay
+            self.stats["reasons"][reason] = self.stats["reasons"].get(reason, 0) + 1
+    
+    def record_outcome(self, attempts: int, ok: bool):
+        """记录一个请求的最终结果: ok 为最后一次尝试是否得到了非重试类的响应"""
+        with self.lock:
+            self.stats["requests"] += 1
+            if attempts > 1 and ok:
+                self.stats["recovered"] += 1
+            elif not ok:
+                self.stats["exhausted"] += 1
+    
+    def to_spec(self) -> Dict:
+        return {"retries": self.retries, "backoff": self.backoff, "max_backoff": self.max_backoff,
+                "seed": self.seed}
+    
+    @classmethod
+    def from_spec(cls, spec: Dict) -> 'RetryPolicy':
+        return cls(**spec)
+    
+    def summary(self) -> Dict:
+        with self.lock:
+            return {**self.stats, "reasons": dict(self.stats["reasons"])}
+
+
+def merge_retry_stats(items: List[Dict]) -> Dict:
+    """合并多个 RetryPolicy.summary()"""
+    merged = {"requests": 0, "retries": 0, "recovered": 0, "exhausted": 0, "backoff_s": 0.0, "reasons": {}}
+    for item in items:
+        for name in ("requests", "retries", "recovered", "exhausted", "backoff_s"):
+            merged[name] += item[name]
+        for reason, count in item["reasons"].items():
+            merged["reasons"][reason] = merged["reasons"].get(reason, 0) + count
+    return merged
+
+
+class RequestHedger:
+    """对冲请求: 请求超过对冲延迟仍未完成时再发送一个副本，采用先返回的结果
+    
+    对冲延迟默认取成功主请求延迟的 p95（样本不足 min_samples 时不对冲），也可固定为 delay_ms。
+    成功的主请求无论输赢都记录其完整耗时，作为不对冲时的延迟；与实际采用的成功结果的延迟对比，
+    即可得到对冲消除的尾延迟，副本数即额外的后端负载。异常、5xx 和 429 不算完成:
+    另一个请求仍在进行时继续等待它，两个都失败才返回失败结果。
+    """
+    
+    def __init__(self, delay_ms: Optional[float] = None, quantile: float = 95.0,
+                 min_samples: int = 20, concurrency: int = 10):
+        self.delay_ms = delay_ms
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.unhedged = LatencyHistogram(LOAD_BUCKETS_MS)
+        self.hedged = LatencyHistogram(LOAD_BUCKETS_MS)
+        self.counts = {"requests": 0, "hedges": 0, "backup_wins": 0, "errors": 0, "primary_errors": 0}
+        self.lock = threading.Lock()
+        # 每个在途请求最多占用主请求和副本两个线程，线程按需创建
+        self.executor = ThreadPoolExecutor(max_workers=2 * max(1, concurrency), thread_name_prefix="hedge")
+    
+    def delay(self) -> Optional[float]:
+        """当前的对冲延迟（秒），None 表示暂不对冲"""
+        if self.delay_ms is not None:
+            return self.delay_ms / 1000
+        with self.lock:
+            if self.unhedged.count < self.min_samples:
+                return None
+            return self.unhedged.percentile(self.quantile)
+    
+    @staticmethod
+    def succeeded(future) -> bool:
+        """请求是否得到了可采用的结果: 没有异常，且不是 5xx 或 429"""
+        if future.exception() is not None:
+            return False
+        status_code = future.result()[0].status_code
+        return status_code < 500 and status_code not in RETRY_STATUS
+    
+    def _record_primary(self, started: float, future):
+        """记录主请求的完整耗时；失败的主请求不计入，避免快速失败拉低对冲延迟"""
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            if self.succeeded(future):
+                self.unhedged.record(elapsed)
+            else:
+                self.counts["primary_errors"] += 1
+    
+    @staticmethod
+    def _discard(future):
+        """关闭落选请求的响应，把连接还给连接池"""
+        if not future.cancelled() and future.exception() is None:
+            future.result()[0].close()
+    
+    def run(self, send: Callable[[], Tuple[requests.Response, Dict]]) -> Tuple[requests.Response, Dict]:
+        """执行 send（返回 (response, timing)），必要时发送副本，返回先完成的结果
+        
+        返回的 timing 中 total_ms 为从发出主请求到采用结果的耗时，hedged 表示是否发送了副本，
+        hedge_won 表示采用的是副本。两个请求都失败时返回收到的错误响应（优先主请求），
+        都没有响应时抛出主请求的异常。
+        """
+        started = time.perf_counter()
+        delay = self.delay()
+        primary = self.executor.submit(send)
+        primary.add_done_callback(lambda future: self._record_primary(started, future))
+        futures = [primary]
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            futures.append(self.executor.submit(send))
+        winner = None
+        pending = set(futures)
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [future for future in futures if future in done and self.succeeded(future)]
+            if succeeded:
+                winner = succeeded[0]
+        elapsed = time.perf_counter() - started
+        ok = winner is not None
+        if winner is None:
+            answered = [future for future in futures if future.exception() is None]
+            winner = answered[0] if answered else None
+        for future in futures:
+            if future is not winner:
+                future.add_done_callback(self._discard)
+        with self.lock:
+            self.counts["requests"] += 1
+            self.counts["hedges"] += len(futures) - 1
+            if ok:
+                self.counts["backup_wins"] += winner is not primary
+                self.hedged.record(elapsed)
+            else:
+                self.counts["errors"] += 1
+        if winner is None:
+            raise primary.exception()
+        response, timing = winner.result()
+        timing = dict(timing)
+        timing["total_ms"] = elapsed * 1000 - timing.get("throttle_ms", 0.0)
+        timing["hedged"] = len(futures) > 1
+        timing["hedge_won"] = winner is not primary
+        return response, timing
+    
+    def to_spec(self) -> Dict:
+        return {"delay_ms": self.delay_ms, "quantile": self.quantile, "min_samples": self.min_samples}
+    
+    @classmethod
+    def from_spec(cls, spec: Dict) -> 'RequestHedger':
+        return cls(**spec)
+    
+    def snapshot(self) -> Dict:
+        """可序列化、可合并的统计（直方图为字典）"""
+        with self.lock:
+            return {**self.counts, "unhedged": self.unhedged.to_dict(), "hedged": self.hedged.to_dict()}
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def hedge_summary(snapshots: List[Dict]) -> Dict:
+    """合并 RequestHedger.snapshot() 并计算对冲的收益 (尾延迟) 与代价 (额外请求)"""
+    unhedged = LatencyHistogram(LOAD_BUCKETS_MS)
+    hedged = LatencyHistogram(LOAD_BUCKETS_MS)
+    counts = {"requests": 0, "hedges": 0, "backup_wins": 0, "errors": 0, "primary_errors": 0}
+    for snapshot in snapshots:
+        for name in counts:
+            counts[name] += snapshot[name]
+        unhedged.merge(LatencyHistogram.from_dict(snapshot["unhedged"]))
+        hedged.merge(LatencyHistogram.from_dict(snapshot["hedged"]))
+    before = unhedged.summary()
+    after = hedged.summary()
+    return {
+        **counts,
+        "extra_load": counts["hedges"] / counts["requests"] if counts["requests"] else 0.0,
+        # 主请求仍在进行中（落选且尚未返回）的数量，它们的耗时未计入不对冲延迟
+        "pending_primaries": max(0, counts["requests"] - unhedged.count - counts["primary_errors"]),
+        "unhedged_ms": before,
+        "hedged_ms": after,
+        "saved_ms": {key: before[key] - after[key] for key in ("p50", "p90", "p99", "max")}
+    }
+
+
+def jwt_expiry(token: str) -> Optional[float]:
+    """读取 JWT 载荷中的 exp（Unix 时间戳），不校验签名；无法解析时返回 None"""
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+@dataclass
+class Account:
+    """测试账号: 登录标识、密码、对应的学生ID和当前令牌"""
+    identifier: str
+    password: str
+    student_id: Optional[str] = None
+    token: Optional[str] = None
+    expires_at: Optional[float] = None
+
+
+def load_accounts(path: str) -> List[Account]:
+    """读取测试账号文件: 每行 identifier,password[,student_id]，空行和 # 开头的行忽略"""
+    accounts = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        lines = (line for line in f if line.strip() and not line.lstrip().startswith('#'))
+        for row in csv.reader(lines):
+            if len(row) < 2 or not row[0].strip():
+                raise ValueError(f"账号格式应为 identifier,password[,student_id]: {','.join(row)}")
+            student_id = row[2].strip() if len(row) > 2 and row[2].strip() else None
+            accounts.append(Account(row[0].strip(), row[1], student_id))
+    if not accounts:
+        raise ValueError(f"账号文件中没有账号: {path}")
+    return accounts
+
+
+class AccountPool:
+    """测试账号池: 通过 /api/auth/local 登录获取 JWT，缓存到磁盘，并在过期前后台刷新
+    
+    令牌按 (登录地址, 账号) 缓存，距过期不足 refresh_margin 秒时重新登录。虚拟用户按编号轮流
+    分配身份，每次请求读取账号的当前令牌，后台刷新后立即生效，测试过程中不会因登录而阻塞。
+    """
+    
+    # 令牌中没有 exp 时假定的有效期（秒）
+    DEFAULT_TTL = 3600.0
+    
+    def __init__(self, auth_url: str, accounts: List[Account], cache_path: Optional[str] = None,
+                 refresh_margin: float = 300.0, timeout: float = 10.0):
+        self.auth_url = auth_url
+        self.accounts = accounts
+        # 已取得有效令牌的账号，ensure() 之后才可分配
+        self.active: List[Account] = []
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.stats = {"cached": 0, "logins": 0, "refreshes": 0, "failures": 0}
+        self.errors: Dict[str, str] = {}
+        self._stop = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+    
+    def _cache_key(self, account: Account) -> str:
+        return f"{self.auth_url}|{account.identifier}"
+    
+    def _read_cache(self) -> Dict[str, Dict]:
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("tokens", {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+    
+    def _write_cache(self):
+        """合并写回缓存文件（保留其他后端和账号的令牌，丢弃已过期的），文件权限为 0600"""
+        if not self.cache_path:
+            return
+        tokens = self._read_cache()
+        with self.lock:
+            for account in self.accounts:
+                if account.token is not None:
+                    tokens[self._cache_key(account)] = {"jwt": account.token, "expires_at": account.expires_at}
+        now = time.time()
+        tokens = {key: entry for key, entry in tokens.items() if entry.get("expires_at", 0) > now}
+        temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"tokens": tokens}, f, ensure_ascii=False)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"{Colors.YELLOW}⚠ 无法写入令牌缓存 {self.cache_path}: {e}{Colors.END}", file=sys.stderr)
+    
+    def login(self, account: Account) -> bool:
+        """通过 /api/auth/local 登录，成功时更新账号的令牌和过期时间"""
+        token = None
+        try:
+            response = self.session.post(self.auth_url, json={"identifier": account.identifier,
+                                                              "password": account.password},
+                                         timeout=self.timeout)
+            body = response.json() if response.status_code == 200 else None
+            token = body.get("jwt") if isinstance(body, dict) else None
+            error = None if token else f"登录失败 (状态码: {response.status_code})"
+        except (requests.exceptions.RequestException, ValueError) as e:
+            error = f"登录失败: {e}"
+        with self.lock:
+            if not token:
+                self.stats["failures"] += 1
+                self.errors[account.identifier] = error
+                return False
+            self.stats["refreshes" if account.token is not None else "logins"] += 1
+            account.token = token
+            account.expires_at = jwt_expiry(token) or time.time() + self.DEFAULT_TTL
+            self.errors.pop(account.identifier, None)
+        return True
+    
+    def _expiring(self, account: Account) -> bool:
+        return account.token is None or account.expires_at - time.time() < self.refresh_margin
+    
+    def ensure(self, max_workers: int = 8) -> int:
+        """读取磁盘缓存，为没有令牌或即将过期的账号登录，返回可用账号数"""
+        cached = self._read_cache()
+        for account in self.accounts:
+            entry = cached.get(self._cache_key(account))
+            if account.token is None and entry:
+                account.token, account.expires_at = entry["jwt"], entry["expires_at"]
+                if not self._expiring(account):
+                    self.stats["cached"] += 1
+        stale = [account for account in self.accounts if self._expiring(account)]
+        if stale:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(stale))) as executor:
+                list(executor.map(self.login, stale))
+            self._write_cache()
+        now = time.time()
+        self.active = [account for account in self.accounts
+                       if account.token is not None and account.expires_at > now]
+        return len(self.active)
+    
+    def identity(self, index: int) -> Account:
+        """第 index 个虚拟用户使用的账号"""
+        return self.active[index % len(self.active)]
+    
+    def refresh_due(self):
+        """重新登录即将过期的账号"""
+        refreshed = [account for account in self.active if self._expiring(account) and self.login(account)]
+        if refreshed:
+            self._write_cache()
+    
+    def start(self, interval: Optional[float] = None):
+        """启动后台刷新线程（守护线程，stop() 结束）"""
+        if self._refresher is not None:
+            return
+        interval = interval or max(1.0, min(60.0, self.refresh_margin / 4))
+        
+        def run():
+            while not self._stop.wait(interval):
+                self.refresh_due()
+        
+        self._refresher = threading.Thread(target=run, name="token-refresh", daemon=True)
+        self._refresher.start()
+    
+    def stop(self):
+        self._stop.set()
+        self.session.close()
+    
+    def to_spec(self, offset: int = 0) -> Dict:
+        """导出可用账号及其令牌，轮转 offset 位，使分片的第0个虚拟用户对应全局第 offset 个"""
+        offset %= max(1, len(self.active))
+        accounts = self.active[offset:] + self.active[:offset]
+        return {"auth_url": self.auth_url, "refresh_margin": self.refresh_margin,
+                "accounts": [asdict(account) for account in accounts]}
+    
+    @classmethod
+    def from_spec(cls, spec: Dict) -> 'AccountPool':
+        """由 to_spec 的结果重建（子进程和负载代理使用，只在内存中保存令牌）"""
+        pool = cls(spec["auth_url"], [Account(**account) for account in spec["accounts"]],
+                   refresh_margin=spec["refresh_margin"])
+        pool.active = list(pool.accounts)
+        return pool
+    
+    def summary(self) -> Dict:
+        with self.lock:
+            return {"accounts": len(self.accounts), "active": len(self.active), **self.stats,
+                    "errors": dict(self.errors)}
+
+
+@dataclass
+class Stage:
+    """诊断阶段: 所有 depends 中的阶段完成后才会执行"""
+    name: str
+    func: Callable[[], Any]
+    depends: Tuple[str, ...] = ()
+
+
+def run_stages(stages: List[Stage], max_workers: int = 4) -> Dict[str, Any]:
+    """按依赖关系调度诊断阶段，互不依赖的阶段并发执行，返回 {阶段名: 结果}"""
+    results: Dict[str, Any] = {}
+    pending = list(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while pending or running:
+            ready = [stage for stage in pending if all(dep in results for dep in stage.depends)]
+            for stage in ready:
+                pending.remove(stage)
+                running[executor.submit(stage.func)] = stage.name
+            if not running:
+                raise ValueError(f"无法满足的阶段依赖: {[stage.name for stage in pending]}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    return results
 
 
 class LLMConnectionTester:
     """LLM连接测试器主类"""
     
     def __init__(self, backend_url: str, token: Optional[str] = None, 
-                 student_id: str = "123", verbose: bool = False):
+                 student_id: str = "123", verbose: bool = False,
+                 pool_size: int = 10, keep_alive: bool = True,
+                 cheap_endpoint_probe: bool = False, parallel: bool = True,
+                 stream: bool = False, engine: str = "thread",
+                 limiter: Optional[RateLimiter] = None, timeout: float = 30.0,
+                 retry: Optional[RetryPolicy] = None, hedger: Optional[RequestHedger] = None,
+                 accounts: Optional[AccountPool] = None):
         self.backend_url = backend_url.rstrip('/')
         self.token = token
         self.student_id = student_id
@@ -61,7 +2246,188 @@ class LLMConnectionTester:
         self.results: List[TestResult] = []
         self.api_base = f"{self.backend_url}/api"
         self.chat_endpoint = f"{self.api_base}/student-portraits/chat"
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.cheap_endpoint_probe = cheap_endpoint_probe
+        self.parallel = parallel
+        self.stream = stream
+        # 负载测试的并发引擎: thread 每个在途请求一个线程, async 单线程协程
+        self.engine = engine
+        # 客户端限流，None 表示不限流
+        self.limiter = limiter
+        # 聊天请求超时（秒）、重试策略和对冲，None 表示不重试/不对冲
+        self.timeout = timeout
+        self.retry = retry
+        self.hedger = hedger
+        # 测试账号池，负载测试的虚拟用户按编号分配身份
+        self.accounts = accounts
+        self._lock = threading.Lock()
+        self.session = self._create_session()
+        self.started_at = datetime.now()
+        # 本次运行中各请求格式的已解析响应体，供响应结构验证复用
+        self.responses: Dict[str, Any] = {}
+        # 会触发模型推理的聊天请求次数
+        self.chat_calls = 0
+        # 逐请求样本，提供时负载测试和持续监控把每个请求记入其中，运行结束后统计导出
+        self.samples: Optional[SampleLog] = None
+        # 回放的逐请求结果（列式保存），输出时排在 self.results 之前
+        self.replay_results: Optional[ReplayResults] = None
+    
+    @classmethod
+    def from_shard_config(cls, config: Dict, **kwargs) -> 'LLMConnectionTester':
+        """由 _shard_config 生成的配置创建测试器（子进程和负载代理使用）"""
+        config = dict(config)
+        spec = config.pop("limiter", None)
+        retry = config.pop("retry", None)
+        hedger = config.pop("hedger", None)
+        accounts = config.pop("accounts", None)
+        accounts = AccountPool.from_spec(accounts) if accounts else None
+        samples = config.pop("samples", False)
+        if hedger and "pool_size" in kwargs:
+            hedger = {**hedger, "concurrency": kwargs["pool_size"]}
+            kwargs["pool_size"] *= 2
+        if accounts is not None:
+            accounts.start()
+        tester = cls(limiter=RateLimiter.from_spec(spec) if spec else None,
+                     retry=RetryPolicy.from_spec(retry) if retry else None,
+                     hedger=RequestHedger.from_spec(hedger) if hedger else None,
+                     accounts=accounts, **config, **kwargs)
+        if samples:
+            tester.samples = SampleLog()
+        return tester
+    
+    def _create_session(self) -> requests.Session:
+        """创建共享的HTTP会话（连接池 + keep-alive），所有探测复用同一批连接"""
+        session = requests.Session()
+        if self.limiter is not None:
+            adapter = ThrottledAdapter(self.limiter, pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        else:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.pool_size,
+                pool_maxsize=self.pool_size
+            )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+    
+    def build_summary(self, results: Iterable[TestResult], mode: str,
+                      started_at: Optional[datetime] = None) -> Dict:
+        """构建运行摘要（用于机器可读输出）"""
+        return {
+            "run_id": uuid.uuid4().hex,
+            "mode": mode,
+            "backend_url": self.backend_url,
+            "chat_endpoint": self.chat_endpoint,
+            "student_id": self.student_id,
+            "stream": self.stream,
+            "started_at": (started_at or self.started_at).isoformat(),
+            "finished_at": datetime.now().isoformat(),
+            "chat_calls": self.chat_calls,
+            **({"throttle": self.limiter.summary()} if self.limiter is not None else {}),
+            **({"retry": self.retry.summary()} if self.retry is not None else {}),
+            **({"hedge": hedge_summary([self.hedger.snapshot()])} if self.hedger is not None else {}),
+            **({"accounts": self.accounts.summary()} if self.accounts is not None else {}),
+            **summarize_results(results)
+        }
+    
+    def iter_results(self) -> Iterator[TestResult]:
+        """按输出顺序产出本次运行的全部结果，回放的逐请求结果在遍历时才构建"""
+        if self.replay_results is not None:
+            yield from self.replay_results
+        yield from self.results
+    
+    def close(self):
+        """关闭会话并释放连接池"""
+        if self.hedger is not None:
+            self.hedger.close()
+        if self.accounts is not None:
+            self.accounts.stop()
+        self.session.close()
+    
+    def _measure_handshake(self, url: str) -> Optional[Dict]:
+        """在临时套接字上测量到 url 的握手各阶段耗时（毫秒），失败时返回 None"""
+        try:
+            return measure_handshake(url, verify=self.session.verify is not False)
+        except (OSError, ValueError) as e:
+            self.log(f"握手测量失败: {e}")
+            return None
+    
+    def timed_request(self, method: str, url: str, **kwargs) -> Tuple[requests.Response, Dict]:
+        """通过共享会话发送请求，返回 (response, 时间分解)
+        
+        使用单调高精度时钟 (perf_counter) 记录首字节和下载各阶段（毫秒），total_ms 为整个请求耗时。
+        诊断探测传入 phases=True 时，另外在一个临时套接字上测量新建连接的 DNS、TCP连接和 TLS 耗时
+        （不计入 total_ms，也不触碰连接池）；负载请求不测量。调用方传入 stream=True 时不读取响应体，download_ms 为 None，
+        由调用方在读取完成后补充；否则响应体由 BoundedBody 增量读取并保存在 response.body
+        （只保留前 body_limit 个字符和 JSON 骨架，为 0 时只计字节数），不缓冲完整响应体。
+        """
+        stream = kwargs.pop('stream', False)
+        body_limit = kwargs.pop('body_limit', STREAM_BODY_LIMIT)
+        handshake = self._measure_handshake(url) if kwargs.pop('phases', False) else None
+        timing: Dict[str, Any] = {"dns_ms": None, "connect_ms": None, "tls_ms": None,
+                                  "ttfb_ms": None, "download_ms": None}
+        if handshake is not None:
+            timing.update(handshake)
+        start_time = sent_at = time.perf_counter()
+        response = self.session.request(method, url, stream=True, **kwargs)
+        throttled = throttle_wait(response)
+        timing["ttfb_ms"] = (time.perf_counter() - sent_at - throttled) * 1000
+        if not stream:
+            received_at = time.perf_counter()
+            response.body = BoundedBody.read(response, body_limit)
+            timing["download_ms"] = (time.perf_counter() - received_at) * 1000
+        timing["total_ms"] = (time.perf_counter() - start_time - throttled) * 1000
+        if throttled:
+            timing["throttle_ms"] = throttled * 1000
+        timing["handshake_ms"] = (sum(timing[key] for key in ("dns_ms", "connect_ms", "tls_ms"))
+                                  if handshake is not None else None)
+        self.log(f"{method} {url} 时间分解: {format_timing(timing)}")
+        return response, timing
+    
+    def send_request(self, method: str, url: str, **kwargs) -> Tuple[requests.Response, Dict]:
+        """按重试策略和对冲设置发送请求，返回最终的 (response, 时间分解)
         
+        对冲只用于聊天接口。发生重试时 timing 中 attempts 为尝试次数，retry_wait_ms 为退避等待，
+        total_ms 覆盖所有尝试和退避（扣除限流等待）；各阶段耗时为最后一次尝试的值。
+        """
+        retries = self.retry.retries if self.retry is not None else 0
+        hedge = self.hedger is not None and url == self.chat_endpoint
+        started = time.perf_counter()
+        backoff = 0.0
+        throttled = 0.0
+        for attempt in range(retries + 1):
+            try:
+                if hedge:
+                    response, timing = self.hedger.run(lambda: self.timed_request(method, url, **kwargs))
+                else:
+                    response, timing = self.timed_request(method, url, **kwargs)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if attempt >= retries:
+                    if self.retry is not None:
+                        self.retry.record_outcome(attempt + 1, False)
+                    raise
+                reason = "timeout" if isinstance(e, requests.exceptions.Timeout) else "connection"
+                delay = self.retry.delay(attempt)
+            else:
+                throttled += timing.get("throttle_ms", 0.0) / 1000
+                if attempt >= retries or response.status_code not in RETRY_STATUS:
+                    if self.retry is not None:
+                        self.retry.record_outcome(attempt + 1, response.status_code not in RETRY_STATUS)
+                    if attempt:
+                        timing["attempts"] = attempt + 1
+                        timing["retry_wait_ms"] = backoff * 1000
+                        timing["total_ms"] = (time.perf_counter() - started - throttled) * 1000
+                    return response, timing
+                reason = str(response.status_code)
+                delay = self.retry.delay(attempt, response.headers.get('Retry-After'))
+                response.close()
+            self.retry.record_retry(reason, delay)
+            self.log(f"{method} {url} 第 {attempt + 1} 次尝试失败 ({reason})，{delay:.2f}s 后重试")
+            time.sleep(delay)
+            backoff += delay
+    
     def log(self, message: str, level: str = "INFO"):
         """日志输出"""
         if self.verbose or level in ["ERROR", "WARN"]:
@@ -85,22 +2451,59 @@ class LLMConnectionTester:
         print(f"\n{Colors.BOLD}{text}{Colors.END}")
         print(f"{'-'*70}")
     
+    def build_headers(self) -> Dict[str, str]:
+        """构建聊天请求头"""
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        return headers
+    
+    def build_payload(self, question: str, format_type: str = "direct",
+                      student_id: Optional[str] = None) -> Dict:
+        """构建聊天请求体 (direct: 直接格式, wrapped: Strapi v5包装格式)"""
+        data = {
+            "question": question,
+            "student_id": student_id if student_id is not None else self.student_id
+        }
+        if format_type == "wrapped":
+            return {"data": data}
+        return data
+    
+    def identity_request(self, payload: Dict, headers: Dict[str, str], index: int) -> Tuple[Dict, Dict[str, str]]:
+        """第 index 个虚拟用户的 (请求体, 请求头): 配置账号池时换成该用户账号的令牌和学生ID"""
+        if self.accounts is None:
+            return payload, headers
+        account = self.accounts.identity(index)
+        headers = {**headers, 'Authorization': f'Bearer {account.token}'}
+        if account.student_id is not None:
+            if "data" in payload:
+                payload = {"data": {**payload["data"], "student_id": account.student_id}}
+            else:
+                payload = {**payload, "student_id": account.student_id}
+        return payload, headers
+    
     def test_server_connectivity(self) -> TestResult:
         """测试1: 服务器连通性"""
         self.log(f"测试服务器连通性: {self.backend_url}")
-        start_time = time.time()
         
         try:
-            response = requests.get(self.backend_url, timeout=10)
-            duration = time.time() - start_time
+            response, timing = self.timed_request('GET', self.backend_url, timeout=10, phases=True)
+            handshake_ms = timing["handshake_ms"]
+            duration = (timing["ttfb_ms"] + timing["download_ms"]) / 1000
             
             if response.status_code < 500:
+                handshake_text = f"握手: {handshake_ms:.1f}ms, " if handshake_ms is not None else ""
                 return TestResult(
                     test_name="服务器连通性",
                     status="PASS",
-                    message=f"服务器可达 (响应时间: {duration*1000:.0f}ms, 状态码: {response.status_code})",
+                    message=f"服务器可达 ({handshake_text}响应时间: {duration*1000:.0f}ms, 状态码: {response.status_code})",
                     duration=duration,
-                    details={"status_code": response.status_code, "response_time_ms": duration*1000}
+                    details={
+                        "status_code": response.status_code,
+                        "response_time_ms": duration*1000,
+                        "handshake_ms": handshake_ms,
+                        "timing": timing
+                    }
                 )
             else:
                 return TestResult(
@@ -108,7 +2511,7 @@ class LLMConnectionTester:
                     status="FAIL",
                     message=f"服务器返回错误 (状态码: {response.status_code})",
                     duration=duration,
-                    details={"status_code": response.status_code, "error": response.text[:200]}
+                    details={"status_code": response.status_code, "error": response.body.text[:200], "timing": timing}
                 )
                 
         except requests.exceptions.Timeout:
@@ -143,7 +2546,7 @@ class LLMConnectionTester:
         
         try:
             # 尝试OPTIONS请求检查端点
-            response = requests.options(self.chat_endpoint, headers=headers, timeout=10)
+            response = self.session.options(self.chat_endpoint, headers=headers, timeout=10)
             
             if response.status_code == 404:
                 return TestResult(
@@ -154,8 +2557,18 @@ class LLMConnectionTester:
                 )
             
             # 尝试POST请求（可能会因为缺少数据而失败，但至少能确认端点存在）
-            test_data = {"question": "test"}
-            response = requests.post(self.chat_endpoint, json=test_data, headers=headers, timeout=10)
+            if self.cheap_endpoint_probe:
+                # 轻量探测发送无法解析的JSON，后端在解析请求体时即返回4xx，不会调用模型
+                response, timing = self.timed_request('POST', self.chat_endpoint, data=CHEAP_PROBE_BODY,
+                                                      headers={**headers, 'Content-Type': 'application/json'},
+                                                      timeout=10, phases=True)
+            else:
+                response, timing = self.timed_request('POST', self.chat_endpoint, json={"question": "test"},
+                                                      headers=headers, timeout=10, phases=True)
+            # 4xx 在调用模型之前就被拒绝（路由、认证或参数校验），不计为聊天调用
+            if response.status_code < 400:
+                with self._lock:
+                    self.chat_calls += 1
             
             if response.status_code == 404:
                 return TestResult(
@@ -164,12 +2577,25 @@ class LLMConnectionTester:
                     message=f"端点不存在 (404): {self.chat_endpoint}",
                     details={"status_code": 404, "endpoint": self.chat_endpoint}
                 )
+            elif self.cheap_endpoint_probe and not 400 <= response.status_code < 500:
+                return TestResult(
+                    test_name="端点存在性",
+                    status="WARN",
+                    message=f"端点存在，但无效请求体未被拒绝 (状态码: {response.status_code}，期望4xx)",
+                    duration=timing["total_ms"] / 1000,
+                    details={"status_code": response.status_code, "probe": "cheap", "timing": timing}
+                )
             else:
                 return TestResult(
                     test_name="端点存在性",
                     status="PASS",
                     message=f"端点存在 (状态码: {response.status_code})",
-                    details={"status_code": response.status_code}
+                    duration=timing["total_ms"] / 1000,
+                    details={
+                        "status_code": response.status_code,
+                        "probe": "cheap" if self.cheap_endpoint_probe else "chat",
+                        "timing": timing
+                    }
                 )
                 
         except requests.exceptions.ConnectionError:
@@ -203,22 +2629,25 @@ class LLMConnectionTester:
         try:
             # 测试 /users/me 端点来验证token
             me_endpoint = f"{self.api_base}/users/me"
-            response = requests.get(me_endpoint, headers=headers, timeout=10)
+            response, timing = self.timed_request('GET', me_endpoint, headers=headers, timeout=10, phases=True)
             
             if response.status_code == 200:
-                user_data = response.json()
+                user_data = response.body.value()
+                if not isinstance(user_data, dict):
+                    user_data = {}
                 return TestResult(
                     test_name="认证测试",
                     status="PASS",
                     message=f"认证成功 (用户: {user_data.get('username', 'unknown')})",
-                    details={"authenticated": True, "user": user_data.get('username')}
+                    duration=timing["total_ms"] / 1000,
+                    details={"authenticated": True, "user": user_data.get('username'), "timing": timing}
                 )
             elif response.status_code == 401:
                 return TestResult(
                     test_name="认证测试",
                     status="FAIL",
                     message="Token无效或已过期 (401)",
-                    details={"status_code": 401, "error": response.text[:200]}
+                    details={"status_code": 401, "error": response.body.text[:200]}
                 )
             else:
                 return TestResult(
@@ -238,159 +2667,310 @@ class LLMConnectionTester:
     
     def test_request_format(self, question: str = "测试问题") -> List[TestResult]:
         """测试4-5: 请求格式"""
-        results = []
-        
-        headers = {'Content-Type': 'application/json'}
-        if self.token:
-            headers['Authorization'] = f'Bearer {self.token}'
+        return [self.test_format(question, format_type) for format_type in PAYLOAD_FORMATS]
+    
+    def test_format(self, question: str, format_type: str) -> TestResult:
+        """测试单个请求格式 (direct: 直接格式, wrapped: Strapi v5风格)"""
+        if self.stream:
+            return self.test_stream_format(question, format_type)
         
-        # 格式1: Direct format (直接格式)
-        self.log("测试请求格式: Direct")
-        direct_data = {
-            "question": question,
-            "student_id": self.student_id
-        }
+        label = format_type.capitalize()
+        test_name = f"请求格式 ({label})"
+        self.log(f"测试请求格式: {label}")
+        headers = self.build_headers()
+        payload = self.build_payload(question, format_type)
         
         try:
-            start_time = time.time()
-            response = requests.post(
+            response, timing = self.send_request(
+                'POST',
                 self.chat_endpoint,
-                json=direct_data,
+                json=payload,
                 headers=headers,
-                timeout=30
+                timeout=self.timeout,
+                phases=True
             )
-            duration = time.time() - start_time
+            # 发生重试或对冲时包含退避和对冲延迟；握手在临时连接上单独测量，不计入
+            duration = timing["total_ms"] / 1000
+            with self._lock:
+                self.chat_calls += 1
             
-            self.log(f"Direct格式响应: 状态码={response.status_code}, 耗时={duration:.2f}s")
+            self.log(f"{label}格式响应: 状态码={response.status_code}, 耗时={duration:.2f}s")
             
+            body = response.body
             if self.verbose:
-                self.log(f"请求数据: {json.dumps(direct_data, ensure_ascii=False, indent=2)}")
+                self.log(f"请求数据: {json.dumps(payload, ensure_ascii=False, indent=2)}")
                 self.log(f"响应头: {dict(response.headers)}")
-                try:
-                    self.log(f"响应体: {json.dumps(response.json(), ensure_ascii=False, indent=2)}")
-                except:
-                    self.log(f"响应体 (非JSON): {response.text[:500]}")
+                self.log(f"响应体 ({body.bytes} 字节): {body.text[:500]}")
             
             if response.status_code == 200:
-                results.append(TestResult(
-                    test_name="请求格式 (Direct)",
+                self.responses[format_type] = body.value()
+                return TestResult(
+                    test_name=test_name,
                     status="PASS",
-                    message=f"Direct格式被接受 (耗时: {duration:.2f}s)",
+                    message=f"{label}格式被接受 (耗时: {duration:.2f}s)",
                     duration=duration,
                     details={
-                        "format": "direct",
+                        "format": format_type,
                         "status_code": 200,
-                        "response_preview": response.text[:100]
+                        "response_preview": body.text[:100],
+                        "response_bytes": body.bytes,
+                        "handshake_ms": timing["handshake_ms"],
+                        "timing": timing
                     }
-                ))
+                )
             else:
-                error_msg = response.text[:200] if response.text else "无错误信息"
-                results.append(TestResult(
-                    test_name="请求格式 (Direct)",
+                error_msg = body.text[:200] or "无错误信息"
+                return TestResult(
+                    test_name=test_name,
                     status="FAIL",
-                    message=f"Direct格式被拒绝 (状态码: {response.status_code})",
+                    message=f"{label}格式被拒绝 (状态码: {response.status_code})",
                     duration=duration,
                     details={
-                        "format": "direct",
+                        "format": format_type,
                         "status_code": response.status_code,
-                        "error": error_msg
+                        "error": error_msg,
+                        "timing": timing
                     }
-                ))
+                )
                 
         except requests.exceptions.Timeout:
-            results.append(TestResult(
-                test_name="请求格式 (Direct)",
+            return TestResult(
+                test_name=test_name,
                 status="FAIL",
-                message="请求超时 (>30秒)",
-                details={"format": "direct", "error": "timeout"}
-            ))
+                message=f"请求超时 (>{self.timeout:g}秒)",
+                details={"format": format_type, "error": "timeout"}
+            )
         except Exception as e:
-            results.append(TestResult(
-                test_name="请求格式 (Direct)",
+            return TestResult(
+                test_name=test_name,
                 status="FAIL",
                 message=f"请求失败: {str(e)}",
-                details={"format": "direct", "error": str(e)}
-            ))
-        
-        # 格式2: Wrapped format (Strapi v5风格)
-        self.log("测试请求格式: Wrapped (Strapi v5)")
-        wrapped_data = {
-            "data": {
-                "question": question,
-                "student_id": self.student_id
-            }
-        }
+                details={"format": format_type, "error": str(e)}
+            )
+    
+    def test_stream_format(self, question: str, format_type: str) -> TestResult:
+        """以流式方式测试单个请求格式，记录首字延迟(TTFT)、分块间隔和输出速率"""
+        label = format_type.capitalize()
+        test_name = f"请求格式 ({label})"
+        self.log(f"测试请求格式 (流式): {label}")
+        headers = self.build_headers()
+        headers['Accept'] = 'text/event-stream, application/json'
+        payload = self.build_payload(question, format_type)
         
         try:
-            start_time = time.time()
-            response = requests.post(
+            response, timing = self.send_request(
+                'POST',
                 self.chat_endpoint,
-                json=wrapped_data,
+                json=payload,
                 headers=headers,
-                timeout=30
+                timeout=self.timeout,
+                stream=True,
+                phases=True
             )
-            duration = time.time() - start_time
+            # 流式请求的 total_ms 截止到收到响应头；对冲或重试时从主请求（第一次尝试）发出时算起，
+            # 与非流式请求的总耗时口径一致，TTFT 因此包含对冲延迟和重试退避
+            ttfb = timing["total_ms"] / 1000
+            with self._lock:
+                self.chat_calls += 1
             
-            self.log(f"Wrapped格式响应: 状态码={response.status_code}, 耗时={duration:.2f}s")
-            
-            if self.verbose:
-                self.log(f"请求数据: {json.dumps(wrapped_data, ensure_ascii=False, indent=2)}")
-                try:
-                    self.log(f"响应体: {json.dumps(response.json(), ensure_ascii=False, indent=2)}")
-                except:
-                    self.log(f"响应体 (非JSON): {response.text[:500]}")
+            self.log(f"{label}格式响应头: 状态码={response.status_code}, "
+                     f"Content-Type={response.headers.get('Content-Type')}, TTFB={ttfb*1000:.0f}ms")
             
-            if response.status_code == 200:
-                results.append(TestResult(
-                    test_name="请求格式 (Wrapped)",
-                    status="PASS",
-                    message=f"Wrapped格式被接受 (耗时: {duration:.2f}s)",
-                    duration=duration,
-                    details={
-                        "format": "wrapped",
-                        "status_code": 200,
-                        "response_preview": response.text[:100]
-                    }
-                ))
-            else:
-                error_msg = response.text[:200] if response.text else "无错误信息"
-                results.append(TestResult(
-                    test_name="请求格式 (Wrapped)",
+            if response.status_code != 200:
+                error_msg = BoundedBody.read(response, 200).text or "无错误信息"
+                return TestResult(
+                    test_name=test_name,
                     status="FAIL",
-                    message=f"Wrapped格式被拒绝 (状态码: {response.status_code})",
-                    duration=duration,
+                    message=f"{label}格式被拒绝 (状态码: {response.status_code})",
+                    duration=ttfb,
                     details={
-                        "format": "wrapped",
+                        "format": format_type,
                         "status_code": response.status_code,
                         "error": error_msg
                     }
-                ))
-                
+                )
+            
+            body, metrics = self.consume_stream(response, ttfb)
+            timing["download_ms"] = metrics["total_ms"] - ttfb * 1000
+            timing["total_ms"] += timing["download_ms"]
+            self.responses[format_type] = body
+            
+            if self.verbose:
+                self.log(f"请求数据: {json.dumps(payload, ensure_ascii=False, indent=2)}")
+                self.log(f"流式指标: {json.dumps(metrics, ensure_ascii=False)}")
+                self.log(f"响应体预览: {str(body)[:500]}")
+            
+            return TestResult(
+                test_name=test_name,
+                status="PASS",
+                message=(f"{label}格式被接受 (TTFT: {metrics['ttft_ms']:.0f}ms, "
+                         f"总耗时: {metrics['total_ms']/1000:.2f}s, "
+                         f"{metrics['chars_per_second']:.1f} 字符/s)"),
+                duration=metrics['total_ms'] / 1000,
+                details={
+                    "format": format_type,
+                    "status_code": 200,
+                    "response_preview": str(body)[:100],
+                    "handshake_ms": timing["handshake_ms"],
+                    "timing": timing,
+                    "stream": metrics
+                }
+            )
+            
         except requests.exceptions.Timeout:
-            results.append(TestResult(
-                test_name="请求格式 (Wrapped)",
+            return TestResult(
+                test_name=test_name,
                 status="FAIL",
-                message="请求超时 (>30秒)",
-                details={"format": "wrapped", "error": "timeout"}
-            ))
+                message=f"请求超时 (>{self.timeout:g}秒)",
+                details={"format": format_type, "error": "timeout"}
+            )
         except Exception as e:
-            results.append(TestResult(
-                test_name="请求格式 (Wrapped)",
+            return TestResult(
+                test_name=test_name,
                 status="FAIL",
                 message=f"请求失败: {str(e)}",
-                details={"format": "wrapped", "error": str(e)}
-            ))
+                details={"format": format_type, "error": str(e)}
+            )
+    
+    def consume_stream(self, response: requests.Response, ttfb: float) -> Tuple[Any, Dict]:
+        """增量读取分块/SSE响应，返回 (用于结构验证的响应体, 流式指标)
         
-        return results
+        不缓冲完整响应体: SSE 只保留拼接后的文本内容，普通分块响应只保留前
+        STREAM_BODY_LIMIT 个字符，超出部分仅计入字符数。
+        """
+        is_sse = 'text/event-stream' in response.headers.get('Content-Type', '')
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        start_time = time.perf_counter()
+        first_chunk_at = None
+        last_chunk_at = None
+        gaps: List[float] = []
+        chunks = 0
+        chars = 0
+        kept: List[str] = []
+        kept_chars = 0
+        line_buffer = ""
+        
+        def keep(text: str):
+            nonlocal kept_chars
+            if kept_chars < STREAM_BODY_LIMIT:
+                kept.append(text[:STREAM_BODY_LIMIT - kept_chars])
+                kept_chars += len(kept[-1])
+        
+        for raw in response.iter_content(chunk_size=None):
+            if not raw:
+                continue
+            now = time.perf_counter()
+            text = decoder.decode(raw)
+            if is_sse:
+                line_buffer += text
+                *lines, line_buffer = line_buffer.split('\n')
+                text = "".join(self._extract_sse_text(line) for line in lines)
+            if not text:
+                continue
+            if first_chunk_at is None:
+                first_chunk_at = now
+            else:
+                gaps.append(now - last_chunk_at)
+            last_chunk_at = now
+            chunks += 1
+            chars += len(text)
+            keep(text)
+        
+        tail = decoder.decode(b'', final=True)
+        if is_sse:
+            tail = self._extract_sse_text(line_buffer + tail)
+        if tail:
+            chars += len(tail)
+            keep(tail)
+        end_time = time.perf_counter()
+        
+        ttft = ttfb + ((first_chunk_at or end_time) - start_time)
+        total = ttfb + (end_time - start_time)
+        generation = (end_time - first_chunk_at) if first_chunk_at else 0.0
+        metrics = {
+            "mode": "sse" if is_sse else "chunked",
+            "ttfb_ms": ttfb * 1000,
+            "ttft_ms": ttft * 1000,
+            "total_ms": total * 1000,
+            "chunks": chunks,
+            "chars": chars,
+            "chars_per_second": chars / generation if generation > 0 else 0.0,
+            "inter_chunk_ms": {
+                "mean": sum(gaps) / len(gaps) * 1000 if gaps else 0.0,
+                "p50": percentile(gaps, 50) * 1000,
+                "p99": percentile(gaps, 99) * 1000,
+                "max": max(gaps) * 1000 if gaps else 0.0
+            },
+            "truncated": chars > kept_chars
+        }
+        
+        body = "".join(kept)
+        if not is_sse and not metrics["truncated"]:
+            try:
+                return json.loads(body), metrics
+            except ValueError:
+                pass
+        return body, metrics
+    
+    def _extract_sse_text(self, line: str) -> str:
+        """提取一行SSE数据中的文本内容（支持纯文本和常见JSON增量格式）"""
+        line = line.strip()
+        if not line.startswith('data:'):
+            return ""
+        data = line[5:].strip()
+        if not data or data == '[DONE]':
+            return ""
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return data
+        if isinstance(event, str):
+            return event
+        if isinstance(event, dict):
+            choices = event.get('choices')
+            if isinstance(choices, list) and choices and isinstance(choices[0], dict):
+                delta = choices[0].get('delta') or choices[0].get('message') or {}
+                if isinstance(delta, dict) and isinstance(delta.get('content'), str):
+                    return delta['content']
+            for key in ('content', 'delta', 'text', 'response', 'message', 'answer', 'reply'):
+                if isinstance(event.get(key), str):
+                    return event[key]
+        return ""
+    
+    def validate_accepted_format(self) -> Optional[TestResult]:
+        """验证第一个被接受的请求格式的响应（复用已获取的响应，不再调用模型）"""
+        for format_type in PAYLOAD_FORMATS:
+            if format_type in self.responses:
+                return self.validate_response(self.responses[format_type])
+        return None
+    
+    def extract_ai_message(self, response_data: Any) -> Tuple[List[str], Optional[str]]:
+        """从响应中查找已知字段并提取AI回答，返回 (找到的字段, AI回答)"""
+        if isinstance(response_data, str):
+            return [], response_data
+        found_fields = []
+        ai_message = None
+        if isinstance(response_data, dict):
+            # 检查已知字段
+            for field in RESPONSE_FIELDS:
+                if field in response_data:
+                    found_fields.append(field)
+                    if ai_message is None and isinstance(response_data[field], str):
+                        ai_message = response_data[field]
+            
+            # 检查嵌套的data字段
+            if 'data' in response_data and isinstance(response_data['data'], dict):
+                for field in RESPONSE_FIELDS:
+                    if field in response_data['data']:
+                        found_fields.append(f"data.{field}")
+                        if ai_message is None and isinstance(response_data['data'][field], str):
+                            ai_message = response_data['data'][field]
+        return found_fields, ai_message
     
     def validate_response(self, response_data: Any) -> TestResult:
         """测试6: 验证响应结构"""
         self.log("验证响应数据结构")
         
-        known_fields = ['response', 'message', 'answer', 'reply', 'data']
-        found_fields = []
-        ai_message = None
-        
         try:
             # 如果响应是字符串
             if isinstance(response_data, str):
@@ -406,20 +2986,7 @@ class LLMConnectionTester:
             
             # 如果响应是字典
             if isinstance(response_data, dict):
-                # 检查已知字段
-                for field in known_fields:
-                    if field in response_data:
-                        found_fields.append(field)
-                        if ai_message is None and isinstance(response_data[field], str):
-                            ai_message = response_data[field]
-                
-                # 检查嵌套的data字段
-                if 'data' in response_data and isinstance(response_data['data'], dict):
-                    for field in known_fields:
-                        if field in response_data['data']:
-                            found_fields.append(f"data.{field}")
-                            if ai_message is None and isinstance(response_data['data'][field], str):
-                                ai_message = response_data['data'][field]
+                found_fields, ai_message = self.extract_ai_message(response_data)
                 
                 if found_fields:
                     return TestResult(
@@ -439,7 +3006,7 @@ class LLMConnectionTester:
                         message=f"未找到已知响应字段，可用字段: {list(response_data.keys())}",
                         details={
                             "available_fields": list(response_data.keys()),
-                            "expected_fields": known_fields
+                            "expected_fields": list(RESPONSE_FIELDS)
                         }
                     )
             
@@ -458,86 +3025,379 @@ class LLMConnectionTester:
                 details={"error": str(e)}
             )
     
-    def run_all_tests(self, question: str = "请分析我的学习成果数据"):
-        """运行所有测试"""
-        self.print_header("LLM Connection Test Tool v1.0")
+    def run_all_tests(self, question: str = "请分析我的学习成果数据"):
+        """运行所有测试"""
+        self.print_header("LLM Connection Test Tool v1.0")
+        
+        print(f"配置信息:")
+        print(f"  后端URL: {self.backend_url}")
+        print(f"  API端点: {self.chat_endpoint}")
+        print(f"  学生ID: {self.student_id}")
+        print(f"  Token: {'已提供' if self.token else '未提供'}")
+        print(f"  详细模式: {'开启' if self.verbose else '关闭'}")
+        print(f"  流式模式: {'开启' if self.stream else '关闭'}")
+        print(f"  连接池: {self.pool_size} (keep-alive: {'开启' if self.keep_alive else '关闭'})")
+        
+        # 测试1: 服务器连通性
+        self.print_section("[1/6] 测试服务器连通性")
+        result = self._timed_stage("connectivity", self.test_server_connectivity)()
+        self.results.append(result)
+        print(result)
+        
+        if result.status == "FAIL":
+            print(f"\n{Colors.RED}严重错误: 无法连接到服务器，后续测试将被跳过{Colors.END}")
+            self.print_report()
+            return
+        
+        start_time = time.perf_counter()
+        stage_results = self.run_dependent_stages(question)
+        elapsed = time.perf_counter() - start_time
+        
+        # 按固定顺序输出结果
+        for title, names in (
+            ("[2/6] 测试端点存在性", ("endpoint",)),
+            ("[3/6] 测试认证", ("auth",)),
+            ("[4-5/6] 测试请求格式", ("direct", "wrapped")),
+            ("[6/6] 验证响应结构", ("validation",)),
+        ):
+            section_results = [stage_results[name] for name in names if stage_results[name] is not None]
+            if not section_results:
+                continue
+            self.print_section(title)
+            for result in section_results:
+                self.results.append(result)
+                print(result)
+        
+        print(f"\n诊断阶段耗时: {elapsed:.2f}s ({'并行' if self.parallel else '串行'})")
+        
+        # 打印报告
+        self.print_report()
+    
+    def _timed_stage(self, name: str, func: Callable[[], Optional[TestResult]]) -> Callable[[], Optional[TestResult]]:
+        """包装诊断阶段，标记阶段标识并为未记录耗时的结果补充阶段耗时"""
+        def wrapper():
+            start_time = time.perf_counter()
+            result = func()
+            if result is not None:
+                result.stage = name
+                if result.duration is None:
+                    result.duration = time.perf_counter() - start_time
+            return result
+        return wrapper
+    
+    def run_dependent_stages(self, question: str) -> Dict[str, Optional[TestResult]]:
+        """执行连通性之后的诊断阶段，返回 {阶段名: 结果}"""
+        # 测试2-5 只依赖服务器连通性，彼此独立；测试6 依赖请求格式测试的响应
+        stages = [
+            Stage("endpoint", self._timed_stage("endpoint", self.test_endpoint_exists)),
+            Stage("auth", self._timed_stage("auth", self.test_authentication)),
+            Stage("direct", self._timed_stage("direct", lambda: self.test_format(question, "direct"))),
+            Stage("wrapped", self._timed_stage("wrapped", lambda: self.test_format(question, "wrapped"))),
+            Stage("validation", self._timed_stage("validation", self.validate_accepted_format),
+                  depends=("direct", "wrapped")),
+        ]
+        return run_stages(stages, max_workers=len(stages) if self.parallel else 1)
+    
+    def run_probe_cycle(self, question: str) -> Dict[str, Optional[TestResult]]:
+        """执行一轮完整诊断（不打印、不累积结果），连通性失败时其余阶段为 None"""
+        self.responses.clear()
+        cycle = {name: None for name in STAGE_NAMES}
+        cycle["connectivity"] = self._timed_stage("connectivity", self.test_server_connectivity)()
+        if cycle["connectivity"].status != "FAIL":
+            cycle.update(self.run_dependent_stages(question))
+        return cycle
+    
+    def run_watch(self, question: str = "请分析我的学习成果数据", interval: float = 60,
+                  window: int = 60, iterations: Optional[int] = None,
+                  metrics: Optional[MetricsRegistry] = None,
+                  writer: Optional[ResultWriter] = None,
+                  store: Optional[ResultStore] = None):
+        """持续监控: 按固定间隔执行诊断，每个周期输出一行摘要
+        
+        只保留每个阶段的滚动直方图（最近 window 个周期）和计数器，
+        不累积 TestResult，长时间运行内存保持稳定。提供 metrics 时每个阶段结果
+        同时写入指标缓存，供 /metrics 抓取；提供 writer 时每个周期输出一次机器可读结果；
+        提供 store 时每个周期的结果追加到历史存储。
+        """
+        self.print_header("LLM Connection Test Tool v1.0 - 持续监控")
+        print(f"配置信息:")
+        print(f"  API端点: {self.chat_endpoint}")
+        print(f"  监控间隔: {interval}s")
+        print(f"  滚动窗口: {window} 个周期")
+        print(f"  按 Ctrl+C 停止\n")
+        
+        histograms = {name: RollingHistogram(window) for name in STAGE_NAMES}
+        totals = {name: {"PASS": 0, "FAIL": 0, "WARN": 0} for name in STAGE_NAMES}
+        cycles = 0
+        
+        try:
+            while iterations is None or cycles < iterations:
+                cycle_start = time.perf_counter()
+                cycle_started_at = datetime.now()
+                cycle = self.run_probe_cycle(question)
+                cycles += 1
+                cycle_results = [result for result in cycle.values() if result is not None]
+                if writer is not None or store is not None:
+                    summary = self.build_summary(cycle_results, "watch", cycle_started_at)
+                    if writer is not None:
+                        writer.write_run(cycle_results, summary)
+                    if store is not None:
+                        store.record(cycle_results, summary["run_id"], self.backend_url, self.chat_endpoint)
+                
+                parts = []
+                for name in STAGE_NAMES:
+                    result = cycle[name]
+                    if result is None:
+                        parts.append(f"{name}=-")
+                        continue
+                    totals[name][result.status] = totals[name].get(result.status, 0) + 1
+                    if metrics is not None:
+                        metrics.observe(name, result)
+                    if result.duration is not None:
+                        histograms[name].record(result.duration)
+                        if self.samples is not None:
+                            self.samples.record(result.status, result.status != "FAIL", result.duration,
+                                                stage=STAGE_NAMES.index(name),
+                                                finished=result.timestamp.timestamp())
+                    snapshot = histograms[name].snapshot()
+                    parts.append(f"{name}={result.status}/{(result.duration or 0)*1000:.0f}ms"
+                                 f"({snapshot.percentile(50)*1000:.0f}/{snapshot.percentile(99)*1000:.0f})")
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] #{cycles} " + " ".join(parts), flush=True)
+                
+                for histogram in histograms.values():
+                    histogram.rotate()
+                if iterations is not None and cycles >= iterations:
+                    break
+                time.sleep(max(0.0, interval - (time.perf_counter() - cycle_start)))
+        except KeyboardInterrupt:
+            print()
+        
+        self.print_watch_summary(cycles, histograms, totals)
+    
+    def print_watch_summary(self, cycles: int, histograms: Dict[str, RollingHistogram],
+                            totals: Dict[str, Dict[str, int]]):
+        """打印监控汇总"""
+        self.print_header("监控汇总")
+        print(f"监控周期数: {cycles}\n")
+        print(f"  {'阶段':<14}{'通过':>6}{'失败':>6}{'警告':>6}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+        for name in STAGE_NAMES:
+            snapshot = histograms[name].snapshot()
+            counts = totals[name]
+            print(f"  {name:<14}{counts['PASS']:>6}{counts['FAIL']:>6}{counts['WARN']:>6}"
+                  f"{snapshot.percentile(50)*1000:>8.0f}ms{snapshot.percentile(90)*1000:>8.0f}ms"
+                  f"{snapshot.percentile(99)*1000:>8.0f}ms{snapshot.max*1000:>8.0f}ms")
+    
+    def compare_history(self, store: ResultStore, baseline_hours: float = 168, recent_minutes: float = 60,
+                        alpha: float = 0.01, min_effect: float = 0.2, min_samples: int = 5,
+                        min_delta_ms: float = 5.0) -> List[Dict]:
+        """对比近期窗口与之前的基线窗口，检测统计显著的延迟或错误率回归
         
+        延迟使用 Mann-Whitney U 检验，且近期中位数需比基线高出 min_effect（并至少
+        min_delta_ms 毫秒）才判定为回归；错误率使用双比例 z 检验。
+        """
+        now = time.time()
+        recent_since = now - recent_minutes * 60
+        baseline_since = recent_since - baseline_hours * 3600
+        rows = []
+        for stage, format_type in store.keys(self.backend_url, self.chat_endpoint):
+            base_lat, base_fail, base_total = store.fetch(self.backend_url, self.chat_endpoint, stage,
+                                                          format_type, baseline_since, recent_since)
+            recent_lat, recent_fail, recent_total = store.fetch(self.backend_url, self.chat_endpoint, stage,
+                                                                format_type, recent_since, now + 1)
+            if not base_total and not recent_total:
+                continue
+            base_p50 = percentile(base_lat, 50)
+            recent_p50 = percentile(recent_lat, 50)
+            latency_p = mann_whitney_p(base_lat, recent_lat)
+            error_p = two_proportion_p(base_fail, base_total, recent_fail, recent_total)
+            enough = (len(base_lat) >= min_samples and len(recent_lat) >= min_samples)
+            rows.append({
+                "stage": stage,
+                "format": format_type,
+                "baseline": {
+                    "samples": base_total,
+                    "p50_ms": base_p50,
+                    "p90_ms": percentile(base_lat, 90),
+                    "p99_ms": percentile(base_lat, 99),
+                    "error_rate": base_fail / base_total if base_total else 0.0
+                },
+                "recent": {
+                    "samples": recent_total,
+                    "p50_ms": recent_p50,
+                    "p90_ms": percentile(recent_lat, 90),
+                    "p99_ms": percentile(recent_lat, 99),
+                    "error_rate": recent_fail / recent_total if recent_total else 0.0
+                },
+                "latency_p_value": latency_p,
+                "error_p_value": error_p,
+                "latency_regression": (enough and latency_p < alpha
+                                       and recent_p50 > base_p50 * (1 + min_effect)
+                                       and recent_p50 - base_p50 >= min_delta_ms),
+                "error_regression": (base_total >= min_samples and recent_total >= min_samples
+                                     and error_p < alpha)
+            })
+        return rows
+    
+    def _history_key_label(self, row: Dict) -> str:
+        if row['format'] and row['format'] != row['stage']:
+            return f"{row['stage']}/{row['format']}"
+        return row['stage']
+    
+    def run_compare_mode(self, store: ResultStore, baseline_hours: float = 168, recent_minutes: float = 60,
+                         alpha: float = 0.01, min_effect: float = 0.2) -> List[Dict]:
+        """打印历史回归对比报告，返回对比结果"""
+        self.print_header("LLM Connection Test Tool v1.0 - 回归检测")
         print(f"配置信息:")
-        print(f"  后端URL: {self.backend_url}")
+        print(f"  历史存储: {store.path}")
         print(f"  API端点: {self.chat_endpoint}")
-        print(f"  学生ID: {self.student_id}")
-        print(f"  Token: {'已提供' if self.token else '未提供'}")
-        print(f"  详细模式: {'开启' if self.verbose else '关闭'}")
-        
-        # 测试1: 服务器连通性
-        self.print_section("[1/6] 测试服务器连通性")
-        result = self.test_server_connectivity()
-        self.results.append(result)
-        print(result)
-        
-        if result.status == "FAIL":
-            print(f"\n{Colors.RED}严重错误: 无法连接到服务器，后续测试将被跳过{Colors.END}")
-            self.print_report()
-            return
+        print(f"  基线窗口: 近期窗口之前 {baseline_hours:g} 小时")
+        print(f"  近期窗口: 最近 {recent_minutes:g} 分钟")
+        print(f"  显著性水平: {alpha}, 最小延迟增幅: {min_effect*100:.0f}%")
         
-        # 测试2: 端点存在性
-        self.print_section("[2/6] 测试端点存在性")
-        result = self.test_endpoint_exists()
-        self.results.append(result)
-        print(result)
-        
-        # 测试3: 认证
-        self.print_section("[3/6] 测试认证")
-        result = self.test_authentication()
-        self.results.append(result)
-        print(result)
+        rows = self.compare_history(store, baseline_hours, recent_minutes, alpha, min_effect)
+        self.print_section("基线 vs 近期")
+        if not rows:
+            print(f"{Colors.YELLOW}⚠ 历史存储中没有该端点的数据{Colors.END}")
+            return rows
         
-        # 测试4-5: 请求格式
-        self.print_section("[4-5/6] 测试请求格式")
-        format_results = self.test_request_format(question)
-        self.results.extend(format_results)
-        for result in format_results:
-            print(result)
-            
-            # 如果某个格式成功，验证响应
-            if result.status == "PASS" and result.details and 'response_preview' in result.details:
-                self.print_section("[6/6] 验证响应结构")
-                # 尝试获取完整响应进行验证
-                try:
-                    headers = {'Content-Type': 'application/json'}
-                    if self.token:
-                        headers['Authorization'] = f'Bearer {self.token}'
-                    
-                    test_data = {"question": question, "student_id": self.student_id}
-                    if result.details['format'] == 'wrapped':
-                        test_data = {"data": test_data}
-                    
-                    response = requests.post(self.chat_endpoint, json=test_data, headers=headers, timeout=30)
-                    if response.status_code == 200:
-                        try:
-                            response_data = response.json()
-                        except:
-                            response_data = response.text
-                        
-                        validation_result = self.validate_response(response_data)
-                        self.results.append(validation_result)
-                        print(validation_result)
-                        break
-                except:
-                    pass
+        print(f"  {'阶段':<18}{'基线样本':>8}{'基线p50':>10}{'基线p99':>10}{'基线错误率':>10}"
+              f"{'近期样本':>8}{'近期p50':>10}{'近期p99':>10}{'近期错误率':>10}")
+        for row in rows:
+            base, recent = row["baseline"], row["recent"]
+            name = self._history_key_label(row)
+            print(f"  {name:<18}{base['samples']:>8}{base['p50_ms']:>8.0f}ms{base['p99_ms']:>8.0f}ms"
+                  f"{base['error_rate']*100:>9.1f}%{recent['samples']:>8}{recent['p50_ms']:>8.0f}ms"
+                  f"{recent['p99_ms']:>8.0f}ms{recent['error_rate']*100:>9.1f}%")
         
-        # 打印报告
-        self.print_report()
+        self.print_section("回归检测")
+        regressions = 0
+        for row in rows:
+            name = self._history_key_label(row)
+            if row["latency_regression"]:
+                regressions += 1
+                print(f"{Colors.RED}✗ {name} 延迟回归: p50 {row['baseline']['p50_ms']:.0f}ms → "
+                      f"{row['recent']['p50_ms']:.0f}ms (p={row['latency_p_value']:.2g}){Colors.END}")
+            if row["error_regression"]:
+                regressions += 1
+                print(f"{Colors.RED}✗ {name} 错误率回归: {row['baseline']['error_rate']*100:.1f}% → "
+                      f"{row['recent']['error_rate']*100:.1f}% (p={row['error_p_value']:.2g}){Colors.END}")
+        if not regressions:
+            print(f"{Colors.GREEN}✓ 未发现统计显著的回归{Colors.END}")
+        return rows
+    
+    def print_throttle_report(self):
+        """打印客户端限流统计: 各端点类别的请求数、被限流次数和等待时间"""
+        if self.limiter is None:
+            return
+        self.print_section("客户端限流")
+        budgets = []
+        for key, (rate, burst) in self.limiter.rates.items():
+            budgets.append(f"{key} {rate:g} req/s" + (f" (突发 {burst:g})" if burst is not None else ""))
+        for key, limit in self.limiter.concurrency.items():
+            budgets.append(f"{key} 在途 ≤ {limit}")
+        print(f"  预算: {', '.join(budgets)}")
+        stats = self.limiter.summary()
+        # 多进程/分布式负载的限流在各子进程或代理中执行，统计随分片结果汇总
+        for result in self.results:
+            for key, item in ((result.details or {}).get("throttle") or {}).items():
+                merged = stats.setdefault(key, {"requests": 0, "throttled": 0, "throttled_s": 0.0, "max_wait_s": 0.0})
+                for name in ("requests", "throttled", "throttled_s"):
+                    merged[name] += item[name]
+                merged["max_wait_s"] = max(merged["max_wait_s"], item["max_wait_s"])
+        if not stats:
+            print(f"  没有经过限流器的请求")
+            return
+        print(f"  {'类别':<8}{'请求':>8}{'被限流':>8}{'等待合计':>12}{'最长等待':>12}")
+        for key, item in sorted(stats.items()):
+            print(f"  {key:<8}{item['requests']:>8}{item['throttled']:>8}"
+                  f"{item['throttled_s']:>11.2f}s{item['max_wait_s']*1000:>10.0f}ms")
+        print(f"  报告中的延迟已扣除限流等待时间；开放模型的计划到达延迟仍包含客户端排队")
+    
+    def print_retry_report(self):
+        """打印重试与对冲统计: 重试次数和原因，对冲前后的延迟分位数及额外请求比例"""
+        if self.retry is None and self.hedger is None:
+            return
+        # 多进程/分布式负载的重试和对冲在各子进程或代理中执行，统计随分片结果汇总
+        retry = [self.retry.summary()] if self.retry is not None else []
+        hedge = [self.hedger.snapshot()] if self.hedger is not None else []
+        for result in self.results:
+            details = result.details or {}
+            if details.get("retry"):
+                retry.append(details["retry"])
+            hedge.extend(details.get("hedge_snapshots") or [])
+        if self.retry is not None:
+            self.print_section("重试")
+            stats = merge_retry_stats(retry)
+            print(f"  策略: 最多重试 {self.retry.retries} 次, 退避 {self.retry.backoff:g}s 起指数增长 "
+                  f"(上限 {self.retry.max_backoff:g}s, 全抖动)")
+            reasons = ', '.join(f"{key}={count}" for key, count in sorted(stats["reasons"].items()))
+            print(f"  请求: {stats['requests']}, 重试: {stats['retries']}" + (f" ({reasons})" if reasons else ""))
+            print(f"  重试后成功: {stats['recovered']}, 重试用尽仍失败: {stats['exhausted']}, "
+                  f"退避等待合计: {stats['backoff_s']:.2f}s")
+        if self.hedger is not None:
+            self.print_section("对冲请求")
+            summary = hedge_summary(hedge)
+            if self.hedger.delay_ms is not None:
+                print(f"  对冲延迟: 固定 {self.hedger.delay_ms:g}ms")
+            else:
+                print(f"  对冲延迟: 成功主请求延迟的 p{self.hedger.quantile:g} "
+                      f"(前 {self.hedger.min_samples} 个样本不对冲)")
+            if not summary["requests"]:
+                print(f"  没有经过对冲的请求")
+                return
+            print(f"  请求: {summary['requests']}, 发送副本: {summary['hedges']} "
+                  f"(额外后端负载 {summary['extra_load']*100:.1f}%), 副本先返回: {summary['backup_wins']}, "
+                  f"失败: {summary['errors']}")
+            print(f"  延迟只统计成功的请求；失败的主请求 ({summary['primary_errors']}) 不参与对冲延迟的计算")
+            print(f"  {'':<10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+            for label, key in (("不对冲", "unhedged_ms"), ("对冲后", "hedged_ms"), ("减少", "saved_ms")):
+                values = summary[key]
+                print(f"  {label:<8}" + "".join(f"{values[name]:>8.0f}ms" for name in ("p50", "p90", "p99", "max")))
+            if summary["pending_primaries"]:
+                print(f"  {Colors.YELLOW}{summary['pending_primaries']} 个落选的主请求尚未返回，"
+                      f"未计入不对冲延迟（实际尾延迟收益更大）{Colors.END}")
+            print(f"  不对冲延迟为主请求的完整耗时；额外负载会抬高后端延迟，两者都在对冲条件下测得")
+    
+    def export_samples(self, title: str, html_path: Optional[str] = None, csv_path: Optional[str] = None):
+        """统计本次运行记录的逐请求样本，打印错误突发并导出 HTML 报告和/或 CSV"""
+        if self.samples is None:
+            return
+        self.print_section("样本报告")
+        started = time.perf_counter()
+        levels = in_flight_levels(self.samples)
+        analysis = analyze_samples(self.samples, levels)
+        if csv_path:
+            write_samples_csv(self.samples, csv_path, levels)
+        if html_path:
+            meta = {
+                "后端": self.backend_url,
+                "聊天端点": self.chat_endpoint,
+                "开始时间": self.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+                "并发引擎": self.engine
+            }
+            with open(html_path, 'w', encoding='utf-8') as f:
+                f.write(render_html_report(analysis, title, meta))
+        print(f"  样本数: {len(self.samples)} (列式存储 {format_bytes(self.samples.nbytes)}), "
+              f"统计和导出用时 {time.perf_counter() - started:.2f}s")
+        for burst in analysis.get("bursts", [])[:3]:
+            codes = ", ".join(f"{key}×{total}" for key, total in burst["status_codes"].items())
+            print(f"  {Colors.YELLOW}错误突发: {burst['start_s']}-{burst['end_s']}s, "
+                  f"{burst['errors']}/{burst['requests']} 个请求失败 ({codes}){Colors.END}")
+        if html_path:
+            print(f"  HTML报告: {html_path}")
+        if csv_path:
+            print(f"  样本CSV: {csv_path}")
     
     def print_report(self):
         """打印测试报告"""
         self.print_header("测试报告")
         
         # 统计
-        total = len(self.results)
-        passed = sum(1 for r in self.results if r.status == "PASS")
-        failed = sum(1 for r in self.results if r.status == "FAIL")
-        warned = sum(1 for r in self.results if r.status == "WARN")
+        counts = summarize_results(self.results)
+        total = counts["total"]
+        passed = counts["passed"]
+        failed = counts["failed"]
+        warned = counts["warned"]
         
         print(f"总测试数: {total}")
         print(f"{Colors.GREEN}通过: {passed}{Colors.END}")
@@ -612,6 +3472,20 @@ class LLMConnectionTester:
                     print(f"\n  {result.test_name} 错误:")
                     print(f"    {result.details['error']}")
         
+        # 流式响应指标
+        stream_tests = [r for r in passed_formats if r.details and 'stream' in r.details]
+        if stream_tests:
+            print(f"\n{Colors.CYAN}流式响应指标{Colors.END}")
+            for result in stream_tests:
+                metrics = result.details['stream']
+                gaps = metrics['inter_chunk_ms']
+                print(f"  {result.details['format'].upper()} ({metrics['mode']}):")
+                print(f"    首字延迟(TTFT): {metrics['ttft_ms']:.0f}ms  (TTFB: {metrics['ttfb_ms']:.0f}ms)")
+                print(f"    总耗时: {metrics['total_ms']:.0f}ms, 分块数: {metrics['chunks']}, 字符数: {metrics['chars']}")
+                print(f"    输出速率: {metrics['chars_per_second']:.1f} 字符/s")
+                print(f"    分块间隔: 平均 {gaps['mean']:.0f}ms, p50 {gaps['p50']:.0f}ms, "
+                      f"p99 {gaps['p99']:.0f}ms, 最大 {gaps['max']:.0f}ms")
+        
         # 检查响应验证
         validation_test = next((r for r in self.results if r.test_name == "响应结构验证"), None)
         if validation_test:
@@ -630,6 +3504,27 @@ class LLMConnectionTester:
                     print(f"  可用字段: {validation_test.details.get('available_fields', [])}")
                     print(f"  建议检查后端返回的数据结构")
         
+        # 时间分解: 区分网络（DNS/连接/TLS）、后端处理（首字节）和响应体传输（下载）
+        timed_results = [r for r in self.results if r.details and r.details.get('timing')]
+        if timed_results:
+            print(f"\n{Colors.CYAN}时间分解{Colors.END}")
+            print(f"  {'测试':<16}" + "".join(f"{label:>10}" for _, label in TIMING_PHASES) + f"{'总计':>10}")
+            for result in timed_results:
+                timing = result.details['timing']
+                cells = "".join(f"{timing[key]:>8.1f}ms" if timing.get(key) is not None else f"{'-':>10}"
+                                for key, _ in TIMING_PHASES)
+                print(f"  {result.test_name:<16}{cells}{timing['total_ms']:>8.1f}ms")
+            # 握手在临时套接字上测量，代表一次新建连接的开销，取最大值而不是逐个累加
+            network = max(r.details['timing'].get('handshake_ms') or 0 for r in timed_results)
+            backend = sum(r.details['timing']['ttfb_ms'] for r in timed_results)
+            transfer = sum(r.details['timing'].get('download_ms') or 0 for r in timed_results)
+            slowest = max((network, "网络建连 (DNS/连接/TLS)"), (backend, "后端处理 (首字节)"),
+                          (transfer, "模型生成与传输 (流式下载)" if self.stream else "响应体传输 (下载)"))
+            print(f"  主要耗时: {slowest[1]}，占 {slowest[0] / (network + backend + transfer or 1):.0%}")
+        
+        if self.chat_calls:
+            print(f"\n聊天端点调用次数: {self.chat_calls}")
+        
         # 总结
         self.print_section("总结")
         if failed == 0:
@@ -646,6 +3541,1240 @@ class LLMConnectionTester:
         else:
             print(f"{Colors.YELLOW}⚠ 部分测试失败，但基本功能可用{Colors.END}")
             print(f"  请根据上述建议进行修复")
+    
+    def _run_catalog_request(self, probe: Dict) -> Dict:
+        """执行一次接口探测请求，返回单个样本"""
+        headers = {}
+        if probe["auth"] and self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        url = self.backend_url + probe["path"].replace("{student_id}", str(self.student_id))
+        start_time = time.perf_counter()
+        try:
+            response = self.session.request(probe["method"], url, headers=headers,
+                                            json=probe.get("json"), timeout=probe["timeout"])
+            body = response.content
+            latency = time.perf_counter() - start_time - throttle_wait(response)
+        except requests.exceptions.Timeout as e:
+            return {"latency": time.perf_counter() - start_time - throttle_wait(e), "error": "timeout"}
+        except Exception as e:
+            return {"latency": time.perf_counter() - start_time - throttle_wait(e), "error": str(e)}
+        
+        sample = {"latency": latency, "status_code": response.status_code, "bytes": len(body)}
+        if response.status_code not in probe["expect_status"]:
+            sample["error"] = f"状态码 {response.status_code}"
+        elif probe.get("expect_shape"):
+            try:
+                shape_errors = check_shape(json.loads(body), probe["expect_shape"])
+            except ValueError:
+                shape_errors = ["响应不是JSON"]
+            if shape_errors:
+                sample["error"] = "; ".join(shape_errors)
+        return sample
+    
+    def run_catalog(self, probes: List[Dict], repeat: int = 1, concurrency: int = 8) -> List[TestResult]:
+        """并发执行接口探测目录，每个探测项重复 repeat 次，按目录顺序返回结果"""
+        runnable = []
+        results: Dict[int, TestResult] = {}
+        for index, probe in enumerate(probes):
+            if probe["auth"] and not self.token:
+                results[index] = TestResult(
+                    test_name=f"接口: {probe['name']}",
+                    status="WARN",
+                    message=f"{probe['name']}: 需要token，已跳过",
+                    details={"path": probe["path"], "method": probe["method"], "skipped": True}
+                )
+            else:
+                runnable.append(index)
+        
+        samples: Dict[int, List[Dict]] = {index: [] for index in runnable}
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {executor.submit(self._run_catalog_request, probes[index]): index
+                       for index in runnable for _ in range(repeat)}
+            for future in futures:
+                samples[futures[future]].append(future.result())
+        
+        for index in runnable:
+            probe = probes[index]
+            probe_samples = samples[index]
+            latencies = [sample["latency"] for sample in probe_samples]
+            sizes = [sample["bytes"] for sample in probe_samples if "bytes" in sample]
+            errors = [sample["error"] for sample in probe_samples if "error" in sample]
+            details = {
+                "path": probe["path"],
+                "method": probe["method"],
+                "requests": len(probe_samples),
+                "errors": len(errors),
+                "status_codes": sorted({sample["status_code"] for sample in probe_samples if "status_code" in sample}),
+                "latency_ms": {
+                    "p50": percentile(latencies, 50) * 1000,
+                    "p90": percentile(latencies, 90) * 1000,
+                    "max": max(latencies) * 1000
+                },
+                "bytes": {
+                    "mean": sum(sizes) / len(sizes) if sizes else 0,
+                    "max": max(sizes) if sizes else 0
+                }
+            }
+            if errors:
+                details["error"] = errors[0]
+            status = "PASS" if not errors else ("FAIL" if len(errors) == len(probe_samples) else "WARN")
+            message = (f"{probe['name']}: p50 {details['latency_ms']['p50']:.0f}ms, "
+                       f"{format_bytes(details['bytes']['mean'])}")
+            if errors:
+                message += f" ({len(errors)}/{len(probe_samples)} 失败: {errors[0]})"
+            results[index] = TestResult(
+                test_name=f"接口: {probe['name']}",
+                status=status,
+                message=message,
+                duration=percentile(latencies, 50),
+                details=details
+            )
+        return [results[index] for index in range(len(probes))]
+    
+    def run_catalog_mode(self, catalog_path: str, repeat: int = 1, concurrency: int = 8):
+        """运行接口探测目录并打印报告"""
+        probes = load_probe_catalog(catalog_path)
+        self.print_header("LLM Connection Test Tool v1.0 - 接口探测")
+        print(f"配置信息:")
+        print(f"  后端URL: {self.backend_url}")
+        print(f"  探测目录: {catalog_path} ({len(probes)} 个接口)")
+        print(f"  每个接口请求次数: {repeat}")
+        print(f"  并发数: {concurrency}")
+        print(f"  Token: {'已提供' if self.token else '未提供'}")
+        
+        start_time = time.perf_counter()
+        results = self.run_catalog(probes, repeat, concurrency)
+        elapsed = time.perf_counter() - start_time
+        self.results.extend(results)
+        
+        self.print_section("探测结果")
+        for result in results:
+            print(result)
+        
+        self.print_header("接口探测报告")
+        print(f"  {'接口':<30}{'请求':>6}{'失败':>6}{'p50':>10}{'p90':>10}{'max':>10}{'平均大小':>12}")
+        measured = [r for r in results if not r.details.get("skipped")]
+        for result in measured:
+            details = result.details
+            latency = details["latency_ms"]
+            name = result.test_name[len("接口: "):]
+            print(f"  {name:<30}{details['requests']:>6}{details['errors']:>6}"
+                  f"{latency['p50']:>8.0f}ms{latency['p90']:>8.0f}ms{latency['max']:>8.0f}ms"
+                  f"{format_bytes(details['bytes']['mean']):>12}")
+        
+        if measured:
+            self.print_section("最慢 / 最大的接口")
+            slowest = sorted(measured, key=lambda r: r.details["latency_ms"]["p50"], reverse=True)[:3]
+            heaviest = sorted(measured, key=lambda r: r.details["bytes"]["mean"], reverse=True)[:3]
+            print(f"  最慢: " + ", ".join(f"{r.test_name[len('接口: '):]} ({r.details['latency_ms']['p50']:.0f}ms)"
+                                        for r in slowest))
+            print(f"  最大: " + ", ".join(f"{r.test_name[len('接口: '):]} ({format_bytes(r.details['bytes']['mean'])})"
+                                        for r in heaviest))
+        
+        counts = summarize_results(results)
+        print(f"\n总耗时: {elapsed:.2f}s, 通过: {counts['passed']}, 失败: {counts['failed']}, 警告: {counts['warned']}")
+    
+    def _run_scaling_point(self, question: str, student_id: str, repeat: int,
+                           format_type: str, label: str, details: Dict) -> TestResult:
+        """规模测试中的单个测量点: 顺序发送 repeat 次相同请求"""
+        headers = self.build_headers()
+        payload = self.build_payload(question, format_type, student_id)
+        request_bytes = len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+        latencies: List[float] = []
+        sizes: List[int] = []
+        errors: List[str] = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            try:
+                response = self.session.post(self.chat_endpoint, json=payload, headers=headers,
+                                             timeout=self.timeout, stream=True)
+                body = BoundedBody.read(response, 0)
+                latencies.append(time.perf_counter() - start_time - throttle_wait(response))
+                if response.status_code == 200:
+                    sizes.append(body.bytes)
+                else:
+                    errors.append(f"状态码 {response.status_code}")
+            except requests.exceptions.Timeout:
+                errors.append("timeout")
+            except Exception as e:
+                errors.append(str(e))
+            with self._lock:
+                self.chat_calls += 1
+        
+        details = {
+            **details,
+            "student_id": student_id,
+            "question_chars": len(question),
+            "request_bytes": request_bytes,
+            "requests": repeat,
+            "errors": len(errors),
+            "latency_ms": latency_summary(latencies),
+            "response_bytes": sum(sizes) / len(sizes) if sizes else 0
+        }
+        if errors:
+            details["error"] = errors[0]
+        status = "PASS" if not errors else ("FAIL" if len(errors) == repeat else "WARN")
+        return TestResult(
+            test_name=f"规模测试 ({label})",
+            status=status,
+            message=(f"{label}: p50 {details['latency_ms']['p50']:.0f}ms, "
+                     f"请求 {format_bytes(request_bytes)}, 响应 {format_bytes(details['response_bytes'])}"),
+            duration=percentile(latencies, 50) if latencies else None,
+            details=details
+        )
+    
+    def run_scaling_benchmark(self, lengths: List[int], charsets: List[str], student_ids: List[str],
+                              question: str = "请分析我的学习成果数据", repeat: int = 3,
+                              format_type: str = "direct") -> List[TestResult]:
+        """规模测试: 问题长度 x 字符集 扫描（使用第一个学生ID），再用默认问题扫描学生ID"""
+        results = []
+        base_student = student_ids[0] if student_ids else self.student_id
+        for charset in charsets:
+            for length in lengths:
+                label = f"{charset}, {length}字符"
+                self.log(f"规模测试: {label}")
+                result = self._run_scaling_point(make_question(length, charset), base_student, repeat,
+                                                 format_type, label, {"sweep": "length", "charset": charset})
+                results.append(result)
+                print(result)
+        for student_id in student_ids:
+            label = f"学生 {student_id}"
+            self.log(f"规模测试: {label}")
+            result = self._run_scaling_point(question, student_id, repeat, format_type, label,
+                                             {"sweep": "student"})
+            results.append(result)
+            print(result)
+        return results
+    
+    def run_scaling_mode(self, lengths: List[int], charsets: List[str], student_ids: List[str],
+                         question: str = "请分析我的学习成果数据", repeat: int = 3,
+                         format_type: str = "direct"):
+        """运行规模测试并打印报告"""
+        self.print_header("LLM Connection Test Tool v1.0 - 规模测试")
+        print(f"配置信息:")
+        print(f"  API端点: {self.chat_endpoint}")
+        print(f"  问题长度: {', '.join(str(length) for length in lengths)}")
+        print(f"  字符集: {', '.join(charsets)}")
+        print(f"  学生ID: {', '.join(student_ids)}")
+        print(f"  每点请求次数: {repeat}")
+        
+        self.print_section("测量中")
+        results = self.run_scaling_benchmark(lengths, charsets, student_ids, question, repeat, format_type)
+        self.results.extend(results)
+        self.print_scaling_report(results)
+    
+    def print_scaling_report(self, results: List[TestResult]):
+        """打印规模测试报告，并按字符集估算延迟/响应大小随问题长度的规模指数"""
+        self.print_header("规模测试报告")
+        length_results = [r for r in results if r.details.get("sweep") == "length"]
+        student_results = [r for r in results if r.details.get("sweep") == "student"]
+        
+        if length_results:
+            self.print_section("问题长度")
+            print(f"  {'字符集':<10}{'长度':>8}{'请求大小':>10}{'p50':>10}{'max':>10}{'响应大小':>10}{'错误':>6}")
+            for result in length_results:
+                details = result.details
+                print(f"  {details['charset']:<10}{details['question_chars']:>8}"
+                      f"{format_bytes(details['request_bytes']):>10}{details['latency_ms']['p50']:>8.0f}ms"
+                      f"{details['latency_ms']['max']:>8.0f}ms{format_bytes(details['response_bytes']):>10}"
+                      f"{details['errors']:>6}")
+            
+            self.print_section("规模指数 (log-log 斜率)")
+            for charset in dict.fromkeys(r.details["charset"] for r in length_results):
+                points = [r for r in length_results if r.details["charset"] == charset and not r.details["errors"]]
+                latency_slope = loglog_slope([(r.details["question_chars"], r.details["latency_ms"]["p50"])
+                                              for r in points])
+                size_slope = loglog_slope([(r.details["question_chars"], r.details["response_bytes"])
+                                           for r in points])
+                if latency_slope is None:
+                    print(f"  {charset}: 有效数据点不足")
+                    continue
+                color = Colors.RED if latency_slope > 1.2 else Colors.GREEN
+                note = "超线性增长，请检查后端提示词拼接" if latency_slope > 1.2 else "增长正常"
+                print(f"  {charset}: 延迟 {color}{latency_slope:.2f}{Colors.END}, "
+                      f"响应大小 {size_slope if size_slope is not None else 0:.2f}  ({note})")
+        
+        if student_results:
+            self.print_section("学生ID")
+            print(f"  {'学生ID':<12}{'p50':>10}{'max':>10}{'响应大小':>10}{'错误':>6}")
+            for result in student_results:
+                details = result.details
+                print(f"  {details['student_id']:<12}{details['latency_ms']['p50']:>8.0f}ms"
+                      f"{details['latency_ms']['max']:>8.0f}ms{format_bytes(details['response_bytes']):>10}"
+                      f"{details['errors']:>6}")
+    
+    def _cache_sample(self, question: str, headers: Dict, format_type: str) -> Dict:
+        """缓存测试中的单次请求: 记录延迟、缓存响应头和回答摘要"""
+        sample = {"ok": False, "latency": None, "header_hit": None, "digest": None}
+        start_time = time.perf_counter()
+        try:
+            response = self.session.post(self.chat_endpoint, json=self.build_payload(question, format_type),
+                                         headers=headers, timeout=self.timeout, stream=True)
+            body = BoundedBody.read(response)
+            sample["latency"] = time.perf_counter() - start_time - throttle_wait(response)
+            for name in ("X-Cache", "X-Cache-Status", "CF-Cache-Status"):
+                if name in response.headers:
+                    sample["header_hit"] = response.headers[name].split(',')[0].strip().lower() in CACHE_HIT_VALUES
+                    break
+            else:
+                if response.headers.get("Age", "0").isdigit() and int(response.headers.get("Age", "0")) > 0:
+                    sample["header_hit"] = True
+            if response.status_code == 200:
+                sample["ok"] = True
+                _, ai_message = self.extract_ai_message(body.value())
+                # 摘要在读取时按完整文本增量计算，不需要保留完整回答
+                text = ai_message if isinstance(ai_message, KeptText) else body.text
+                sample["digest"] = text.digest[:16]
+            else:
+                sample["error"] = f"状态码 {response.status_code}"
+        except requests.exceptions.Timeout:
+            sample["error"] = "timeout"
+        except Exception as e:
+            sample["error"] = str(e)
+        with self._lock:
+            self.chat_calls += 1
+        return sample
+    
+    def run_cache_test(self, corpus: List[str], rounds: int = 3, seed: Optional[int] = None,
+                       format_type: str = "direct", hit_factor: float = 0.5) -> List[TestResult]:
+        """缓存测试: 按受控重复顺序逐个发送问题，比较首次与重复请求的延迟和回答"""
+        headers = self.build_headers()
+        samples = []
+        by_question: Dict[int, List[Dict]] = {}
+        for position, index in enumerate(cache_schedule(corpus, rounds, seed)):
+            question = corpus[index]
+            sample = self._cache_sample(question, headers, format_type)
+            sample["index"] = index
+            sample["first"] = index not in by_question
+            samples.append(sample)
+            by_question.setdefault(index, []).append(sample)
+            self.log(f"[{position + 1}] {'首次' if sample['first'] else '重复'} {question[:20]}: "
+                     f"{sample['latency'] * 1000 if sample['latency'] is not None else 0:.0f}ms")
+        
+        first = [s for s in samples if s["first"]]
+        repeats = [s for s in samples if not s["first"]]
+        first_latency = {s["index"]: s["latency"] for s in first if s["ok"]}
+        first_digest = {s["index"]: s["digest"] for s in first if s["ok"]}
+        errors = [s for s in samples if not s["ok"]]
+        results = []
+        
+        # 首次与重复请求的延迟分布
+        for name, group in (("首次请求", first), ("重复请求", repeats)):
+            latencies = [s["latency"] for s in group if s["ok"]]
+            summary = latency_summary(latencies)
+            results.append(TestResult(
+                test_name=f"缓存测试: {name}",
+                status="PASS" if latencies else "FAIL",
+                message=f"{len(latencies)}/{len(group)} 成功, p50 {summary['p50']:.0f}ms, p90 {summary['p90']:.0f}ms",
+                duration=percentile(latencies, 50) if latencies else None,
+                details={"requests": len(group), "errors": len(group) - len(latencies), "latency_ms": summary}
+            ))
+        
+        # 推断命中: 重复请求明显快于同一问题的首次请求; 后端返回缓存头时以响应头为准
+        comparable = [s for s in repeats if s["ok"] and s["index"] in first_latency]
+        header_samples = [s for s in comparable if s["header_hit"] is not None]
+        if header_samples:
+            hits = [s for s in header_samples if s["header_hit"]]
+            basis = "响应头"
+            total = len(header_samples)
+        else:
+            hits = [s for s in comparable if s["latency"] < first_latency[s["index"]] * hit_factor]
+            basis = f"延迟低于首次的 {hit_factor:.0%}"
+            total = len(comparable)
+        hit_ratio = len(hits) / total if total else 0.0
+        results.append(TestResult(
+            test_name="缓存命中率",
+            status="PASS" if hits else "WARN",
+            message=(f"推断命中率 {hit_ratio:.1%} ({len(hits)}/{total}, 依据: {basis})" if hits
+                     else f"未检测到缓存 (依据: {basis})"),
+            details={"hit_ratio": hit_ratio, "hits": len(hits), "repeats": total, "basis": basis,
+                     "hit_factor": hit_factor}
+        ))
+        
+        # 回答一致性: 重复请求的回答是否与首次相同，以及全部重复请求改由缓存应答可节省的时间
+        identical = [s for s in comparable if s["digest"] == first_digest.get(s["index"])]
+        identity_ratio = len(identical) / len(comparable) if comparable else 0.0
+        questions = []
+        for index, question in enumerate(corpus):
+            group = [s for s in by_question.get(index, []) if s["ok"]]
+            repeat_latencies = [s["latency"] for s in group if not s["first"]]
+            questions.append({
+                "question": question,
+                "requests": len(group),
+                "distinct_responses": len({s["digest"] for s in group}),
+                "first_ms": first_latency[index] * 1000 if index in first_latency else None,
+                "repeat_p50_ms": percentile(repeat_latencies, 50) * 1000 if repeat_latencies else None
+            })
+        total_time = sum(s["latency"] for s in samples if s["ok"])
+        hit_ids = {id(s) for s in hits}
+        missed_time = sum(s["latency"] for s in comparable if id(s) not in hit_ids)
+        results.append(TestResult(
+            test_name="回答一致性",
+            status="PASS" if comparable else "FAIL",
+            message=(f"{identity_ratio:.1%} 的重复请求回答与首次相同，"
+                     f"完全缓存重复问题可再节省 {missed_time / total_time if total_time else 0:.1%} 的请求时间"),
+            details={"identity_ratio": identity_ratio, "identical": len(identical), "repeats": len(comparable),
+                     "potential_saving": missed_time / total_time if total_time else 0.0,
+                     "errors": len(errors), "questions": questions}
+        ))
+        if errors:
+            results[-1].details["error"] = errors[0].get("error")
+        return results
+    
+    def run_cache_mode(self, corpus: List[str], rounds: int = 3, seed: Optional[int] = None,
+                       format_type: str = "direct", hit_factor: float = 0.5):
+        """运行缓存测试并打印报告"""
+        self.print_header("LLM Connection Test Tool v1.0 - 缓存测试")
+        print(f"配置信息:")
+        print(f"  API端点: {self.chat_endpoint}")
+        print(f"  问题数: {len(corpus)}, 每个问题请求 {rounds} 次, 共 {len(corpus) * rounds} 个请求")
+        print(f"  随机种子: {seed if seed is not None else '未设置'}")
+        
+        self.print_section("测量中")
+        results = self.run_cache_test(corpus, rounds, seed, format_type, hit_factor)
+        self.results.extend(results)
+        for result in results:
+            print(result)
+        self.print_cache_report(results)
+    
+    def print_cache_report(self, results: List[TestResult]):
+        """打印缓存测试的逐问题明细和结论"""
+        self.print_header("缓存测试报告")
+        identity = next(r for r in results if r.test_name == "回答一致性")
+        hit_rate = next(r for r in results if r.test_name == "缓存命中率")
+        
+        self.print_section("逐问题明细")
+        print(f"  {'首次':>8}{'重复p50':>10}{'请求':>6}{'不同回答':>8}  问题")
+        for item in identity.details["questions"]:
+            first_ms = f"{item['first_ms']:.0f}ms" if item["first_ms"] is not None else "-"
+            repeat_ms = f"{item['repeat_p50_ms']:.0f}ms" if item["repeat_p50_ms"] is not None else "-"
+            print(f"  {first_ms:>8}{repeat_ms:>10}{item['requests']:>6}{item['distinct_responses']:>8}  "
+                  f"{item['question'][:30]}")
+        
+        self.print_section("结论")
+        if hit_rate.details["hits"]:
+            print(f"  {Colors.GREEN}后端已有缓存生效，命中率 {hit_rate.details['hit_ratio']:.1%}{Colors.END}")
+        else:
+            print(f"  {Colors.YELLOW}未检测到缓存，重复问题的延迟与首次相当{Colors.END}")
+        if identity.details["identity_ratio"] >= 0.99:
+            print(f"  回答完全确定，缓存不会改变用户看到的内容")
+        else:
+            print(f"  回答存在差异 (一致率 {identity.details['identity_ratio']:.1%})，"
+                  f"缓存会固定第一次的回答，需要评估是否可以接受")
+        print(f"  缓存所有重复问题可节省约 {identity.details['potential_saving']:.1%} 的请求时间")
+    
+    def _replay_request(self, entry: Dict, scheduled_at: Optional[float], results: ReplayResults) -> int:
+        """回放日志中的单个请求，结果记入 results，返回其编号"""
+        headers = self.build_headers()
+        payload = self.build_payload(entry["question"], entry["format"], entry["student_id"])
+        start_time = time.perf_counter()
+        lag_ms = max(0.0, start_time - scheduled_at) * 1000 if scheduled_at is not None else None
+        status_code = response_bytes = error = None
+        throttled = 0.0
+        try:
+            response = self.session.post(self.chat_endpoint, json=payload, headers=headers,
+                                         timeout=self.timeout, stream=True)
+            throttled = throttle_wait(response)
+            status_code = response.status_code
+            response_bytes = BoundedBody.read(response, 0).bytes
+        except requests.exceptions.Timeout as e:
+            error = "timeout"
+            throttled = throttled or throttle_wait(e)
+        except Exception as e:
+            error = str(e)
+            throttled = throttled or throttle_wait(e)
+        duration = time.perf_counter() - start_time - throttled
+        with self._lock:
+            self.chat_calls += 1
+            return results.append(entry, duration, lag_ms, status_code, response_bytes, error)
+    
+    def run_replay(self, path: str, speed: float = 1.0, concurrency: int = 8,
+                   limit: Optional[int] = None) -> Tuple[ReplayResults, TestResult]:
+        """按原始节奏（speed 倍速，0 表示不等待）回放请求日志，在途请求不超过 concurrency
+        
+        日志逐行读取；在途请求达到上限时读取暂停，由此产生的发送延后记录为 lag_ms。
+        返回 (按行号排序的单请求结果, 汇总结果)，单请求结果按列保存，不逐个构建 TestResult。
+        """
+        requests_done = ReplayResults()
+        invalid: List[Dict] = []
+        in_flight = threading.BoundedSemaphore(concurrency)
+        
+        def fire(entry: Dict, scheduled_at: Optional[float]):
+            try:
+                index = self._replay_request(entry, scheduled_at, requests_done)
+                if self.verbose:
+                    with self._lock:
+                        result = requests_done[index]
+                    self.log(f"{result.test_name}: {result.message}")
+            finally:
+                in_flight.release()
+        
+        run_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            sent = 0
+            for entry in iter_replay_log(path, self.student_id):
+                if "invalid" in entry:
+                    invalid.append(entry)
+                    self.log(f"跳过第 {entry['line']} 行: {entry['invalid']}")
+                    continue
+                if limit is not None and sent >= limit:
+                    break
+                scheduled_at = None
+                if speed > 0 and entry["offset"] is not None:
+                    scheduled_at = run_start + entry["offset"] / speed
+                    delay = scheduled_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                in_flight.acquire()
+                executor.submit(fire, entry, scheduled_at)
+                sent += 1
+        wall_time = time.perf_counter() - run_start
+        
+        requests_done.sort()
+        latencies = [duration for duration, code in zip(requests_done.duration, requests_done.status_code)
+                     if code == 200]
+        lags = [lag for lag in requests_done.lag_ms if lag == lag]
+        count = len(requests_done)
+        errors = count - len(latencies)
+        status_codes: Dict[str, int] = {}
+        for code, total in Counter(requests_done.status_code).items():
+            if code >= 0:
+                status_codes[str(code)] = total
+        for error, total in Counter(error for error in requests_done.error if error >= 0).items():
+            status_codes[requests_done.strings[error]] = total
+        details = {
+            "file": path,
+            "speed": speed,
+            "concurrency": concurrency,
+            "requests": count,
+            "errors": errors,
+            "error_rate": errors / count if count else 0.0,
+            "invalid_lines": len(invalid),
+            "wall_time_s": wall_time,
+            "throughput_rps": count / wall_time if wall_time > 0 else 0.0,
+            "latency_ms": latency_summary(latencies),
+            "max_lag_ms": max(lags) if lags else 0.0,
+            "status_codes": status_codes
+        }
+        if count == 0 or errors == count:
+            status = "FAIL"
+        elif errors or invalid:
+            status = "WARN"
+        else:
+            status = "PASS"
+        summary = TestResult(
+            test_name="回放汇总",
+            status=status,
+            message=(f"{count} 个请求, 错误率 {details['error_rate']*100:.1f}%, "
+                     f"p50 {details['latency_ms']['p50']:.0f}ms, p99 {details['latency_ms']['p99']:.0f}ms"),
+            details=details
+        )
+        return requests_done, summary
+    
+    def compare_replay(self, current: ReplayResults, baseline: Dict[str, Dict],
+                       alpha: float = 0.01, min_effect: float = 0.2, min_delta_ms: float = 5.0) -> TestResult:
+        """按请求键对比两次回放: 同一请求的延迟差、状态变化和整体延迟分布的显著性"""
+        keys = (current.key(index) for index in range(len(current)))
+        pairs = [(baseline[key], index) for index, key in enumerate(keys) if key in baseline]
+        codes = current.status_code
+        both_ok = [(old, index) for old, index in pairs if old.get("status_code") == 200 and codes[index] == 200]
+        base_lat = [old["latency_ms"] for old, _ in both_ok]
+        new_lat = [current.duration[index] * 1000 for _, index in both_ok]
+        deltas = [new - old for old, new in zip(base_lat, new_lat)]
+        new_failures = sum(1 for old, index in pairs if old.get("status_code") == 200 and codes[index] != 200)
+        fixed = sum(1 for old, index in pairs if old.get("status_code") != 200 and codes[index] == 200)
+        slowest = sorted(((delta, current.line[index]) for delta, (_, index) in zip(deltas, both_ok)),
+                         reverse=True)[:5]
+        
+        base_p50, new_p50 = percentile(base_lat, 50), percentile(new_lat, 50)
+        latency_p = mann_whitney_p(base_lat, new_lat)
+        regression = (latency_p < alpha and new_p50 > base_p50 * (1 + min_effect)
+                      and new_p50 - base_p50 >= min_delta_ms)
+        details = {
+            "matched": len(pairs),
+            "unmatched": len(current) - len(pairs),
+            "baseline_ms": latency_summary([v / 1000 for v in base_lat]),
+            "current_ms": latency_summary([v / 1000 for v in new_lat]),
+            "median_delta_ms": percentile(deltas, 50),
+            "slower_requests": sum(1 for d in deltas if d > 0),
+            "new_failures": new_failures,
+            "fixed_failures": fixed,
+            "latency_p_value": latency_p,
+            "latency_regression": regression,
+            "slowest": [{"line": line, "delta_ms": delta} for delta, line in slowest]
+        }
+        if not pairs:
+            status, message = "FAIL", "没有与基线匹配的请求，请确认使用了同一个日志文件"
+        elif regression or new_failures:
+            status = "FAIL"
+            message = (f"性能回退: p50 {base_p50:.0f}ms -> {new_p50:.0f}ms (p={latency_p:.4f}), "
+                       f"新增失败 {new_failures}")
+        else:
+            status = "PASS"
+            message = (f"未发现回退: p50 {base_p50:.0f}ms -> {new_p50:.0f}ms, "
+                       f"逐请求中位差 {details['median_delta_ms']:+.0f}ms")
+        return TestResult(test_name="回放对比", status=status, message=message, details=details)
+    
+    def run_replay_mode(self, path: str, speed: float = 1.0, concurrency: int = 8,
+                        limit: Optional[int] = None, baseline: Optional[Dict[str, Dict]] = None,
+                        alpha: float = 0.01, min_effect: float = 0.2) -> bool:
+        """运行请求回放并打印报告，提供基线时返回是否发现回退"""
+        self.print_header("LLM Connection Test Tool v1.0 - 请求回放")
+        print(f"配置信息:")
+        print(f"  API端点: {self.chat_endpoint}")
+        print(f"  请求日志: {path}")
+        print(f"  回放速度: {'不等待' if speed <= 0 else f'{speed}x'}")
+        print(f"  最大在途请求: {concurrency}")
+        if baseline is not None:
+            print(f"  基线请求数: {len(baseline)}")
+        
+        self.print_section("回放中")
+        per_request, summary = self.run_replay(path, speed, concurrency, limit)
+        self.replay_results = per_request
+        self.results.append(summary)
+        print(summary)
+        
+        self.print_header("回放报告")
+        details = summary.details
+        latency = details["latency_ms"]
+        print(f"  请求数: {details['requests']} (无效行 {details['invalid_lines']})")
+        print(f"  耗时: {details['wall_time_s']:.1f}s, 吞吐: {details['throughput_rps']:.2f} req/s")
+        print(f"  延迟: p50 {latency['p50']:.0f}ms, p90 {latency['p90']:.0f}ms, "
+              f"p99 {latency['p99']:.0f}ms, max {latency['max']:.0f}ms")
+        print(f"  最大发送延后: {details['max_lag_ms']:.0f}ms")
+        print(f"  状态码: {', '.join(f'{k}={v}' for k, v in sorted(details['status_codes'].items()))}")
+        if details["max_lag_ms"] > 1000:
+            print(f"  {Colors.YELLOW}发送延后超过1秒，回放节奏受在途请求上限影响，"
+                  f"可调大 --replay-concurrency{Colors.END}")
+        
+        if baseline is None:
+            return False
+        comparison = self.compare_replay(per_request, baseline, alpha, min_effect)
+        self.results.append(comparison)
+        self.print_section("与基线对比")
+        print(comparison)
+        cmp = comparison.details
+        print(f"  匹配请求: {cmp['matched']} (未匹配 {cmp['unmatched']})")
+        print(f"  {'':<8}{'p50':>10}{'p90':>10}{'p99':>10}")
+        for label, key in (("基线", "baseline_ms"), ("本次", "current_ms")):
+            print(f"  {label:<8}{cmp[key]['p50']:>8.0f}ms{cmp[key]['p90']:>8.0f}ms{cmp[key]['p99']:>8.0f}ms")
+        print(f"  变慢的请求: {cmp['slower_requests']}, 新增失败: {cmp['new_failures']}, "
+              f"修复的失败: {cmp['fixed_failures']}")
+        for item in cmp["slowest"]:
+            if item["delta_ms"] > 0:
+                print(f"    第 {item['line']} 行: {item['delta_ms']:+.0f}ms")
+        return comparison.status == "FAIL"
+    
+    def _create_async_engine(self, max_connections: int):
+        """创建指向聊天端点的异步请求引擎 (async_probe_engine.py)"""
+        from async_probe_engine import AsyncProbeEngine
+        if self.limiter is not None and self.limiter.max_in_flight("chat") is not None:
+            max_connections = min(max_connections, self.limiter.max_in_flight("chat"))
+        return AsyncProbeEngine(self.chat_endpoint, max_connections=max_connections,
+                                keep_alive=self.keep_alive, timeout=self.timeout, stream=self.stream,
+                                verify=self.session.verify, limiter=self.limiter)
+    
+    def _async_identity(self, payload: Dict, headers: Dict[str, str]) -> Optional[Callable[[int], Tuple[bytes, Dict[str, str]]]]:
+        """异步引擎按虚拟用户编号取 (请求体字节, 请求头)，未配置账号池时返回 None"""
+        if self.accounts is None:
+            return None
+        
+        def identity(index: int) -> Tuple[bytes, Dict[str, str]]:
+            body, identity_headers = self.identity_request(payload, headers, index)
+            return json.dumps(body).encode('utf-8'), identity_headers
+        
+        return identity
+    
+    def _send_load_request(self, payload: Dict, headers: Dict[str, str]) -> Tuple[str, bool, float]:
+        """负载测试中发送一次聊天请求，返回 (状态码或错误类型, 是否成功, 扣除限流等待的耗时秒)
+        
+        配置了重试或对冲时经过 send_request，耗时包含退避等待和对冲延迟。
+        """
+        start_time = time.perf_counter()
+        throttled = 0.0
+        try:
+            if self.retry is not None or self.hedger is not None:
+                response, timing = self.send_request('POST', self.chat_endpoint, json=payload,
+                                                     headers=headers, timeout=self.timeout, body_limit=0)
+                return str(response.status_code), response.status_code == 200, timing["total_ms"] / 1000
+            response = self.session.post(self.chat_endpoint, json=payload,
+                                         headers=headers, timeout=self.timeout, stream=True)
+            throttled = throttle_wait(response)
+            # 负载测试只关心状态码和耗时，响应体只计字节数
+            BoundedBody.read(response, 0)
+            key, ok = str(response.status_code), response.status_code == 200
+        except requests.exceptions.Timeout as e:
+            key, ok = "timeout", False
+            throttled = throttled or throttle_wait(e)
+        except Exception as e:
+            key, ok = "error", False
+            throttled = throttled or throttle_wait(e)
+        return key, ok, time.perf_counter() - start_time - throttled
+    
+    def run_open_load_test(self, question: str = "请分析我的学习成果数据", rate: float = 5.0,
+                           duration: float = 30.0, arrival: str = "constant",
+                           ramp_to: Optional[float] = None, format_type: str = "direct",
+                           max_in_flight: int = 256, seed: Optional[int] = None) -> TestResult:
+        """开放模型负载测试: 按目标速率发出请求，发送时间与响应快慢无关
+        
+        延迟从计划到达时间开始计算，客户端排队时间也计入，避免协调遗漏；
+        在途请求达到 max_in_flight 时新到达的请求记为丢弃，而不是推迟发送。
+        """
+        headers = self.build_headers()
+        payload = self.build_payload(question, format_type)
+        
+        lock = threading.Lock()
+        in_flight = threading.BoundedSemaphore(max_in_flight)
+        latencies: List[float] = []
+        service_times: List[float] = []
+        status_codes: Dict[str, int] = {}
+        counters = {"scheduled": 0, "dropped": 0, "errors": 0}
+        
+        def fire(scheduled_at: float, index: int):
+            try:
+                key, ok, service_time = self._send_load_request(*self.identity_request(payload, headers, index))
+                latency = time.perf_counter() - scheduled_at
+                with lock:
+                    latencies.append(latency)
+                    service_times.append(service_time)
+                    if self.samples is not None:
+                        self.samples.record(key, ok, latency)
+                    status_codes[key] = status_codes.get(key, 0) + 1
+                    if not ok:
+                        counters["errors"] += 1
+            finally:
+                in_flight.release()
+        
+        self.log(f"开放模型负载开始: 速率={rate}/s, 到达={arrival}, 持续={duration}s, 引擎={self.engine}")
+        offsets = arrival_offsets(rate, duration, arrival, ramp_to, seed)
+        first_bytes: List[float] = []
+        run_start = time.perf_counter()
+        if self.engine == "async":
+            def on_result(outcome, scheduled_at: float):
+                counters["scheduled"] += 1
+                latencies.append(time.perf_counter() - scheduled_at)
+                service_times.append(outcome.total)
+                if self.samples is not None:
+                    self.samples.record(outcome.key, outcome.ok, latencies[-1], outcome.ttft)
+                status_codes[outcome.key] = status_codes.get(outcome.key, 0) + 1
+                if outcome.ttft is not None and outcome.ok:
+                    first_bytes.append(outcome.ttft)
+                if not outcome.ok:
+                    counters["errors"] += 1
+            
+            def on_drop():
+                counters["scheduled"] += 1
+                counters["dropped"] += 1
+            
+            self._create_async_engine(max_in_flight).run_open_loop(
+                json.dumps(payload).encode('utf-8'), headers, offsets, max_in_flight, on_result, on_drop,
+                self._async_identity(payload, headers))
+        else:
+            # 在途请求由 in_flight 限制在 max_in_flight 以内，线程池大小与之相同，提交的请求不会在池中积压
+            with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+                for offset in offsets:
+                    delay = run_start + offset - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    counters["scheduled"] += 1
+                    if not in_flight.acquire(blocking=False):
+                        counters["dropped"] += 1
+                        continue
+                    executor.submit(fire, run_start + offset, counters["scheduled"])
+        wall_time = time.perf_counter() - run_start
+        
+        count = len(latencies)
+        scheduled = counters["scheduled"]
+        errors = counters["errors"]
+        offered = rate if arrival != "ramp" or ramp_to is None else (rate + ramp_to) / 2
+        details = {
+            "format": format_type,
+            "engine": self.engine,
+            "arrival": arrival,
+            "offered_rps": offered,
+            "achieved_rps": count / wall_time if wall_time > 0 else 0.0,
+            "scheduled": scheduled,
+            "requests": count,
+            "dropped": counters["dropped"],
+            "errors": errors,
+            "error_rate": errors / count if count else 0.0,
+            "drop_rate": counters["dropped"] / scheduled if scheduled else 0.0,
+            "wall_time_s": wall_time,
+            "max_in_flight": max_in_flight,
+            "latency_ms": latency_summary(latencies),
+            "service_latency_ms": latency_summary(service_times),
+            "status_codes": status_codes
+        }
+        if ramp_to is not None and arrival == "ramp":
+            details["ramp_to_rps"] = ramp_to
+        if first_bytes and self.stream:
+            details["ttft_ms"] = latency_summary(first_bytes)
+        
+        message = (f"目标 {offered:.1f} req/s, 实际 {details['achieved_rps']:.1f} req/s, "
+                   f"错误率 {details['error_rate']*100:.1f}%, 丢弃 {counters['dropped']}, "
+                   f"p99 {details['latency_ms']['p99']:.0f}ms")
+        if count == 0 or errors == count:
+            status = "FAIL"
+        elif errors or counters["dropped"]:
+            status = "WARN"
+        else:
+            status = "PASS"
+        return TestResult(test_name=f"开放模型负载 ({format_type.capitalize()})", status=status,
+                          message=message, details=details)
+    
+    def find_max_rps(self, question: str = "请分析我的学习成果数据", start_rate: float = 5.0,
+                     step: float = 5.0, max_rate: float = 200.0, step_duration: float = 30.0,
+                     p99_threshold_ms: float = 10000.0, error_threshold: float = 0.01,
+                     arrival: str = "constant", format_type: str = "direct",
+                     max_in_flight: int = 256, seed: Optional[int] = None) -> Tuple[Optional[float], List[TestResult]]:
+        """逐级提高到达速率，直到 p99 延迟、错误率或丢弃率超过阈值，返回 (最大可持续速率, 各级结果)"""
+        steps: List[TestResult] = []
+        sustainable = None
+        rate = start_rate
+        while rate <= max_rate:
+            result = self.run_open_load_test(question, rate, step_duration, arrival, None,
+                                             format_type, max_in_flight, seed)
+            details = result.details
+            violations = []
+            if details["latency_ms"]["p99"] > p99_threshold_ms:
+                violations.append(f"p99 {details['latency_ms']['p99']:.0f}ms > {p99_threshold_ms:.0f}ms")
+            if details["error_rate"] > error_threshold:
+                violations.append(f"错误率 {details['error_rate']*100:.1f}% > {error_threshold*100:.1f}%")
+            if details["drop_rate"] > error_threshold:
+                violations.append(f"丢弃率 {details['drop_rate']*100:.1f}% (在途请求达到上限)")
+            details["violations"] = violations
+            steps.append(result)
+            print(result)
+            if violations:
+                print(f"    {Colors.RED}超过阈值: {'; '.join(violations)}{Colors.END}")
+                break
+            sustainable = rate
+            rate += step
+        return sustainable, steps
+    
+    def run_open_load_mode(self, question: str = "请分析我的学习成果数据", rate: float = 5.0,
+                           duration: float = 30.0, arrival: str = "constant",
+                           ramp_to: Optional[float] = None, format_type: str = "direct",
+                           max_in_flight: int = 256, seed: Optional[int] = None,
+                           find_max: bool = False, rate_step: float = 5.0, max_rate: float = 200.0,
+                           p99_threshold_ms: float = 10000.0, error_threshold: float = 0.01):
+        """运行开放模型负载测试（或最大可持续速率搜索）并打印报告"""
+        self.print_header("LLM Connection Test Tool v1.0 - 开放模型负载")
+        print(f"配置信息:")
+        print(f"  API端点: {self.chat_endpoint}")
+        print(f"  请求格式: {format_type}")
+        print(f"  到达模型: {arrival}")
+        print(f"  最大在途请求: {max_in_flight}")
+        if self.accounts is not None:
+            print(f"  测试账号: {len(self.accounts.active)} 个，请求轮流使用")
+        
+        if not find_max:
+            print(f"  目标速率: {rate} req/s" + (f" → {ramp_to} req/s" if arrival == "ramp" and ramp_to else ""))
+            print(f"  持续时间: {duration}s")
+            self.print_section("负载测试进行中")
+            result = self.run_open_load_test(question, rate, duration, arrival, ramp_to,
+                                             format_type, max_in_flight, seed)
+            self.results.append(result)
+            print(result)
+            self.print_load_report(result)
+            return
+        
+        print(f"  速率搜索: 从 {rate} req/s 开始, 每级 +{rate_step} req/s, 上限 {max_rate} req/s")
+        print(f"  每级持续: {duration}s")
+        print(f"  阈值: p99 <= {p99_threshold_ms:.0f}ms, 错误率 <= {error_threshold*100:.1f}%")
+        self.print_section("逐级加压")
+        sustainable, steps = self.find_max_rps(question, rate, rate_step, max_rate, duration,
+                                               p99_threshold_ms, error_threshold, arrival,
+                                               format_type, max_in_flight, seed)
+        self.results.extend(steps)
+        
+        self.print_header("最大可持续速率")
+        print(f"  {'目标速率':>10}{'实际速率':>10}{'请求':>8}{'错误率':>9}{'丢弃':>6}{'p50':>10}{'p99':>10}")
+        for result in steps:
+            details = result.details
+            print(f"  {details['offered_rps']:>10.1f}{details['achieved_rps']:>10.1f}{details['requests']:>8}"
+                  f"{details['error_rate']*100:>8.1f}%{details['dropped']:>6}"
+                  f"{details['latency_ms']['p50']:>8.0f}ms{details['latency_ms']['p99']:>8.0f}ms")
+        print()
+        if sustainable is None:
+            print(f"{Colors.RED}✗ 起始速率 {rate} req/s 已超过阈值{Colors.END}")
+        elif steps and not steps[-1].details["violations"]:
+            print(f"{Colors.YELLOW}⚠ 达到速率上限 {sustainable} req/s 仍未超过阈值{Colors.END}")
+        else:
+            print(f"{Colors.GREEN}✓ 最大可持续速率: {sustainable} req/s{Colors.END}")
+    
+    def _drive_closed_loop(self, payload: Dict, headers: Dict[str, str], concurrency: int,
+                           duration: Optional[float], total_requests: Optional[int],
+                           record: Callable[[str, bool, float, Optional[float]], None]) -> float:
+        """闭环驱动: concurrency 个虚拟用户循环发送，直到达到持续时间或请求总数，返回墙钟耗时
+        
+        每个请求完成后调用 record(状态码或错误类型, 是否成功, 耗时秒, 首字节秒或None)；
+        线程引擎下 record 在锁内调用。
+        """
+        run_start = time.perf_counter()
+        if self.engine == "async":
+            def on_result(outcome):
+                record(outcome.key, outcome.ok, outcome.total, outcome.ttft)
+            
+            self._create_async_engine(concurrency).run_closed_loop(
+                json.dumps(payload).encode('utf-8'), headers, concurrency, duration, total_requests, on_result,
+                self._async_identity(payload, headers))
+            return time.perf_counter() - run_start
+        
+        deadline = run_start + duration if duration is not None else None
+        lock = threading.Lock()
+        issued = [0]
+        
+        def claim() -> bool:
+            with lock:
+                if total_requests is not None and issued[0] >= total_requests:
+                    return False
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return False
+                issued[0] += 1
+                return True
+        
+        def virtual_user(index: int):
+            while claim():
+                key, ok, elapsed = self._send_load_request(*self.identity_request(payload, headers, index))
+                with lock:
+                    record(key, ok, elapsed, None)
+        
+        threads = [threading.Thread(target=virtual_user, args=(index,), daemon=True) for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - run_start
+    
+    def run_load_shard(self, question: str, concurrency: int, duration: Optional[float],
+                       total_requests: Optional[int], format_type: str = "direct",
+                       start_at: Optional[float] = None) -> Dict:
+        """运行负载测试的一个分片，返回可合并的统计 (直方图序列化为字典)
+        
+        start_at 为 Unix 时间戳，各分片等到同一时刻再开始，使持续时间窗口对齐。
+        """
+        headers = self.build_headers()
+        payload = self.build_payload(question, format_type)
+        histogram = LatencyHistogram(LOAD_BUCKETS_MS)
+        first_bytes = LatencyHistogram(LOAD_BUCKETS_MS)
+        status_codes: Dict[str, int] = {}
+        errors = [0]
+        
+        def record(key: str, ok: bool, seconds: float, ttft: Optional[float]):
+            histogram.record(seconds)
+            if self.samples is not None:
+                self.samples.record(key, ok, seconds, ttft)
+            status_codes[key] = status_codes.get(key, 0) + 1
+            if ttft is not None and ok:
+                first_bytes.record(ttft)
+            if not ok:
+                errors[0] += 1
+        
+        if start_at is not None and start_at > time.time():
+            time.sleep(start_at - time.time())
+        wall_time = self._drive_closed_loop(payload, headers, concurrency, duration, total_requests, record)
+        return {
+            "concurrency": concurrency,
+            "requests": histogram.count,
+            "errors": errors[0],
+            "wall_time_s": wall_time,
+            "status_codes": status_codes,
+            "histogram": histogram.to_dict(),
+            "ttft_histogram": first_bytes.to_dict(),
+            "throttle": self.limiter.summary() if self.limiter is not None else {},
+            "retry": self.retry.summary() if self.retry is not None else None,
+            "hedge_snapshots": [self.hedger.snapshot()] if self.hedger is not None else [],
+            "samples": self.samples.to_dict() if self.samples is not None else None
+        }
+    
+    def _shard_config(self, share: float, offset: int = 0, concurrency: Optional[Dict[str, int]] = None) -> Dict:
+        """子进程或负载代理重建测试器所需的配置，限流速率按份额 share 分配
+        
+        offset 为该分片第一个虚拟用户的全局编号，使各分片的虚拟用户分配到不同的账号；
+        concurrency 为该分片的在途上限（见 _split_concurrency）。
+        """
+        return {
+            "backend_url": self.backend_url,
+            "token": self.token,
+            "student_id": self.student_id,
+            "keep_alive": self.keep_alive,
+            "stream": self.stream,
+            "engine": self.engine,
+            "limiter": self.limiter.to_spec(share, concurrency) if self.limiter is not None else None,
+            "timeout": self.timeout,
+            "retry": self.retry.to_spec() if self.retry is not None else None,
+            "hedger": self.hedger.to_spec() if self.hedger is not None else None,
+            "accounts": self.accounts.to_spec(offset) if self.accounts is not None else None,
+            "samples": self.samples is not None
+        }
+    
+    def _split_concurrency(self, shares: List[Tuple[int, Optional[int]]]) -> List[Optional[Dict[str, int]]]:
+        """按各分片的虚拟用户数拆分在途上限，各分片之和等于全局上限；未限流时为 None"""
+        if self.limiter is None:
+            return [None] * len(shares)
+        return self.limiter.split_concurrency([share for share, _ in shares])
+    
+    def _run_load_workers(self, question: str, concurrency: int, duration: Optional[float],
+                          total_requests: Optional[int], format_type: str, workers: int,
+                          start_at: Optional[float] = None) -> Dict:
+        """将虚拟用户分配到 workers 个子进程，返回合并后的分片统计"""
+        # 子进程启动和导入需要时间，统一在稍后的同一时刻开始
+        if start_at is None:
+            start_at = time.time() + 1.0 + 0.1 * workers
+        context = multiprocessing.get_context("spawn")
+        shares = split_load(concurrency, total_requests, workers)
+        offsets = [sum(share for share, _ in shares[:index]) for index in range(len(shares))]
+        caps = self._split_concurrency(shares)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [executor.submit(_load_worker, self._shard_config(share / concurrency, offset, cap), question,
+                                       share, duration, request_share, format_type, start_at)
+                       for (share, request_share), offset, cap in zip(shares, offsets, caps)]
+            shards = [future.result() for future in futures]
+        return merge_load_shards(shards)
+    
+    def _sync_agent(self, address: str, key: Optional[str] = None) -> Tuple[socket.socket, Any, float]:
+        """连接负载代理并估算时钟偏差（代理时间 - 本机时间），取往返最短的一次测量"""
+        host, port = address.rsplit(':', 1)
+        try:
+            sock = socket.create_connection((host, int(port)), timeout=10)
+        except OSError as e:
+            raise OSError(f"无法连接代理 {address}: {e}") from e
+        stream = sock.makefile('rwb')
+        best_rtt, offset = None, 0.0
+        for _ in range(5):
+            sent = time.time()
+            send_message(stream, {"type": "ping", "key": key})
+            reply = recv_message(stream)
+            received = time.time()
+            if reply.get("type") != "pong":
+                stream.close()
+                sock.close()
+                raise RuntimeError(f"代理 {address} 拒绝连接: {reply.get('message')}")
+            if best_rtt is None or received - sent < best_rtt:
+                best_rtt = received - sent
+                offset = reply["time"] - (sent + received) / 2
+        self.log(f"代理 {address}: 时钟偏差 {offset*1000:+.1f}ms, 往返 {best_rtt*1000:.1f}ms")
+        return sock, stream, offset
+    
+    def _run_load_agents(self, question: str, concurrency: int, duration: Optional[float],
+                         total_requests: Optional[int], format_type: str, agents: List[str],
+                         key: Optional[str] = None) -> Dict:
+        """协调器: 将虚拟用户分配给各负载代理，按各自的时钟偏差对齐开始时刻，合并返回的分片"""
+        shares = split_load(concurrency, total_requests, len(agents))
+        caps = self._split_concurrency(shares)
+        connections = []
+        try:
+            with ThreadPoolExecutor(max_workers=len(agents)) as executor:
+                for future in [executor.submit(self._sync_agent, address, key) for address in agents]:
+                    connections.append(future.result())
+            
+            start_at = time.time() + 1.0
+            first_user = 0
+            for (sock, stream, offset), (share, request_share), cap in zip(connections, shares, caps):
+                config = self._shard_config(share / concurrency, first_user, cap)
+                first_user += share
+                send_message(stream, {
+                    "type": "run", "key": key, "config": config, "question": question,
+                    "concurrency": share, "duration": duration, "total_requests": request_share,
+                    "format": format_type, "start_at": start_at + offset
+                })
+                # 等待结果时不设超时: 按请求总数运行时无法预估耗时
+                sock.settimeout(None)
+            
+            shards = []
+            for address, (_, stream, offset) in zip(agents, connections):
+                reply = recv_message(stream)
+                if reply.get("type") != "result":
+                    raise RuntimeError(f"代理 {address} 运行失败: {reply.get('message')}")
+                # 样本时间换算到本机时钟
+                if reply["shard"].get("samples"):
+                    reply["shard"]["samples"]["started_at"] -= offset
+                shards.append(reply["shard"])
+        finally:
+            for sock, stream, _ in connections:
+                stream.close()
+                sock.close()
+        return merge_load_shards(shards, labels=agents)
+    
+    def run_load_test(self, question: str = "请分析我的学习成果数据", concurrency: int = 10,
+                      duration: Optional[float] = None, total_requests: Optional[int] = None,
+                      format_type: str = "direct", workers: int = 1,
+                      agents: Optional[List[str]] = None, agent_key: Optional[str] = None) -> TestResult:
+        """负载测试: N个虚拟用户并发请求聊天端点，直到达到持续时间或请求总数
+        
+        workers > 1 时虚拟用户分配到多个子进程；提供 agents 时分配到各负载代理。
+        各进程/代理汇总自己的直方图，由本进程合并。
+        """
+        if duration is None and total_requests is None:
+            total_requests = concurrency * 10
+        test_name = f"负载测试 ({format_type.capitalize()})"
+        
+        self.log(f"负载测试开始: 并发={concurrency}, 格式={format_type}, 引擎={self.engine}, "
+                 f"进程数={workers}, 代理={len(agents) if agents else 0}")
+        if workers > 1 or agents:
+            try:
+                if agents:
+                    merged = self._run_load_agents(question, concurrency, duration, total_requests,
+                                                   format_type, agents, agent_key)
+                else:
+                    merged = self._run_load_workers(question, concurrency, duration, total_requests,
+                                                    format_type, workers)
+            except (OSError, RuntimeError, ValueError) as e:
+                return TestResult(test_name=test_name, status="FAIL", message=f"分布式负载失败: {e}",
+                                  details={"format": format_type, "error": str(e)})
+            histogram = LatencyHistogram.from_dict(merged["histogram"])
+            first_byte_histogram = LatencyHistogram.from_dict(merged["ttft_histogram"])
+            if self.samples is not None and merged.get("samples"):
+                self.samples.extend(SampleLog.from_dict(merged["samples"]))
+            count = histogram.count
+            error_count = merged["errors"]
+            status_codes = merged["status_codes"]
+            wall_time = merged["wall_time_s"]
+            latency = histogram.summary()
+            ttft = first_byte_histogram.summary() if first_byte_histogram.count else None
+        else:
+            headers = self.build_headers()
+            payload = self.build_payload(question, format_type)
+            latencies: List[float] = []
+            first_bytes: List[float] = []
+            status_codes = {}
+            errors = [0]
+            
+            def record(key: str, ok: bool, seconds: float, first_byte: Optional[float]):
+                latencies.append(seconds)
+                if self.samples is not None:
+                    self.samples.record(key, ok, seconds, first_byte)
+                status_codes[key] = status_codes.get(key, 0) + 1
+                if first_byte is not None and ok:
+                    first_bytes.append(first_byte)
+                if not ok:
+                    errors[0] += 1
+            
+            wall_time = self._drive_closed_loop(payload, headers, concurrency, duration, total_requests, record)
+            count = len(latencies)
+            error_count = errors[0]
+            latency = latency_summary(latencies)
+            ttft = latency_summary(first_bytes) if first_bytes else None
+        
+        error_rate = error_count / count if count else 0.0
+        details = {
+            "format": format_type,
+            "engine": self.engine,
+            "workers": workers,
+            "concurrency": concurrency,
+            "requests": count,
+            "errors": error_count,
+            "error_rate": error_rate,
+            "wall_time_s": wall_time,
+            "throughput_rps": count / wall_time if wall_time > 0 else 0.0,
+            "latency_ms": latency,
+            "status_codes": status_codes
+        }
+        if ttft is not None and self.stream:
+            details["ttft_ms"] = ttft
+        if workers > 1 or agents:
+            details["per_worker"] = merged["per_worker"]
+        if agents:
+            details["agents"] = agents
+        if (workers > 1 or agents) and merged["throttle"]:
+            details["throttle"] = merged["throttle"]
+        if (workers > 1 or agents) and merged["retry"]:
+            details["retry"] = merged["retry"]
+        if (workers > 1 or agents) and merged["hedge_snapshots"]:
+            details["hedge"] = hedge_summary(merged["hedge_snapshots"])
+            details["hedge_snapshots"] = merged["hedge_snapshots"]
+        
+        summary = (f"{count} 个请求, 吞吐量 {details['throughput_rps']:.1f} req/s, "
+                   f"错误率 {error_rate*100:.1f}%, p99 {details['latency_ms']['p99']:.0f}ms")
+        if count == 0 or error_count == count:
+            status = "FAIL"
+        elif error_count:
+            status = "WARN"
+        else:
+            status = "PASS"
+        return TestResult(test_name=test_name, status=status, message=summary, details=details)
+    
+    def run_load_mode(self, question: str = "请分析我的学习成果数据", concurrency: int = 10,
+                      duration: Optional[float] = None, total_requests: Optional[int] = None,
+                      format_type: str = "direct", workers: int = 1,
+                      agents: Optional[List[str]] = None, agent_key: Optional[str] = None):
+        """运行负载测试并打印报告"""
+        self.print_header("LLM Connection Test Tool v1.0 - 负载测试")
+        
+        print(f"配置信息:")
+        print(f"  API端点: {self.chat_endpoint}")
+        print(f"  请求格式: {format_type}")
+        print(f"  虚拟用户数: {concurrency}")
+        if self.accounts is not None:
+            print(f"  测试账号: {len(self.accounts.active)} 个，虚拟用户轮流分配")
+        if agents:
+            print(f"  负载代理: {', '.join(agents)}")
+        elif workers > 1:
+            print(f"  进程数: {workers}")
+        if duration is not None:
+            print(f"  持续时间: {duration}s")
+        else:
+            print(f"  请求总数: {total_requests or concurrency * 10}")
+        
+        self.print_section("负载测试进行中")
+        result = self.run_load_test(question, concurrency, duration, total_requests, format_type, workers,
+                                    agents, agent_key)
+        self.results.append(result)
+        print(result)
+        self.print_load_report(result)
+    
+    def print_load_report(self, result: TestResult):
+        """打印负载测试报告"""
+        self.print_header("负载测试报告")
+        details = result.details or {}
+        latency = details.get("latency_ms", {})
+        
+        print(f"请求总数: {details.get('requests', 0)}")
+        print(f"总耗时: {details.get('wall_time_s', 0):.2f}s")
+        print(f"并发引擎: {details.get('engine', 'thread')}")
+        if 'achieved_rps' in details:
+            print(f"目标速率: {details['offered_rps']:.2f} req/s")
+            print(f"实际速率: {details['achieved_rps']:.2f} req/s")
+            print(f"丢弃请求: {details['dropped']} (在途请求上限: {details['max_in_flight']})")
+        else:
+            print(f"吞吐量: {details.get('throughput_rps', 0):.2f} req/s")
+        error_color = Colors.GREEN if not details.get('errors') else Colors.RED
+        print(f"{error_color}错误数: {details.get('errors', 0)} "
+              f"({details.get('error_rate', 0)*100:.2f}%){Colors.END}")
+        
+        self.print_section("延迟分布")
+        service = details.get("service_latency_ms")
+        for key in ("p50", "p90", "p99", "max"):
+            line = f"  {key:>4}: {latency.get(key, 0):.0f}ms"
+            if service:
+                line += f"  (服务时间: {service.get(key, 0):.0f}ms)"
+            print(line)
+        if "ttft_ms" in details:
+            ttft = details["ttft_ms"]
+            print(f"  首字延迟(TTFT): p50 {ttft['p50']:.0f}ms, p90 {ttft['p90']:.0f}ms, "
+                  f"p99 {ttft['p99']:.0f}ms, max {ttft['max']:.0f}ms")
+        
+        self.print_section("状态码分布")
+        for code, count in sorted(details.get("status_codes", {}).items()):
+            print(f"  {code}: {count}")
+        
+        if details.get("per_worker"):
+            self.print_section("各代理" if details.get("agents") else "各进程")
+            for worker in details["per_worker"]:
+                print(f"  {worker['label']}: {worker['concurrency']} 虚拟用户, {worker['requests']} 个请求, "
+                      f"{worker['throughput_rps']:.1f} req/s")
+            print(f"  延迟分位数由各{'代理' if details.get('agents') else '进程'}直方图合并得到，误差不超过2%")
+
+
+def _load_worker(config: Dict, question: str, concurrency: int, duration: Optional[float],
+                 total_requests: Optional[int], format_type: str, start_at: float) -> Dict:
+    """--workers 子进程入口: 用独立的测试器运行一个负载分片"""
+    tester = LLMConnectionTester.from_shard_config(config, pool_size=concurrency)
+    try:
+        return tester.run_load_shard(question, concurrency, duration, total_requests, format_type, start_at)
+    finally:
+        tester.close()
 
 
 def main():
@@ -665,27 +4794,428 @@ def main():
   
   # 自定义问题
   python test_llm_connection.py --url http://localhost:1337 --student-id 123 --question "测试问题"
+  
+  # 探测前端使用的所有接口，每个接口请求5次
+  python test_llm_connection.py --url http://localhost:1337 --catalog probe_catalog.json --catalog-repeat 5
+  
+  # 对本地模拟后端进行负载测试 (无需真实的Strapi和模型)
+  python test_llm_connection.py --mock --mock-latency lognormal:-1,0.5 --load --concurrency 20 --requests 400
+  
+  # 负载测试 (50个虚拟用户, 持续60秒)
+  python test_llm_connection.py --url http://localhost:1337 --load --concurrency 50 --duration 60
         """
     )
     
-    parser.add_argument('--url', required=True, help='后端服务器URL (例如: http://localhost:1337)')
+    parser.add_argument('--url', help='后端服务器URL (例如: http://localhost:1337)')
     parser.add_argument('--token', help='JWT认证token (可选)')
     parser.add_argument('--student-id', default='123', help='学生ID (默认: 123)')
     parser.add_argument('--question', default='请分析我的学习成果数据', help='测试问题 (默认: 请分析我的学习成果数据)')
     parser.add_argument('--verbose', '-v', action='store_true', help='显示详细日志')
+    parser.add_argument('--output', choices=['text', 'json', 'jsonl'], default='text',
+                        help='结果输出格式 (默认: text)；json/jsonl 输出到标准输出时，文本报告改写到标准错误')
+    parser.add_argument('--output-file', help='将 json/jsonl 结果追加写入该文件')
+    parser.add_argument('--report-html', metavar='FILE',
+                        help='负载测试、开放模型负载或持续监控结束后，导出包含吞吐量、延迟和错误突发图表的HTML报告')
+    parser.add_argument('--report-csv', metavar='FILE', help='同上，导出逐请求样本CSV')
+    
+    parser.add_argument('--cheap-endpoint-probe', action='store_true',
+                        help='端点存在性测试发送无效JSON并要求返回4xx，不触发模型调用')
+    parser.add_argument('--stream', action='store_true',
+                        help='流式模式: 增量读取SSE/分块响应并记录首字延迟(TTFT)等指标')
+    parser.add_argument('--sequential', action='store_true', help='按顺序逐个执行诊断阶段（默认并行执行独立阶段）')
+    parser.add_argument('--pool-size', type=int, default=10, help='HTTP连接池大小 (默认: 10)')
+    parser.add_argument('--no-keep-alive', action='store_true', help='禁用keep-alive，每个请求重新建立连接')
+    
+    limit_group = parser.add_argument_group('客户端限流')
+    limit_group.add_argument('--rate-limit', metavar='SPEC',
+                             help='令牌桶限流: 端点类别=速率[/突发], 类别为 chat/api/other 或 *（所有请求），'
+                                  '例如 chat=2/5,*=20')
+    limit_group.add_argument('--max-concurrent', metavar='SPEC',
+                             help='在途请求上限: 端点类别=数量，例如 chat=4,*=16')
+    
+    retry_group = parser.add_argument_group('重试与对冲')
+    retry_group.add_argument('--timeout', type=float, default=30.0, help='聊天请求超时秒数 (默认: 30)')
+    retry_group.add_argument('--retries', type=int, default=0,
+                             help='超时、连接错误和 429/502/503/504 的最大重试次数 (默认: 0)')
+    retry_group.add_argument('--backoff', type=float, default=0.5,
+                             help='首次重试的退避上限秒数，之后每次翻倍并加全抖动 (默认: 0.5)')
+    retry_group.add_argument('--max-backoff', type=float, default=8.0, help='单次退避上限秒数 (默认: 8)')
+    retry_group.add_argument('--hedge', action='store_true',
+                             help='对冲请求: 聊天请求超过对冲延迟未完成时再发一个副本，采用先返回的结果')
+    retry_group.add_argument('--hedge-delay-ms', type=float,
+                             help='固定对冲延迟毫秒 (默认: 按已完成请求的延迟分位数自动调整)')
+    retry_group.add_argument('--hedge-quantile', type=float, default=95.0,
+                             help='自动对冲延迟使用的延迟分位数 (默认: 95)')
+    
+    account_group = parser.add_argument_group('测试账号')
+    account_group.add_argument('--accounts', metavar='FILE',
+                               help='测试账号文件，每行 identifier,password[,student_id]；通过 /api/auth/local '
+                                    '登录获取JWT，负载测试的虚拟用户轮流使用各账号')
+    account_group.add_argument('--token-cache', default='.llm_token_cache.json',
+                               help='JWT缓存文件，未过期的令牌跨运行复用 (默认: .llm_token_cache.json)')
+    account_group.add_argument('--no-token-cache', action='store_true', help='不读写JWT缓存文件')
+    account_group.add_argument('--refresh-margin', type=float, default=300.0,
+                               help='距过期不足该秒数时在后台重新登录 (默认: 300)')
+    
+    agent_group = parser.add_argument_group('负载代理')
+    agent_group.add_argument('--agent', action='store_true',
+                             help='以负载代理方式运行，等待协调器 (--load --agents) 下发任务')
+    agent_group.add_argument('--agent-host', default='127.0.0.1', help='代理监听地址 (默认: 127.0.0.1)')
+    agent_group.add_argument('--agent-port', type=int, default=7070, help='代理监听端口 (默认: 7070)')
+    agent_group.add_argument('--agent-key', help='共享密钥: 代理只执行携带相同密钥的任务')
+    
+    replay_group = parser.add_argument_group('请求回放')
+    replay_group.add_argument('--replay', metavar='FILE',
+                              help='回放请求日志 (JSONL: question, student_id, format, timestamp)')
+    replay_group.add_argument('--speed', type=float, default=1.0,
+                              help='回放速度倍数，0 表示不按时间戳等待 (默认: 1)')
+    replay_group.add_argument('--replay-concurrency', type=int, default=8, help='最大在途请求数 (默认: 8)')
+    replay_group.add_argument('--replay-limit', type=int, help='最多回放的请求数')
+    replay_group.add_argument('--replay-baseline', metavar='FILE',
+                              help='之前回放的 JSON/JSONL 输出，按请求对比并在回退时以状态码1退出')
+    
+    cache_group = parser.add_argument_group('缓存测试')
+    cache_group.add_argument('--cache-test', action='store_true',
+                             help='缓存测试: 重复发送问题语料，比较首次与重复请求的延迟和回答')
+    cache_group.add_argument('--corpus', help='问题语料文件，每行一个问题 (默认: 内置的6个常见问题)')
+    cache_group.add_argument('--cache-rounds', type=int, default=3, help='每个问题的请求次数 (默认: 3)')
+    cache_group.add_argument('--cache-seed', type=int, help='请求顺序的随机种子')
+    cache_group.add_argument('--hit-factor', type=float, default=0.5,
+                             help='重复请求延迟低于首次的该比例时推断为命中 (默认: 0.5)')
+    
+    scaling_group = parser.add_argument_group('规模测试')
+    scaling_group.add_argument('--scaling', action='store_true',
+                               help='规模测试: 扫描问题长度、字符集和学生ID，观察延迟和响应大小的增长')
+    scaling_group.add_argument('--lengths', default='10,100,500,1000,2000,4000',
+                               help='问题长度列表 (默认: 10,100,500,1000,2000,4000)')
+    scaling_group.add_argument('--charsets', default='ascii,chinese',
+                               help=f'字符集列表 (可选: {",".join(SCALING_TEXT)}, 默认: ascii,chinese)')
+    scaling_group.add_argument('--student-ids', help='学生ID列表，逗号分隔 (默认: --student-id)')
+    scaling_group.add_argument('--scaling-repeat', type=int, default=3, help='每个测量点的请求次数 (默认: 3)')
+    
+    catalog_group = parser.add_argument_group('接口探测目录')
+    catalog_group.add_argument('--catalog', metavar='PATH',
+                               help='接口探测模式: 并发探测目录文件中的所有接口 (例如: probe_catalog.json)')
+    catalog_group.add_argument('--catalog-repeat', type=int, default=1,
+                               help='每个接口的请求次数 (默认: 1)')
+    catalog_group.add_argument('--catalog-concurrency', type=int, default=8,
+                               help='接口探测并发数 (默认: 8)')
+    
+    mock_group = parser.add_argument_group('模拟后端')
+    mock_group.add_argument('--mock', action='store_true',
+                            help='在本进程中启动模拟后端 (mock_llm_server.py) 并对其测试，无需 --url')
+    mock_group.add_argument('--mock-latency', default='constant:0.05',
+                            help='模拟聊天接口延迟分布 (默认: constant:0.05)')
+    mock_group.add_argument('--mock-errors', default='', help='模拟错误注入概率, 例如 500=0.05,timeout=0.01')
+    mock_group.add_argument('--mock-seed', type=int, help='模拟后端随机种子')
+    mock_group.add_argument('--mock-cache', action='store_true', help='模拟后端缓存重复问题的回答')
+    mock_group.add_argument('--mock-jwt-ttl', type=float, default=3600.0,
+                            help='模拟后端登录签发的JWT有效期秒数 (默认: 3600)')
+    
+    history_group = parser.add_argument_group('历史记录与回归检测')
+    history_group.add_argument('--store', metavar='PATH',
+                               help='将诊断或监控结果追加到该SQLite历史存储')
+    history_group.add_argument('--compare', action='store_true',
+                               help='回归检测模式: 对比历史存储中近期窗口与基线窗口（需配合 --store）')
+    history_group.add_argument('--baseline-hours', type=float, default=168,
+                               help='基线窗口长度（小时，默认: 168）')
+    history_group.add_argument('--recent-minutes', type=float, default=60,
+                               help='近期窗口长度（分钟，默认: 60）')
+    history_group.add_argument('--alpha', type=float, default=0.01, help='显著性水平 (默认: 0.01)')
+    history_group.add_argument('--min-effect', type=float, default=0.2,
+                               help='判定延迟回归的最小中位数增幅 (默认: 0.2，即20%%)')
+    
+    open_group = parser.add_argument_group('开放模型负载')
+    open_group.add_argument('--open-load', action='store_true',
+                            help='开放模型负载: 按目标速率发出请求，与响应时间无关')
+    open_group.add_argument('--rate', type=float, default=5.0, help='目标速率 req/s (默认: 5)')
+    open_group.add_argument('--arrival', choices=['constant', 'poisson', 'ramp'], default='constant',
+                            help='到达模型 (默认: constant)')
+    open_group.add_argument('--ramp-to', type=float, help='ramp 模型的结束速率 req/s')
+    open_group.add_argument('--max-in-flight', type=int, default=256,
+                            help='最大在途请求数，超过时新请求记为丢弃 (默认: 256)')
+    open_group.add_argument('--seed', type=int, help='poisson 到达的随机种子')
+    open_group.add_argument('--find-max-rps', action='store_true',
+                            help='逐级提高速率，搜索最大可持续速率')
+    open_group.add_argument('--rate-step', type=float, default=5.0, help='每级提高的速率 (默认: 5)')
+    open_group.add_argument('--max-rate', type=float, default=200.0, help='速率搜索上限 (默认: 200)')
+    open_group.add_argument('--p99-threshold-ms', type=float, default=10000.0,
+                            help='p99 延迟阈值毫秒 (默认: 10000)')
+    open_group.add_argument('--error-threshold', type=float, default=0.01,
+                            help='错误率阈值 (默认: 0.01)')
+    
+    watch_group = parser.add_argument_group('持续监控')
+    watch_group.add_argument('--watch', type=float, metavar='INTERVAL',
+                             help='持续监控模式: 每隔 INTERVAL 秒执行一轮诊断')
+    watch_group.add_argument('--watch-window', type=int, default=60,
+                             help='滚动直方图保留的周期数 (默认: 60)')
+    watch_group.add_argument('--metrics-port', type=int,
+                             help='在该端口提供 OpenMetrics 格式的 /metrics 接口（需配合 --watch）')
+    watch_group.add_argument('--metrics-host', default='127.0.0.1',
+                             help='指标接口监听地址 (默认: 127.0.0.1，供其他主机抓取时使用 0.0.0.0)')
+    watch_group.add_argument('--watch-count', type=int, help='执行指定轮数后退出 (默认: 持续运行)')
+    
+    load_group = parser.add_argument_group('负载测试')
+    load_group.add_argument('--load', action='store_true', help='负载测试模式: 并发请求聊天端点')
+    load_group.add_argument('--concurrency', type=int, default=10, help='虚拟用户数 (默认: 10)')
+    load_group.add_argument('--duration', type=float, help='负载测试持续时间（秒）')
+    load_group.add_argument('--requests', type=int, dest='total_requests',
+                            help='负载测试请求总数 (默认: 虚拟用户数 x 10)')
+    load_group.add_argument('--format', choices=['direct', 'wrapped'], default='direct',
+                            help='负载测试使用的请求格式 (默认: direct)')
+    load_group.add_argument('--workers', type=int, default=1,
+                            help='负载测试进程数，虚拟用户平均分配到各进程 (默认: 1)')
+    load_group.add_argument('--agents', help='分布式负载: 负载代理地址列表 HOST:PORT,HOST:PORT，虚拟用户平均分配')
+    load_group.add_argument('--engine', choices=['thread', 'async'], default='thread',
+                            help='负载测试并发引擎: thread 每个在途请求一个线程; async 单线程协程, '
+                                 '适合数千并发连接 (默认: thread)')
     
     args = parser.parse_args()
+    if args.agent:
+        server = start_load_agent(args.agent_host, args.agent_port, args.workers, args.agent_key)
+        print(f"负载代理已启动: {args.agent_host}:{args.agent_port} (进程数: {args.workers})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n已停止")
+        finally:
+            server.server_close()
+        return
+    if not args.url and not args.mock:
+        parser.error('需要提供 --url 或 --mock')
+    if args.metrics_port is not None and args.watch is None:
+        parser.error('--metrics-port 需要与 --watch 一起使用')
+    if args.arrival == 'ramp' and args.ramp_to is None and args.open_load and not args.find_max_rps:
+        parser.error('--arrival ramp 需要 --ramp-to')
+    charsets = [charset.strip() for charset in args.charsets.split(',') if charset.strip()]
+    if args.scaling and any(charset not in SCALING_TEXT for charset in charsets):
+        parser.error(f'--charsets 只支持: {", ".join(SCALING_TEXT)}')
+    replay_baseline = None
+    if args.replay_baseline:
+        if not args.replay:
+            parser.error('--replay-baseline 需要与 --replay 一起使用')
+        try:
+            replay_baseline = load_replay_baseline(args.replay_baseline)
+        except (OSError, ValueError) as e:
+            parser.error(f'无法读取回放基线: {e}')
+    agents = [agent.strip() for agent in args.agents.split(',') if agent.strip()] if args.agents else None
+    if args.workers < 1 or (args.load and args.workers > args.concurrency):
+        parser.error('--workers 需在1到虚拟用户数之间')
+    if args.workers > 1 and not args.load:
+        parser.error('--workers 需要与 --load 一起使用')
+    if agents and (not args.load or len(agents) > args.concurrency):
+        parser.error('--agents 需要与 --load 一起使用，且代理数不超过虚拟用户数')
+    if agents and any(':' not in agent for agent in agents):
+        parser.error('--agents 的格式为 HOST:PORT,HOST:PORT')
+    if args.replay_concurrency < 1:
+        parser.error('--replay-concurrency 至少为1')
+    if args.cache_rounds < 2:
+        parser.error('--cache-rounds 至少为2')
+    corpus = list(CACHE_CORPUS)
+    if args.cache_test and args.corpus:
+        try:
+            corpus = load_question_corpus(args.corpus)
+        except (OSError, ValueError) as e:
+            parser.error(f'无法读取语料文件: {e}')
+    try:
+        rate_limits = parse_limit_spec(args.rate_limit, with_burst=True) if args.rate_limit else {}
+        concurrency_limits = parse_limit_spec(args.max_concurrent) if args.max_concurrent else {}
+    except ValueError as e:
+        parser.error(str(e))
+    if args.timeout <= 0 or args.retries < 0 or args.backoff < 0 or args.max_backoff < 0:
+        parser.error('--timeout 需大于0，--retries/--backoff/--max-backoff 不能为负')
+    if not 0 < args.hedge_quantile < 100:
+        parser.error('--hedge-quantile 需在0到100之间')
+    if (args.hedge or args.retries) and args.engine == 'async' and (args.load or args.open_load):
+        parser.error('--retries/--hedge 目前只支持线程引擎 (--engine thread)')
+    account_list = None
+    if args.accounts:
+        try:
+            account_list = load_accounts(args.accounts)
+        except (OSError, ValueError) as e:
+            parser.error(f'无法读取账号文件: {e}')
+    if args.compare and not args.store:
+        parser.error('--compare 需要与 --store 一起使用')
+    if args.store and (args.load or args.open_load or args.replay or args.cache_test or args.scaling or args.catalog):
+        # 历史存储按诊断阶段建立索引，这些模式的结果没有阶段标识，不会被记录
+        parser.error('--store 只支持诊断模式和 --watch，不能与负载、回放、缓存、规模或接口探测模式一起使用')
+    if args.output_file and args.output == 'text':
+        parser.error('--output-file 需要与 --output json 或 --output jsonl 一起使用')
+    if (args.report_html or args.report_csv) and not (args.load or args.open_load or args.watch is not None):
+        parser.error('--report-html/--report-csv 需要与 --load、--open-load 或 --watch 一起使用')
+    
+    writer = ResultWriter(args.output, args.output_file) if args.output != 'text' else None
+    # 机器可读结果写入标准输出时，文本报告改写到标准错误，避免混在一起
+    report_stream = sys.stderr if writer is not None and not args.output_file else sys.stdout
+    
+    mock_server = None
+    if args.mock:
+        try:
+            from mock_llm_server import MockServerConfig, parse_error_rates, start_mock_server
+            mock_server = start_mock_server(MockServerConfig(
+                latency=args.mock_latency,
+                error_rates=parse_error_rates(args.mock_errors),
+                token=args.token,
+                seed=args.mock_seed,
+                cache=args.mock_cache,
+                jwt_ttl=args.mock_jwt_ttl
+            ))
+        except ImportError:
+            parser.error('--mock 需要与 mock_llm_server.py 位于同一目录')
+        except ValueError as e:
+            parser.error(str(e))
+        host, port = mock_server.server_address[:2]
+        args.url = f"http://{host}:{port}"
+    
+    limiter = None
+    if rate_limits or concurrency_limits:
+        limiter = RateLimiter(f"{args.url.rstrip('/')}/api/student-portraits/chat", rate_limits, concurrency_limits)
+    
+    accounts = None
+    if account_list:
+        accounts = AccountPool(f"{args.url.rstrip('/')}/api/auth/local", account_list,
+                               None if args.no_token_cache else args.token_cache, args.refresh_margin)
+        active = accounts.ensure()
+        stats = accounts.summary()
+        print(f"测试账号: {active}/{len(account_list)} 可用 (缓存 {stats['cached']}, "
+              f"登录 {stats['logins'] + stats['refreshes']}, 失败 {stats['failures']})", file=report_stream)
+        for identifier, error in stats["errors"].items():
+            print(f"{Colors.YELLOW}⚠ {identifier}: {error}{Colors.END}", file=report_stream)
+        if not active:
+            parser.error('没有可用的测试账号')
+        accounts.start()
+        # 诊断和认证测试使用第一个账号
+        if not args.token:
+            args.token = accounts.active[0].token
+    
+    retry = RetryPolicy(args.retries, args.backoff, args.max_backoff) if args.retries else None
+    # 并发请求数: 决定连接池大小和对冲线程池大小
+    concurrency = max(args.pool_size, args.concurrency if args.load else
+                      args.catalog_concurrency if args.catalog else
+                      args.max_in_flight if args.open_load else
+                      args.replay_concurrency if args.replay else 0)
+    hedger = (RequestHedger(args.hedge_delay_ms, args.hedge_quantile, concurrency=concurrency)
+              if args.hedge else None)
     
     # 创建测试器并运行
     tester = LLMConnectionTester(
         backend_url=args.url,
         token=args.token,
         student_id=args.student_id,
-        verbose=args.verbose
+        verbose=args.verbose,
+        # 对冲时每个在途请求最多占用两个连接
+        pool_size=concurrency * (2 if args.hedge else 1),
+        keep_alive=not args.no_keep_alive,
+        cheap_endpoint_probe=args.cheap_endpoint_probe,
+        parallel=not args.sequential,
+        stream=args.stream,
+        engine=args.engine,
+        limiter=limiter,
+        timeout=args.timeout,
+        retry=retry,
+        hedger=hedger,
+        accounts=accounts
     )
     
-    tester.run_all_tests(question=args.question)
-
+    if args.report_html or args.report_csv:
+        tester.samples = SampleLog()
+    
+    store = ResultStore(args.store) if args.store else None
+    replay_regression = False
+    
+    try:
+        if args.compare:
+            rows = tester.run_compare_mode(store, args.baseline_hours, args.recent_minutes,
+                                           args.alpha, args.min_effect)
+            if any(row["latency_regression"] or row["error_regression"] for row in rows):
+                sys.exit(1)
+            return
+        
+        with contextlib.redirect_stdout(report_stream):
+            if args.load:
+                tester.run_load_mode(
+                    question=args.question,
+                    concurrency=args.concurrency,
+                    duration=args.duration,
+                    total_requests=args.total_requests,
+                    format_type=args.format,
+                    workers=args.workers,
+                    agents=agents,
+                    agent_key=args.agent_key
+                )
+            elif args.open_load:
+                tester.run_open_load_mode(
+                    question=args.question,
+                    rate=args.rate,
+                    duration=args.duration if args.duration is not None else 30.0,
+                    arrival=args.arrival,
+                    ramp_to=args.ramp_to,
+                    format_type=args.format,
+                    max_in_flight=args.max_in_flight,
+                    seed=args.seed,
+                    find_max=args.find_max_rps,
+                    rate_step=args.rate_step,
+                    max_rate=args.max_rate,
+                    p99_threshold_ms=args.p99_threshold_ms,
+                    error_threshold=args.error_threshold
+                )
+            elif args.replay:
+                replay_regression = tester.run_replay_mode(args.replay, args.speed, args.replay_concurrency,
+                                                           args.replay_limit, replay_baseline,
+                                                           args.alpha, args.min_effect)
+            elif args.cache_test:
+                tester.run_cache_mode(corpus, args.cache_rounds, args.cache_seed, args.format, args.hit_factor)
+            elif args.scaling:
+                tester.run_scaling_mode(
+                    lengths=[int(length) for length in args.lengths.split(',') if length.strip()],
+                    charsets=charsets,
+                    student_ids=[sid.strip() for sid in (args.student_ids or args.student_id).split(',') if sid.strip()],
+                    question=args.question,
+                    repeat=args.scaling_repeat,
+                    format_type=args.format
+                )
+            elif args.catalog:
+                tester.run_catalog_mode(args.catalog, args.catalog_repeat, args.catalog_concurrency)
+            elif args.watch is not None:
+                metrics = None
+                if args.metrics_port is not None:
+                    metrics = MetricsRegistry()
+                    start_metrics_server(metrics, args.metrics_port, args.metrics_host)
+                    print(f"指标接口: http://{args.metrics_host}:{args.metrics_port}/metrics")
+                tester.run_watch(
+                    question=args.question,
+                    interval=args.watch,
+                    window=args.watch_window,
+                    iterations=args.watch_count,
+                    metrics=metrics,
+                    writer=writer,
+                    store=store
+                )
+            else:
+                tester.run_all_tests(question=args.question)
+            tester.print_throttle_report()
+            tester.print_retry_report()
+            tester.export_samples("负载测试" if args.load else "开放模型负载" if args.open_load else "持续监控",
+                                  args.report_html, args.report_csv)
+        
+        if args.watch is None and (writer is not None or store is not None):
+            mode = ("load" if args.load else "open-load" if args.open_load else
+                    "replay" if args.replay else "cache" if args.cache_test else "scaling" if args.scaling else
+                    "catalog" if args.catalog else "diagnose")
+            summary = tester.build_summary(tester.iter_results(), mode)
+            if writer is not None:
+                writer.write_run(tester.iter_results(), summary)
+            if store is not None:
+                store.record(tester.results, summary["run_id"], tester.backend_url, tester.chat_endpoint)
+        if replay_regression:
+            sys.exit(1)
+    finally:
+        tester.close()
+        if store is not None:
+            store.close()
+        if mock_server is not None:
+            mock_server.shutdown()
+            mock_server.server_close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,81 @@
+"""固定桶延迟直方图的分位数与合并"""
+
+import random
+
+import pytest
+
+import test_llm_connection as tlc
+
+
+def latencies(count, seed):
+    rng = random.Random(seed)
+    return [rng.lognormvariate(-3, 1) for _ in range(count)]
+
+
+def histogram_of(values, buckets=tlc.LOAD_BUCKETS_MS):
+    histogram = tlc.LatencyHistogram(buckets)
+    for value in values:
+        histogram.record(value)
+    return histogram
+
+
+def test_empty_histogram():
+    histogram = tlc.LatencyHistogram()
+    assert histogram.percentile(50) == 0.0
+    assert histogram.mean == 0.0
+
+
+@pytest.mark.parametrize("pct", [50, 90, 99])
+def test_percentile_within_bucket_error(pct):
+    values = latencies(5000, seed=pct)
+    estimate = histogram_of(values).percentile(pct)
+    ordered = sorted(values)
+    exact = ordered[max(1, round(len(values) * pct / 100)) - 1]
+    # 取桶上界: 不低于真实值，且高出不超过一个桶宽（2%）
+    assert exact <= estimate <= exact * 1.02 + 1e-9
+
+
+def test_percentile_capped_by_max():
+    histogram = histogram_of([0.0071], tlc.LATENCY_BUCKETS_MS)
+    assert histogram.percentile(99) == pytest.approx(0.0071)
+    histogram = histogram_of([45.0], tlc.LATENCY_BUCKETS_MS)
+    assert histogram.percentile(50) == 45.0
+
+
+def test_merge_equals_recording_everything():
+    first, second = latencies(300, seed=1), latencies(700, seed=2)
+    merged = histogram_of(first)
+    merged.merge(histogram_of(second))
+    combined = histogram_of(first + second)
+    assert merged.counts == combined.counts
+    assert merged.count == 1000
+    assert merged.max == combined.max
+    assert merged.total == pytest.approx(combined.total)
+    for pct in (50, 90, 99, 100):
+        assert merged.percentile(pct) == combined.percentile(pct)
+
+
+def test_merge_rejects_different_buckets():
+    with pytest.raises(ValueError):
+        tlc.LatencyHistogram(tlc.LATENCY_BUCKETS_MS).merge(tlc.LatencyHistogram(tlc.LOAD_BUCKETS_MS))
+
+
+def test_dict_round_trip():
+    histogram = histogram_of(latencies(200, seed=3) + [500.0])
+    restored = tlc.LatencyHistogram.from_dict(histogram.to_dict())
+    assert restored.buckets_ms == histogram.buckets_ms
+    assert restored.counts == histogram.counts
+    assert restored.summary() == histogram.summary()
+
+
+def test_rolling_window_drops_oldest_interval():
+    rolling = tlc.RollingHistogram(window=2)
+    rolling.record(0.001)
+    rolling.rotate()
+    rolling.record(1.0)
+    assert rolling.snapshot().count == 2
+    rolling.rotate()
+    rolling.record(2.0)
+    snapshot = rolling.snapshot()
+    assert snapshot.count == 2
+    assert snapshot.percentile(1) == 1.0
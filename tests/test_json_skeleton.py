@@ -0,0 +1,106 @@
+"""增量 JSON 骨架解析与 json.loads 的一致性（包括任意块边界）"""
+
+import hashlib
+import json
+import random
+
+import pytest
+
+import test_llm_connection as tlc
+
+
+def parse(text, split=None, limit=tlc.STREAM_BODY_LIMIT):
+    skeleton = tlc.JsonSkeleton(limit)
+    if split is None:
+        skeleton.feed(text)
+    else:
+        for i in range(0, len(text), split):
+            skeleton.feed(text[i:i + split])
+    skeleton.close()
+    return skeleton.result()
+
+
+def accepts(text, split=None):
+    try:
+        parse(text, split)
+    except ValueError:
+        return False
+    return True
+
+
+def json_accepts(text):
+    try:
+        json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+
+def random_value(rng, depth=0):
+    kind = rng.random()
+    if depth > 3 or kind < 0.3:
+        return "".join(rng.choice('ab 中"\\/\t😀') for _ in range(rng.randint(0, 12)))
+    if kind < 0.45:
+        return rng.choice([1, -2.5e10, True, False, None, 0, 12.75])
+    if kind < 0.7:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    keys = list(tlc.RESPONSE_FIELDS) + ["x", "中"]
+    return {rng.choice(keys): random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+
+
+@pytest.mark.parametrize("text", ['{"a":}', '[1,]', '{"a":1,}', '{"response":}', '{"a"}', '{,}', '[,]',
+                                  '{"a":1', '[1 2]', '{"a" 1}', '{"a":1}}', '', '{"a":tru}', '"abc'])
+def test_rejects_malformed_json(text):
+    assert not json_accepts(text)
+    for split in (None, 1, 2, 3):
+        assert not accepts(text, split)
+
+
+@pytest.mark.parametrize("text", ['{}', '[]', '{"a":[]}', '[[],{}]', '{"a":{}}', ' {"a" : 1 } ', '0', '"x"',
+                                  '{"response":"\\ud83d\\ude00"}', '[1e5, -0.5, true, null]'])
+def test_accepts_valid_json(text):
+    for split in (None, 1, 2, 5):
+        assert accepts(text, split)
+
+
+def test_matches_json_loads_at_every_split_point():
+    rng = random.Random(7)
+    for _ in range(200):
+        document = {key: random_value(rng) for key in rng.sample(["response", "data", "x", "answer"], 3)}
+        text = json.dumps(document, ensure_ascii=rng.random() < 0.5)
+        for split in range(1, 12):
+            skeleton = parse(text, split)
+            assert list(skeleton) == list(document)
+            for key in ("response", "answer"):
+                if isinstance(document.get(key), str):
+                    assert skeleton[key] == document[key]
+                    assert skeleton[key].length == len(document[key])
+
+
+def test_mutated_documents_accepted_iff_json_loads_accepts():
+    rng = random.Random(11)
+    for _ in range(400):
+        text = json.dumps({"response": random_value(rng), "data": random_value(rng)})
+        position = rng.randrange(len(text))
+        if rng.random() < 0.5:
+            mutated = text[:position] + text[position + 1:]
+        else:
+            mutated = text[:position] + rng.choice(',:[]{}"') + text[position:]
+        expected = json_accepts(mutated)
+        for split in (None, 1, 3, 7):
+            assert accepts(mutated, split) == expected, (mutated, split)
+
+
+def test_long_answer_is_truncated_with_full_length_and_digest():
+    answer = "学" * 1000
+    skeleton = parse(json.dumps({"response": answer}, ensure_ascii=False), split=64, limit=10)
+    kept = skeleton["response"]
+    assert kept == answer[:10] and kept.length == 1000 and kept.truncated
+    assert kept.digest == hashlib.sha256(answer.encode("utf-8")).hexdigest()
+
+
+def test_bounded_body_falls_back_to_text_for_non_json():
+    body = tlc.BoundedBody("utf-8")
+    body.feed("<html>".encode())
+    body.close()
+    assert body.value() == "<html>"
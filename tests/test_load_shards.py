@@ -0,0 +1,92 @@
+"""负载拆分与分片合并"""
+
+import random
+
+import pytest
+
+import test_llm_connection as tlc
+
+
+@pytest.mark.parametrize("concurrency, total_requests, parts", [
+    (10, None, 3), (10, 100, 3), (7, 20, 7), (9, 10, 4), (5, 3, 2), (64, 1001, 6)
+])
+def test_split_load_preserves_totals(concurrency, total_requests, parts):
+    shares = tlc.split_load(concurrency, total_requests, parts)
+    assert len(shares) == parts
+    users = [share for share, _ in shares]
+    assert sum(users) == concurrency
+    assert max(users) - min(users) <= 1
+    if total_requests is None:
+        assert all(requests is None for _, requests in shares)
+    else:
+        assert sum(requests for _, requests in shares) == total_requests
+
+
+def test_split_load_requests_follow_users():
+    # 虚拟用户多的分片分到的请求不少于虚拟用户少的分片
+    shares = tlc.split_load(10, 100, 4)
+    assert shares == [(3, 30), (3, 30), (2, 20), (2, 20)]
+
+
+def make_shard(latencies, statuses, started_at, wall_time, concurrency=2):
+    histogram = tlc.LatencyHistogram(tlc.LOAD_BUCKETS_MS)
+    first_bytes = tlc.LatencyHistogram(tlc.LOAD_BUCKETS_MS)
+    samples = tlc.SampleLog(started_at)
+    status_codes = {}
+    for index, (seconds, status) in enumerate(zip(latencies, statuses)):
+        histogram.record(seconds)
+        first_bytes.record(seconds / 2)
+        samples.record(status, status == "200", seconds, seconds / 2, finished=started_at + index * 0.01)
+        status_codes[status] = status_codes.get(status, 0) + 1
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(1 for status in statuses if status != "200"),
+        "wall_time_s": wall_time,
+        "status_codes": status_codes,
+        "histogram": histogram.to_dict(),
+        "ttft_histogram": first_bytes.to_dict(),
+        "throttle": {"chat": {"requests": len(latencies), "throttled": 1, "throttled_s": 0.5, "max_wait_s": 0.25}},
+        "retry": None,
+        "hedge_snapshots": [],
+        "samples": samples.to_dict()
+    }
+
+
+def test_merge_load_shards_is_exact():
+    rng = random.Random(5)
+    first = [rng.uniform(0.01, 0.5) for _ in range(40)]
+    second = [rng.uniform(0.01, 2.0) for _ in range(60)]
+    shards = [make_shard(first, ["200"] * 39 + ["500"], 1000.0, 4.0),
+              make_shard(second, ["200"] * 58 + ["timeout"] * 2, 1000.5, 5.0, concurrency=3)]
+    merged = tlc.merge_load_shards(shards, labels=["a", "b"])
+    
+    expected = tlc.LatencyHistogram(tlc.LOAD_BUCKETS_MS)
+    for seconds in first + second:
+        expected.record(seconds)
+    histogram = tlc.LatencyHistogram.from_dict(merged["histogram"])
+    assert histogram.counts == expected.counts
+    assert histogram.summary() == pytest.approx(expected.summary())
+    assert merged["requests"] == 100
+    assert merged["errors"] == 3
+    assert merged["concurrency"] == 5
+    assert merged["wall_time_s"] == 5.0
+    assert merged["status_codes"] == {"200": 97, "500": 1, "timeout": 2}
+    assert merged["throttle"]["chat"] == {"requests": 100, "throttled": 2, "throttled_s": 1.0, "max_wait_s": 0.25}
+    assert [(worker["label"], worker["requests"]) for worker in merged["per_worker"]] == [("a", 40), ("b", 60)]
+    assert merged["per_worker"][1]["throughput_rps"] == pytest.approx(12.0)
+    
+    samples = tlc.SampleLog.from_dict(merged["samples"])
+    assert samples.started_at == 1000.0
+    assert len(samples) == 100
+    assert sorted(samples.latency) == sorted(first + second)
+    # 第二个分片晚 0.5 秒开始，完成时刻按公共起点对齐
+    assert samples.finished[40] == pytest.approx(0.5)
+
+
+def test_merged_shards_can_be_merged_again():
+    shards = [make_shard([0.1 * (index + 1)] * 5, ["200"] * 5, 0.0, 1.0) for index in range(4)]
+    nested = tlc.merge_load_shards([tlc.merge_load_shards(shards[:2]), tlc.merge_load_shards(shards[2:])])
+    flat = tlc.merge_load_shards(shards)
+    for key in ("concurrency", "requests", "errors", "status_codes", "histogram", "ttft_histogram", "throttle"):
+        assert nested[key] == flat[key]
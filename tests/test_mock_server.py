@@ -0,0 +1,29 @@
+"""模拟后端的请求体校验"""
+
+import json
+
+import pytest
+import requests
+
+from mock_llm_server import MockServerConfig, start_mock_server
+
+
+@pytest.fixture(scope="module")
+def chat_url():
+    server = start_mock_server(MockServerConfig(latency="constant:0"))
+    host, port = server.server_address[:2]
+    yield f"http://{host}:{port}/api/student-portraits/chat"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("body", ["[]", '"x"', "42", "null", "{\"question\":"])
+def test_chat_rejects_non_object_bodies(chat_url, body):
+    response = requests.post(chat_url, data=body, headers={"Content-Type": "application/json"}, timeout=5)
+    assert response.status_code == 400
+
+
+def test_chat_accepts_object_body(chat_url):
+    response = requests.post(chat_url, data=json.dumps({"question": "你好"}),
+                             headers={"Content-Type": "application/json"}, timeout=5)
+    assert response.status_code == 200
@@ -0,0 +1,99 @@
+"""令牌桶与限流规格解析"""
+
+import pytest
+
+import test_llm_connection as tlc
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(tlc.time, "monotonic", fake)
+    return fake
+
+
+def test_bucket_allows_burst_then_spaces_requests(clock):
+    bucket = tlc.TokenBucket(2.0)
+    assert bucket.capacity == 2.0
+    assert [bucket.reserve() for _ in range(5)] == pytest.approx([0.0, 0.0, 0.5, 1.0, 1.5])
+
+
+def test_bucket_refills_at_rate(clock):
+    bucket = tlc.TokenBucket(4.0, burst=1.0)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.25)
+    clock.now = 0.5
+    # 0.5 秒补充 2 个令牌，还清预约的 1 个后剩 1 个
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.25)
+
+
+def test_bucket_never_exceeds_capacity(clock):
+    bucket = tlc.TokenBucket(10.0, burst=3.0)
+    clock.now = 60.0
+    assert [bucket.reserve() for _ in range(4)] == pytest.approx([0.0, 0.0, 0.0, 0.1])
+
+
+def test_slow_rate_keeps_one_token_burst(clock):
+    bucket = tlc.TokenBucket(0.5)
+    assert bucket.capacity == 1.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(2.0)
+
+
+def test_parse_concurrency_limits():
+    assert tlc.parse_limit_spec("chat=2, *=20,") == {"chat": 2, "*": 20}
+    assert tlc.parse_limit_spec("") == {}
+
+
+def test_parse_rate_limits_with_burst():
+    assert tlc.parse_limit_spec("chat=0.5/3,api=10", with_burst=True) == {"chat": (0.5, 3.0), "api": (10.0, None)}
+
+
+@pytest.mark.parametrize("spec, with_burst", [
+    ("unknown=1", False), ("chat", False), ("chat=", False), ("chat=0", False), ("chat=x", False),
+    ("chat=0/5", True), ("chat=-1", True), ("api=fast", True)
+])
+def test_parse_rejects_invalid_items(spec, with_burst):
+    with pytest.raises(ValueError):
+        tlc.parse_limit_spec(spec, with_burst=with_burst)
+
+
+@pytest.mark.parametrize("limit, weights", [(10, [3, 3, 2, 2]), (5, [2, 2, 1, 1]), (4, [1, 1, 1, 1]),
+                                            (7, [5, 0]), (16, [1, 1, 1])])
+def test_split_limit_sums_exactly(limit, weights):
+    parts = tlc.split_limit(limit, weights)
+    assert sum(parts) == limit
+    assert min(parts) >= 1
+
+
+def test_split_limit_rejects_more_parts_than_limit():
+    with pytest.raises(ValueError):
+        tlc.split_limit(3, [1, 1, 1, 1])
+
+
+def test_split_concurrency_per_class():
+    limiter = tlc.RateLimiter("http://host/api/chat", concurrency={"chat": 5, "*": 9})
+    caps = limiter.split_concurrency([2, 2, 1])
+    assert sum(cap["chat"] for cap in caps) == 5
+    assert sum(cap["*"] for cap in caps) == 9
+    assert limiter.to_spec(0.5, caps[0])["concurrency"] == caps[0]
+
+
+class Attempt:
+    def __init__(self, waited, history=()):
+        self.throttle_wait = waited
+        self.history = list(history)
+
+
+def test_throttle_wait_includes_redirects():
+    assert tlc.throttle_wait(Attempt(0.25, [Attempt(0.5)])) == pytest.approx(0.75)
+    assert tlc.throttle_wait(ValueError("没有经过限流")) == 0.0
@@ -0,0 +1,49 @@
+"""回放基线文件的读取"""
+
+import json
+
+import pytest
+
+import test_llm_connection as tlc
+
+
+def replay_record(key, duration):
+    return {"test_name": key, "status": "PASS", "stage": "replay-request",
+            "details": {"key": key, "duration_ms": duration}}
+
+
+RECORDS = [replay_record("1:aa", 10.0), {"stage": "load", "details": {}}, replay_record("2:bb", 20.0)]
+
+
+def test_jsonl_output(tmp_path):
+    path = tmp_path / "baseline.jsonl"
+    lines = [json.dumps({"type": "result", "run_id": "r", **record}) for record in RECORDS]
+    path.write_text("\n".join(lines + ['{"type": "summary", "run_id": "r"}']) + "\n", encoding="utf-8")
+    baseline = tlc.load_replay_baseline(str(path))
+    assert set(baseline) == {"1:aa", "2:bb"}
+    assert baseline["2:bb"]["duration_ms"] == 20.0
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_json_documents(tmp_path, indent):
+    path = tmp_path / "baseline.json"
+    path.write_text("\n" + json.dumps({"summary": {}, "results": RECORDS}, indent=indent) + "\n",
+                    encoding="utf-8")
+    assert set(tlc.load_replay_baseline(str(path))) == {"1:aa", "2:bb"}
+
+
+def test_appended_json_runs(tmp_path):
+    path = tmp_path / "baseline.json"
+    runs = [{"summary": {}, "results": RECORDS[:1]}, {"summary": {}, "results": RECORDS[1:]}]
+    path.write_text("".join(json.dumps(run) + "\n" for run in runs), encoding="utf-8")
+    assert set(tlc.load_replay_baseline(str(path))) == {"1:aa", "2:bb"}
+
+
+def test_invalid_line_and_empty_file(tmp_path):
+    path = tmp_path / "baseline.jsonl"
+    path.write_text(json.dumps(RECORDS[0]) + "\n{broken\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="第 2 行"):
+        tlc.load_replay_baseline(str(path))
+    path.write_text(json.dumps(RECORDS[1]) + "\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="没有回放结果"):
+        tlc.load_replay_baseline(str(path))
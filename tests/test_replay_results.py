@@ -0,0 +1,71 @@
+"""回放逐请求结果的列式存储与序列化"""
+
+import json
+import math
+
+import pytest
+
+import test_llm_connection as tlc
+
+
+@pytest.fixture
+def entries(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    records = [
+        {"question": "你好", "timestamp": 100},
+        "not json",
+        {"question": "课程推荐", "student_id": 42, "format": "wrapped", "timestamp": 101.5},
+        {"question": "你好", "timestamp": 103},
+    ]
+    path.write_text("\n".join(record if isinstance(record, str) else json.dumps(record, ensure_ascii=False)
+                              for record in records) + "\n", encoding="utf-8")
+    return [entry for entry in tlc.iter_replay_log(str(path), "7") if "invalid" not in entry]
+
+
+@pytest.fixture
+def results(entries):
+    replay = tlc.ReplayResults()
+    # 完成顺序与行号顺序不同
+    replay.append(entries[2], 0.3, lag_ms=1.5, status_code=200, response_bytes=512)
+    replay.append(entries[0], 0.1, lag_ms=0.0, status_code=500, response_bytes=0)
+    replay.append(entries[1], 30.0, error="timeout")
+    replay.sort()
+    return replay
+
+
+def test_sort_and_keys_match_log(entries, results):
+    assert len(results) == 3
+    assert list(results.line) == [1, 3, 4]
+    assert [results.key(index) for index in range(3)] == [entry["key"] for entry in entries]
+    assert [results.outcome_key(index) for index in range(3)] == ["500", "timeout", "200"]
+    # 相同问题在不同行上，请求键不同但摘要相同
+    assert results.key(0) != results.key(2)
+    assert results.digest[0] == results.digest[2]
+
+
+def test_details(results):
+    assert results.details(1) == {"key": results.key(1), "line": 3, "student_id": "42", "format": "wrapped",
+                                  "error": "timeout", "latency_ms": 30000.0}
+    details = results.details(2)
+    assert details["student_id"] == "7"
+    assert details["status_code"] == 200 and details["response_bytes"] == 512
+    assert details["lag_ms"] == 1.5
+    assert math.isnan(results.lag_ms[1])
+
+
+def test_lazy_test_results(results):
+    first, second, third = list(results)
+    assert first.status == "FAIL" and first.message == "状态码 500, 100ms"
+    assert second.message == "timeout, 30000ms"
+    assert third.status == "PASS" and third.stage == "replay-request"
+    assert third.test_name == "回放 #4"
+    assert third.duration == pytest.approx(0.3)
+
+
+def test_written_results_load_as_baseline(tmp_path, results):
+    path = tmp_path / "replay.jsonl"
+    writer = tlc.ResultWriter("jsonl", str(path))
+    writer.write_run(results, {"run_id": "run-1", "mode": "replay"})
+    baseline = tlc.load_replay_baseline(str(path))
+    assert baseline == {results.key(index): json.loads(json.dumps(results.details(index)))
+                        for index in range(len(results))}
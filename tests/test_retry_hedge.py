@@ -0,0 +1,120 @@
+"""重试策略和对冲请求"""
+
+import threading
+import time
+
+import pytest
+
+import test_llm_connection as tlc
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+    
+    def close(self):
+        self.closed = True
+
+
+def make_send(outcomes):
+    """按调用顺序返回 (延迟秒, 状态码或异常) 对应的结果"""
+    calls = iter(outcomes)
+    lock = threading.Lock()
+    
+    def send():
+        with lock:
+            delay, outcome = next(calls)
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome), {"total_ms": delay * 1000}
+    return send
+
+
+def test_retry_delay_is_bounded_by_exponential_cap():
+    policy = tlc.RetryPolicy(retries=5, backoff=0.5, max_backoff=4.0, seed=1)
+    for attempt in range(6):
+        for _ in range(50):
+            assert 0 <= policy.delay(attempt) <= min(4.0, 0.5 * 2 ** attempt)
+
+
+def test_retry_delay_honours_retry_after_up_to_max_backoff():
+    policy = tlc.RetryPolicy(retries=1, backoff=0.1, max_backoff=2.0, seed=1)
+    assert policy.delay(0, "1.5") >= 1.5
+    assert policy.delay(0, "60") == 2.0
+    assert policy.delay(0, "soon") <= 0.1
+
+
+def test_retry_stats_merge():
+    first = tlc.RetryPolicy(retries=2)
+    first.record_retry("503", 0.2)
+    first.record_outcome(2, True)
+    second = tlc.RetryPolicy(retries=2)
+    second.record_retry("timeout", 0.3)
+    second.record_outcome(3, False)
+    merged = tlc.merge_retry_stats([first.summary(), second.summary()])
+    assert merged["retries"] == 2 and merged["recovered"] == 1 and merged["exhausted"] == 1
+    assert merged["reasons"] == {"503": 1, "timeout": 1}
+    assert merged["backoff_s"] == pytest.approx(0.5)
+
+
+def test_hedge_fast_error_does_not_beat_slower_success():
+    hedger = tlc.RequestHedger(delay_ms=20)
+    try:
+        response, timing = hedger.run(make_send([(0.15, 200), (0.0, 500)]))
+        assert response.status_code == 200
+        assert timing["hedged"] and not timing["hedge_won"]
+        snapshot = hedger.snapshot()
+        assert snapshot["errors"] == 0 and snapshot["backup_wins"] == 0
+    finally:
+        hedger.close()
+
+
+def test_hedge_backup_success_wins_over_slow_primary():
+    hedger = tlc.RequestHedger(delay_ms=20)
+    try:
+        response, timing = hedger.run(make_send([(0.3, 200), (0.0, 200)]))
+        assert response.status_code == 200 and timing["hedge_won"]
+    finally:
+        hedger.close()
+
+
+def test_hedge_returns_error_response_only_when_both_fail():
+    hedger = tlc.RequestHedger(delay_ms=20)
+    try:
+        response, _ = hedger.run(make_send([(0.05, 503), (0.0, 500)]))
+        assert response.status_code == 503
+        assert hedger.snapshot()["errors"] == 1
+    finally:
+        hedger.close()
+
+
+def test_hedge_raises_when_no_copy_answers():
+    hedger = tlc.RequestHedger(delay_ms=10)
+    try:
+        with pytest.raises(TimeoutError):
+            hedger.run(make_send([(0.05, TimeoutError("primary")), (0.0, ConnectionError("backup"))]))
+    finally:
+        hedger.close()
+
+
+def test_failed_primaries_do_not_set_hedge_delay():
+    hedger = tlc.RequestHedger(quantile=95, min_samples=3)
+    try:
+        for _ in range(5):
+            hedger.run(make_send([(0.0, 500)]))
+        time.sleep(0.05)
+        assert hedger.delay() is None
+        summary = tlc.hedge_summary([hedger.snapshot()])
+        assert summary["primary_errors"] == 5 and summary["pending_primaries"] == 0
+    finally:
+        hedger.close()
+
+
+def test_executor_sized_from_concurrency():
+    hedger = tlc.RequestHedger(delay_ms=20, concurrency=6)
+    try:
+        assert hedger.executor._max_workers == 12
+    finally:
+        hedger.close()
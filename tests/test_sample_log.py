@@ -0,0 +1,89 @@
+"""逐请求样本的列式存储、序列化与统计"""
+
+import csv
+import json
+import math
+
+import pytest
+
+import test_llm_connection as tlc
+
+
+def make_log(started_at=100.0):
+    log = tlc.SampleLog(started_at)
+    log.record("200", True, 0.5, 0.1, finished=started_at + 1.0)
+    log.record("500", False, 0.25, finished=started_at + 1.5)
+    log.record("200", True, 1.0, 0.2, stage=3, finished=started_at + 2.0)
+    log.record("timeout", False, 2.0, stage=4, finished=started_at + 3.0)
+    return log
+
+
+def columns(log):
+    return {name: list(getattr(log, name)) for name, _ in tlc.SampleLog.COLUMNS}
+
+
+def test_record_columns():
+    log = make_log()
+    assert len(log) == 4
+    assert log.nbytes == 28 * 4
+    assert log.keys == ["200", "500", "timeout"]
+    assert list(log.status) == [0, 1, 0, 2]
+    assert list(log.finished) == [1.0, 1.5, 2.0, 3.0]
+    assert list(log.stage) == [-1, -1, 3, 4]
+    assert math.isnan(log.ttft[1])
+
+
+def test_dict_round_trip_through_json():
+    log = make_log()
+    restored = tlc.SampleLog.from_dict(json.loads(json.dumps(log.to_dict())))
+    assert restored.started_at == log.started_at
+    assert restored.keys == log.keys
+    original, copied = columns(log), columns(restored)
+    assert math.isnan(copied["ttft"][1]) and math.isnan(copied["ttft"][3])
+    for values in (original, copied):
+        values["ttft"] = [value for value in values["ttft"] if value == value]
+    assert copied == original
+
+
+def test_extend_aligns_time_and_remaps_keys():
+    log = make_log(100.0)
+    other = tlc.SampleLog(102.0)
+    other.record("429", False, 0.1, finished=102.5)
+    other.record("200", True, 0.2, finished=103.0)
+    log.extend(other)
+    assert len(log) == 6
+    assert log.keys == ["200", "500", "timeout", "429"]
+    assert list(log.status[4:]) == [3, 0]
+    assert list(log.finished[4:]) == pytest.approx([2.5, 3.0])
+
+
+def test_in_flight_levels():
+    log = tlc.SampleLog(0.0)
+    # 区间 [0,2) [1,3) [2.5,3.5) [4,5)
+    for start, end in ((0, 2), (1, 3), (2.5, 3.5), (4, 5)):
+        log.record("200", True, end - start, finished=end)
+    assert tlc.in_flight_levels(log) == [1, 2, 2, 1]
+
+
+def test_analyze_samples():
+    analysis = tlc.analyze_samples(make_log())
+    assert analysis["samples"] == 4
+    assert analysis["errors"] == 2
+    assert analysis["status_codes"] == {"200": 2, "500": 1, "timeout": 1}
+    assert [stage["stage"] for stage in analysis["stages"]] == ["chat", "direct", "wrapped"]
+    assert analysis["stages"][0]["count"] == 2 and analysis["stages"][0]["errors"] == 1
+    assert analysis["ttft_ms"]["count"] == 2
+    assert sum(point["rps"] * analysis["bucket_s"] for point in analysis["series"]) == pytest.approx(4)
+    assert tlc.analyze_samples(tlc.SampleLog()) == {"samples": 0}
+
+
+def test_write_samples_csv(tmp_path):
+    path = tmp_path / "samples.csv"
+    tlc.write_samples_csv(make_log(), str(path))
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 4
+    # 开始时刻 0.5/1.25/1.0/1.0 秒，相对最早开始的请求
+    assert [float(row["start_s"]) for row in rows] == [0.0, 0.75, 0.5, 0.5]
+    assert rows[1]["ttft_ms"] == "" and rows[1]["status"] == "500" and rows[1]["ok"] == "0"
+    assert rows[2]["stage"] == "direct" and rows[0]["stage"] == "chat"
@@ -0,0 +1,54 @@
+"""历史比较中的显著性检验"""
+
+import math
+import random
+
+import pytest
+
+import test_llm_connection as tlc
+
+
+def normal_tail(z):
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def test_mann_whitney_empty_or_constant_samples():
+    assert tlc.mann_whitney_p([], [1.0, 2.0]) == 1.0
+    assert tlc.mann_whitney_p([1.0], []) == 1.0
+    assert tlc.mann_whitney_p([0.5] * 10, [0.5] * 10) == 1.0
+
+
+def test_mann_whitney_matches_hand_computation():
+    # U = 9, 均值 4.5, 方差 3*3/12*7 = 5.25, 连续性校正 0.5
+    assert tlc.mann_whitney_p([1, 2, 3], [4, 5, 6]) == pytest.approx(normal_tail(4 / math.sqrt(5.25)))
+
+
+def test_mann_whitney_tie_correction():
+    # 秩: 1 | 2,3,4 -> 3 | 5,6 -> 5.5；U = 3 + 11 - 6 = 8，并列项 (27-3)+(8-2) = 30，方差 0.75*(7-1) = 4.5
+    assert tlc.mann_whitney_p([1, 2, 2], [2, 3, 3]) == pytest.approx(normal_tail(3 / math.sqrt(4.5)))
+
+
+def test_mann_whitney_is_one_sided():
+    rng = random.Random(7)
+    baseline = [rng.gauss(100, 10) for _ in range(200)]
+    slower = [value + 15 for value in baseline]
+    faster = [value - 15 for value in baseline]
+    assert tlc.mann_whitney_p(baseline, slower) < 1e-6
+    assert tlc.mann_whitney_p(baseline, faster) > 0.99
+
+
+def test_mann_whitney_order_independent():
+    rng = random.Random(3)
+    baseline = [rng.random() for _ in range(50)]
+    recent = [rng.random() + 0.1 for _ in range(40)]
+    expected = tlc.mann_whitney_p(baseline, recent)
+    rng.shuffle(baseline)
+    rng.shuffle(recent)
+    assert tlc.mann_whitney_p(baseline, recent) == pytest.approx(expected)
+
+
+def test_two_proportion_p():
+    assert tlc.two_proportion_p(0, 0, 1, 10) == 1.0
+    assert tlc.two_proportion_p(0, 100, 0, 100) == 1.0
+    assert tlc.two_proportion_p(2, 200, 30, 200) < 1e-6
+    assert tlc.two_proportion_p(30, 200, 2, 200) > 0.99